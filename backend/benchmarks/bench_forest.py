@@ -0,0 +1,137 @@
+# backend/benchmarks/bench_forest.py
+"""
+Compares the pickled scikit-learn forests with their compact memory-mapped form on
+load time, memory and prediction latency. Models under models/ are used as-is;
+missing ones are fit on synthetic data as in the offline benchmarks. Each model
+and mode is measured in a fresh subprocess so memory figures are not polluted by
+the other.
+
+Reported per model and mode:
+  - load_ms:          joblib.load() of the pickle, or CompactForest.load() of the arrays
+  - rss_mb / uss_mb:  resident and unique (non-shared) memory added by loading and predicting
+  - single p50/p95:   predict() on one row, as /predict_exercise and /predict_diet do
+  - batch p50:        predict() on --batch-rows rows, as /plan/batch does
+  - mismatched_rows:  verification rows where the two disagree (must be 0)
+
+Usage (from backend/):
+    python -m benchmarks.bench_forest --repeats 200 --output forest_bench.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def _child(mode: str, path: str, repeats: int, batch_rows: int) -> dict:
+    import psutil
+    import pandas as pd
+    from services.compact_forest import CompactForest, forest_dir_for, verification_rows
+
+    process = psutil.Process()
+    before = process.memory_full_info()
+
+    start = time.perf_counter()
+    if mode == "compact":
+        model = CompactForest.load(forest_dir_for(path))
+    else:
+        import joblib
+        model = joblib.load(path)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    compact = CompactForest.load(forest_dir_for(path)) if mode != "compact" else model
+    rows = verification_rows(compact, random_rows=max(batch_rows, 100), seed=1)
+    frame = pd.DataFrame(rows, columns=compact.feature_names) if compact.feature_names else rows
+    single = [frame.iloc[[i % len(frame)]] if hasattr(frame, "iloc") else frame[i % len(frame)][None, :] for i in range(repeats)]
+    batch = frame[:batch_rows]
+    model.predict(single[0])
+
+    single_ms = []
+    for row in single:
+        start = time.perf_counter()
+        model.predict(row)
+        single_ms.append((time.perf_counter() - start) * 1000)
+    batch_ms = []
+    for _ in range(max(repeats // 20, 5)):
+        start = time.perf_counter()
+        model.predict(batch)
+        batch_ms.append((time.perf_counter() - start) * 1000)
+    single_ms.sort()
+    batch_ms.sort()
+
+    after = process.memory_full_info()
+    return {
+        "model": os.path.basename(path),
+        "mode": mode,
+        "load_ms": round(load_ms, 2),
+        "rss_mb": round((after.rss - before.rss) / 2**20, 1),
+        "uss_mb": round((after.uss - before.uss) / 2**20, 1),
+        "single_p50_ms": round(single_ms[len(single_ms) // 2], 3),
+        "single_p95_ms": round(single_ms[int(len(single_ms) * 0.95)], 3),
+        f"batch{batch_rows}_p50_ms": round(batch_ms[len(batch_ms) // 2], 3),
+    }
+
+
+def _run_child(mode: str, path: str, repeats: int, batch_rows: int) -> dict:
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_forest", "--child", mode, "--model", path,
+         "--repeats", str(repeats), "--batch-rows", str(batch_rows)],
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _prepare_models(directory: str) -> list:
+    """Pickles of the three tabular forests in `directory`, each converted next to itself."""
+    os.environ["COMPACT_FORESTS_ENABLED"] = "false"  # install the scikit-learn objects themselves
+    import joblib
+    from benchmarks.offline_stubs import install_tabular_models
+    from services.compact_forest import convert_file
+    from services.model_registry import model_registry
+
+    install_tabular_models()
+    paths = []
+    for name, key in (("exercise", "classifier"), ("exercise", "regressor"), ("diet", "regressor")):
+        path = os.path.join(directory, f"{name}_{key}.pkl")
+        joblib.dump(model_registry.get(name)[key], path)
+        convert_file(path)  # raises if any verification row differs
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pickled vs compact tabular forests.")
+    parser.add_argument("--repeats", type=int, default=200, help="Single-row predictions timed per model and mode.")
+    parser.add_argument("--batch-rows", type=int, default=100, help="Rows per batch prediction.")
+    parser.add_argument("--output", help="Optional path for JSON results.")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--model", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_child(args.child, args.model, args.repeats, args.batch_rows)))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        paths = _prepare_models(directory)
+        import joblib
+        from services.compact_forest import CompactForest, forest_dir_for, verify
+        for path in paths:
+            mismatched_rows = verify(joblib.load(path), CompactForest.load(forest_dir_for(path)))
+            for mode in ("sklearn", "compact"):
+                result = _run_child(mode, path, args.repeats, args.batch_rows)
+                result["mismatched_rows"] = mismatched_rows
+                results.append(result)
+                print(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
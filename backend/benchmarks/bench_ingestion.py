@@ -0,0 +1,152 @@
+# backend/benchmarks/bench_ingestion.py
+"""
+Measures knowledge base ingestion throughput (chunks/s) on a synthetic corpus of
+text files and PDFs built from data/, for the old path (serial parsing, one embed
+call over every chunk, one write) and for the pipeline in services/ingestion.py at
+several worker counts and batch sizes. Each run happens in a fresh process so
+peak RSS can be compared too.
+
+Embeddings are fake by default (so parsing and writing dominate); pass
+--embedding-model BAAI/bge-small-en-v1.5 to use the real model.
+
+Usage (from backend/):
+    python -m benchmarks.bench_ingestion --txt-files 200 --pdf-files 40 --workers 1,4 --batch-sizes 64,256 --backend numpy --output ingestion_bench.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from config.settings import EMBEDDING_ENCODE_BATCH_SIZE, KNOWLEDGE_BASE_DATA_DIR
+
+
+def build_corpus(target_dir: str, txt_files: int, pdf_files: int, pages_per_pdf: int, seed: int) -> None:
+    """Shuffled paragraphs of the real knowledge base, written as .txt files and multi-page PDFs."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    paragraphs: List[str] = []
+    for root, _, files in os.walk(KNOWLEDGE_BASE_DATA_DIR):
+        for file in files:
+            if file.endswith(".txt"):
+                with open(os.path.join(root, file), encoding="utf-8") as f:
+                    paragraphs.extend(p.strip() for p in f.read().split("\n\n") if p.strip())
+    rng = random.Random(seed)
+
+    for i in range(txt_files):
+        with open(os.path.join(target_dir, f"doc_{i:05d}.txt"), "w", encoding="utf-8") as f:
+            f.write("\n\n".join(rng.choice(paragraphs) for _ in range(12)))
+
+    for i in range(pdf_files):
+        pdf = canvas.Canvas(os.path.join(target_dir, f"doc_{i:05d}.pdf"), pagesize=letter)
+        for _ in range(pages_per_pdf):
+            y = 750
+            for paragraph in rng.sample(paragraphs, min(4, len(paragraphs))):
+                for start in range(0, len(paragraph), 95):
+                    pdf.drawString(40, y, paragraph[start:start + 95])
+                    y -= 14
+                    if y < 40:
+                        break
+                if y < 40:
+                    break
+            pdf.showPage()
+        pdf.save()
+
+
+def _embeddings(model_name: Optional[str]) -> Any:
+    if model_name:
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=model_name, encode_kwargs={"batch_size": EMBEDDING_ENCODE_BATCH_SIZE})
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    return DeterministicFakeEmbedding(size=384)
+
+
+def run_config(corpus_dir: str, backend: str, mode: str, workers: int, batch_size: int, model_name: Optional[str]) -> Dict[str, Any]:
+    """One ingestion in this (fresh) process. mode is "legacy" or "pipeline"."""
+    from services.ingestion import IngestionStats, chroma_batch_writer, index_documents, load_chunks, open_chroma_collection
+    from services.numpy_vector_store import NumpyVectorStore
+
+    embeddings = _embeddings(model_name)
+    out_dir = tempfile.mkdtemp(prefix="vitafit-bench-ingest-")
+    stats = IngestionStats()
+    try:
+        documents = load_chunks(corpus_dir, workers if mode == "pipeline" else 1, stats)
+        # The old path embedded every chunk in one call before writing anything.
+        effective_batch = batch_size if mode == "pipeline" else len(documents)
+        if backend == "numpy":
+            NumpyVectorStore.build(documents, embeddings, out_dir, batch_size=effective_batch, stats=stats)
+        else:
+            client, collection = open_chroma_collection(out_dir)
+            index_documents(documents, embeddings, chroma_batch_writer(collection, client.get_max_batch_size()), effective_batch, stats)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    return {
+        "backend": backend,
+        "mode": mode,
+        "workers": workers if mode == "pipeline" else 1,
+        "batch_size": effective_batch,
+        "files": stats.files,
+        "chunks": stats.chunks,
+        "parse_s": round(stats.parse_s, 3),
+        "embed_s": round(stats.embed_s, 3),
+        "write_s": round(stats.write_s, 3),
+        "total_s": round(stats.parse_s + stats.index_s, 3),
+        "chunks_per_s": round(stats.chunks_per_second, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def run_isolated(*args: Any) -> Dict[str, Any]:
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(run_config, *args).result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark knowledge base ingestion throughput.")
+    parser.add_argument("--txt-files", type=int, default=200)
+    parser.add_argument("--pdf-files", type=int, default=40)
+    parser.add_argument("--pages-per-pdf", type=int, default=10)
+    parser.add_argument("--workers", default="1,4", help="Comma-separated parse worker counts for the pipeline.")
+    parser.add_argument("--batch-sizes", default="64,256", help="Comma-separated embed/write batch sizes for the pipeline.")
+    parser.add_argument("--backend", choices=["numpy", "chroma"], default="numpy")
+    parser.add_argument("--embedding-model", help="Real embedding model to use instead of fake embeddings.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Optional path for JSON results.")
+    args = parser.parse_args()
+
+    corpus_dir = tempfile.mkdtemp(prefix="vitafit-bench-corpus-")
+    try:
+        start = time.perf_counter()
+        build_corpus(corpus_dir, args.txt_files, args.pdf_files, args.pages_per_pdf, args.seed)
+        print(f"Corpus: {args.txt_files} text files, {args.pdf_files} PDFs x {args.pages_per_pdf} pages ({time.perf_counter() - start:.1f}s to build)")
+
+        results = [run_isolated(corpus_dir, args.backend, "legacy", 1, 0, args.embedding_model)]
+        for workers in (int(w) for w in args.workers.split(",")):
+            for batch_size in (int(b) for b in args.batch_sizes.split(",")):
+                results.append(run_isolated(corpus_dir, args.backend, "pipeline", workers, batch_size, args.embedding_model))
+    finally:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    for r in results:
+        print(
+            f"{r['mode']:>8} workers={r['workers']:<2} batch={r['batch_size']:<6} {r['chunks']} chunks: "
+            f"{r['chunks_per_s']:>8.1f} chunks/s (parse {r['parse_s']:.2f}s, embed {r['embed_s']:.2f}s, write {r['write_s']:.2f}s), "
+            f"peak RSS {r['peak_rss_mb']:.0f} MB"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
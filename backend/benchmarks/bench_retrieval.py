@@ -0,0 +1,115 @@
+# backend/benchmarks/bench_retrieval.py
+"""
+Compares retrieval latency and recall@k of the dense Chroma retriever against the
+BM25-only and hybrid retrievers over the real knowledge base.
+
+Every chunk yields two queries whose expected answer is that chunk:
+  - keyword: the chunk's two rarest terms (food / exercise names in practice)
+  - natural: the first full sentence of the chunk
+
+Usage (from backend/):
+    python -m benchmarks.bench_retrieval --k 3 --output retrieval_bench.json
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Any, Dict, List, Tuple
+
+from services import rag_service
+from services.retrieval_service import BM25Index, build_retriever, tokenize
+
+
+class _CountingVectorStore:
+    """Proxies the vector store and counts dense searches (each one costs an embedding pass)."""
+    def __init__(self, vectorstore: Any):
+        self._vectorstore = vectorstore
+        self.calls = 0
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs):
+        self.calls += 1
+        return self._vectorstore.similarity_search(query, k=k, **kwargs)
+
+
+def build_queries(chunks, index: BM25Index) -> List[Tuple[str, str, str]]:
+    queries = []
+    for doc in chunks:
+        terms = list(dict.fromkeys(tokenize(doc.page_content)))
+        if len(terms) < 2:
+            continue
+        rare_terms = sorted(terms, key=index.idf, reverse=True)[:2]
+        queries.append(("keyword", " ".join(rare_terms), doc.page_content))
+
+        for line in doc.page_content.splitlines():
+            sentence = line.strip("#-*0123456789. ").replace("**", "")
+            if len(tokenize(sentence)) >= 5:
+                queries.append(("natural", sentence, doc.page_content))
+                break
+    return queries
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_retriever(retriever, queries, k: int) -> Dict[str, Dict[str, float]]:
+    retriever.invoke(queries[0][1])  # warm-up
+
+    per_kind: Dict[str, Dict[str, List[float]]] = {}
+    for kind, query, expected in queries:
+        start = time.perf_counter()
+        docs = retriever.invoke(query)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        stats = per_kind.setdefault(kind, {"latency_ms": [], "hits": []})
+        stats["latency_ms"].append(elapsed_ms)
+        stats["hits"].append(1.0 if expected in [d.page_content for d in docs[:k]] else 0.0)
+
+    return {
+        kind: {
+            "queries": len(stats["hits"]),
+            f"recall@{k}": round(statistics.mean(stats["hits"]), 4),
+            "p50_ms": round(percentile(stats["latency_ms"], 50), 3),
+            "p95_ms": round(percentile(stats["latency_ms"], 95), 3),
+            "mean_ms": round(statistics.mean(stats["latency_ms"]), 3),
+        }
+        for kind, stats in per_kind.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dense vs BM25 vs hybrid retrieval.")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--output", help="Optional path for JSON results.")
+    args = parser.parse_args()
+
+    vectorstore = asyncio.run(rag_service.load_rag_knowledge_base())
+    chunks = rag_service.knowledge_base_chunks
+    queries = build_queries(chunks, BM25Index(chunks))
+    print(f"Benchmarking {len(queries)} queries over {len(chunks)} chunks (k={args.k}).")
+
+    results = {"k": args.k, "chunks": len(chunks), "retrievers": {}}
+    for mode in ("dense", "bm25", "hybrid"):
+        counting_store = _CountingVectorStore(vectorstore)
+        if mode == "dense":
+            retriever = vectorstore.as_retriever(search_kwargs={"k": args.k})
+        else:
+            retriever = build_retriever(counting_store, chunks, mode=mode, k=args.k)
+        results["retrievers"][mode] = run_retriever(retriever, queries, args.k)
+        if mode != "dense":
+            results["retrievers"][mode]["embedding_calls"] = counting_store.calls
+
+    for mode, by_kind in results["retrievers"].items():
+        print(f"\n[{mode}]")
+        for kind, stats in by_kind.items():
+            print(f"  {kind}: {stats}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
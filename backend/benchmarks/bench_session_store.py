@@ -0,0 +1,128 @@
+# backend/benchmarks/bench_session_store.py
+"""
+Measures session lookup latency on the "predictions" collection as it grows, with
+the indexes from ensure_session_indexes() and (up to --unindexed-max) without them.
+Lookups use the same filter and projections as the endpoints.
+
+Needs a real MongoDB (MONGODB_URI); everything is written to a scratch database
+which is dropped at the end unless --keep is given.
+
+Usage (from backend/):
+    python -m benchmarks.bench_session_store --sizes 10000,100000,1000000 --queries 500 --output session_store_bench.json
+"""
+import argparse
+import datetime
+import json
+import random
+import statistics
+import time
+from typing import Any, Dict, List
+
+from pymongo import MongoClient
+
+from config.settings import MONGODB_URI
+from database.mongodb_client import DIET_INPUT_PROJECTION, OVERVIEW_PROJECTION, REPORT_PROJECTION, ensure_session_indexes
+
+PROJECTIONS = {"diet": DIET_INPUT_PROJECTION, "report": REPORT_PROJECTION, "overview": OVERVIEW_PROJECTION}
+
+
+def synthetic_record(i: int, rng: random.Random, now: datetime.datetime) -> Dict[str, Any]:
+    """A record shaped like the ones /predict_exercise and /predict_diet store."""
+    return {
+        "session_id": f"bench-session-{i}",
+        "timestamp": now,
+        "last_updated": now,
+        "raw_user_input": {
+            "session_id": f"bench-session-{i}", "age": rng.randint(18, 70), "gender": rng.choice(["male", "female"]),
+            "height_value": round(rng.uniform(150, 195), 1), "height_unit": "cm",
+            "weight_value": round(rng.uniform(50, 110), 1), "weight_unit": "kg",
+            "calories_intake": rng.randint(1400, 3200),
+        },
+        "processed_features": {"Age": rng.randint(18, 70), "Gender": rng.randint(0, 1), "BMI": round(rng.uniform(18, 35), 2)},
+        "exercise_predictions": {
+            "exercise_type": rng.choice(["bodyweight", "cardio", "strength", "yoga"]),
+            "intensity_level": rng.choice(["low", "medium", "high"]),
+            "activity_level": rng.choice(["sedentary", "light", "moderate"]),
+            "duration_minutes": rng.randint(20, 90),
+            "frequency_per_week": rng.randint(2, 6),
+        },
+        "diet_predictions": {"protein_g": rng.randint(60, 200), "carbs_g": rng.randint(150, 400), "fat_g": rng.randint(40, 120)},
+    }
+
+
+def grow(collection: Any, current: int, target: int, batch_size: int, rng: random.Random) -> None:
+    now = datetime.datetime.utcnow()
+    while current < target:
+        upper = min(target, current + batch_size)
+        collection.insert_many([synthetic_record(i, rng, now) for i in range(current, upper)], ordered=False)
+        current = upper
+
+
+def measure(collection: Any, size: int, queries: int, rng: random.Random) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for name, projection in PROJECTIONS.items():
+        latencies: List[float] = []
+        for _ in range(queries):
+            session_id = f"bench-session-{rng.randrange(size)}"
+            start = time.perf_counter()
+            record = collection.find_one({"session_id": session_id}, projection)
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert record is not None, session_id
+        latencies.sort()
+        results[name] = {
+            "p50_ms": round(statistics.median(latencies), 3),
+            "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 3),
+        }
+    plan = collection.find({"session_id": "bench-session-0"}).explain()
+    results["docs_examined"] = plan.get("executionStats", {}).get("totalDocsExamined")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark session lookups against a growing predictions collection.")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated collection sizes, ascending.")
+    parser.add_argument("--queries", type=int, default=500, help="Lookups per projection and size.")
+    parser.add_argument("--unindexed-max", type=int, default=100000, help="Largest size also measured without indexes.")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--db", default="vitafit_bench_sessions", help="Scratch database (dropped afterwards).")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch database.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Optional path for JSON results.")
+    args = parser.parse_args()
+
+    sizes = sorted(int(s) for s in args.sizes.split(","))
+    rng = random.Random(args.seed)
+    client = MongoClient(MONGODB_URI)
+    client.drop_database(args.db)
+    database = client[args.db]
+    indexed, unindexed = database["predictions"], database["predictions_unindexed"]
+    ensure_session_indexes(indexed)
+
+    results = []
+    current = 0
+    try:
+        for size in sizes:
+            start = time.perf_counter()
+            grow(indexed, current, size, args.batch_size, rng)
+            if size <= args.unindexed_max:
+                grow(unindexed, current, size, args.batch_size, rng)
+            current = size
+            row: Dict[str, Any] = {"sessions": size, "load_s": round(time.perf_counter() - start, 2)}
+            row["indexed"] = measure(indexed, size, args.queries, rng)
+            if size <= args.unindexed_max:
+                row["unindexed"] = measure(unindexed, size, args.queries, rng)
+            results.append(row)
+            print(json.dumps(row))
+    finally:
+        if not args.keep:
+            client.drop_database(args.db)
+        client.close()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# backend/benchmarks/bench_threads.py
+"""
+Mixed-workload throughput with and without thread budgets (utils/thread_budget.py).
+
+The offline app (see benchmarks/e2e.py) is driven in-process by concurrent clients
+that keep /ai/chat (LLM and embeddings) and /classify_dish (YOLO) busy for --seconds,
+while /predict_exercise (forests) arrives at a steady --tabular-rps. Tabular requests
+are paced because back-to-back ones keep the event loop, and with it the GIL, busy
+enough to starve the other two; that would measure the GIL rather than native
+threads. Each mode runs in a fresh subprocess, since torch thread pools cannot be
+resized once started:
+  - unbudgeted: THREAD_BUDGETS_ENABLED=false, every library sizes its pools to all cores
+  - budgeted:   THREAD_BUDGETS_ENABLED=true with the THREAD_BUDGETS/THREAD_AFFINITY in the environment
+
+Reported per mode: requests per second and p50/p95 latency per scenario, and the
+total throughput of the LLM and vision scenarios. The difference grows with the core count; on one or two cores
+there are few threads to oversubscribe.
+
+Usage (from backend/):
+    python -m benchmarks.bench_threads --seconds 30 --clients 2 --tabular-rps 20 --output threads_bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+MIXED_SCENARIOS = ["ai_chat", "classify_dish", "predict_exercise"]
+PACED_SCENARIOS = {"predict_exercise"}
+MODES = {"unbudgeted": "false", "budgeted": "true"}
+
+
+async def _child(scenarios: list, seconds: float, clients: int, tabular_rps: float, seed: int) -> dict:
+    import httpx
+    import main
+    from benchmarks.e2e import ScenarioContext, percentile, seed_sessions, send, setup_offline_app
+    from benchmarks.offline_stubs import build_fixture_images
+
+    stand_ins = await setup_offline_app(seed=seed)
+    scenarios = [s for s in scenarios if s != "classify_dish" or stand_ins["vision"]]
+    latencies = {scenario: [] for scenario in scenarios}
+    errors = {scenario: 0 for scenario in scenarios}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=600) as client:
+        ctx = ScenarioContext(await seed_sessions(client, 8, seed), build_fixture_images(seed=seed), seed)
+        for scenario in scenarios:
+            await send(client, scenario, ctx)  # warm-up
+
+        deadline = time.perf_counter() + seconds
+
+        async def worker(scenario: str):
+            interval = clients / tabular_rps if scenario in PACED_SCENARIOS and tabular_rps > 0 else 0.0
+            next_start = time.perf_counter()
+            while time.perf_counter() < deadline:
+                if interval:
+                    next_start += interval
+                    await asyncio.sleep(max(0.0, next_start - time.perf_counter()))
+                start = time.perf_counter()
+                try:
+                    ok = (await send(client, scenario, ctx)).status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies[scenario].append((time.perf_counter() - start) * 1000)
+                else:
+                    errors[scenario] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(scenario) for scenario in scenarios for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    result = {"elapsed_s": round(elapsed, 2), "scenarios": {}}
+    for scenario in scenarios:
+        values = latencies[scenario]
+        result["scenarios"][scenario] = {
+            "ok": len(values),
+            "errors": errors[scenario],
+            "throughput_rps": round(len(values) / elapsed, 3),
+            "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2),
+        }
+    result["total_rps"] = round(sum(level["throughput_rps"] for scenario, level in result["scenarios"].items() if scenario not in PACED_SCENARIOS), 3)
+    return result
+
+
+def _run_child(mode: str, scenarios: list, seconds: float, clients: int, tabular_rps: float, seed: int) -> dict:
+    env = dict(os.environ, THREAD_BUDGETS_ENABLED=MODES[mode])
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_threads", "--child", "--scenarios", ",".join(scenarios), "--seconds", str(seconds),
+         "--clients", str(clients), "--tabular-rps", str(tabular_rps), "--seed", str(seed)],
+        capture_output=True, text=True, check=True, env=env
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["mode"] = mode
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark mixed-workload throughput with and without thread budgets.")
+    parser.add_argument("--scenarios", type=lambda s: s.split(","), default=MIXED_SCENARIOS)
+    parser.add_argument("--seconds", type=float, default=30, help="Measured duration per mode.")
+    parser.add_argument("--clients", type=int, default=2, help="Concurrent clients per scenario.")
+    parser.add_argument("--tabular-rps", type=float, default=20, help="Arrival rate of /predict_exercise requests.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Optional path for JSON results.")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(_child(args.scenarios, args.seconds, args.clients, args.tabular_rps, args.seed))))
+        return
+
+    results = {"cpus": len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()}
+    for mode in MODES:
+        result = _run_child(mode, args.scenarios, args.seconds, args.clients, args.tabular_rps, args.seed)
+        results[mode] = result
+        print(f"{mode:>10}: total rps={result['total_rps']}")
+        for scenario, level in result["scenarios"].items():
+            print(f"{'':>12}{scenario:>16} rps={level['throughput_rps']:<9} p50={level['p50_ms']}ms p95={level['p95_ms']}ms errors={level['errors']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# backend/benchmarks/bench_vector_backend.py
+"""
+Compares the Chroma and memory-mapped NumPy vector backends on startup time, memory
+and query latency. Each backend is measured in a fresh subprocess so import and RSS
+figures are not polluted by the other.
+
+Reported per backend:
+  - startup_s:      load_rag_knowledge_base() wall time (chunking + embedder + store)
+  - store_open_ms:  re-opening the persisted store alone
+  - rss_mb / uss_mb: resident and unique (non-shared) memory after startup
+  - query p50/p95:  similarity_search_by_vector on precomputed query vectors
+
+Usage (from backend/):
+    python -m benchmarks.bench_vector_backend --repeats 20 --output vector_backend_bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+def _child(backend: str, repeats: int) -> dict:
+    import psutil
+
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+
+    start = time.perf_counter()
+    from services import rag_service
+    vectorstore = asyncio.run(rag_service.load_rag_knowledge_base())
+    startup_s = time.perf_counter() - start
+
+    memory = process.memory_full_info()
+
+    start = time.perf_counter()
+    if backend == "numpy":
+        from services.numpy_vector_store import NumpyVectorStore
+        from config.settings import NUMPY_VECTOR_INDEX_PATH
+        NumpyVectorStore(vectorstore.embeddings, NUMPY_VECTOR_INDEX_PATH)
+    else:
+        from langchain_chroma import Chroma
+        from config.settings import VECTOR_DB_PERSIST_PATH
+        Chroma(persist_directory=VECTOR_DB_PERSIST_PATH, embedding_function=vectorstore.embeddings)
+    store_open_ms = (time.perf_counter() - start) * 1000
+
+    queries = [doc.page_content.splitlines()[0] for doc in rag_service.knowledge_base_chunks]
+    vectors = [vectorstore.embeddings.embed_query(query) for query in queries]
+    vectorstore.similarity_search_by_vector(vectors[0], k=3)
+
+    latencies = []
+    for _ in range(repeats):
+        for vector in vectors:
+            start = time.perf_counter()
+            vectorstore.similarity_search_by_vector(vector, k=3)
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    return {
+        "backend": backend,
+        "startup_s": round(startup_s, 3),
+        "store_open_ms": round(store_open_ms, 3),
+        "rss_mb": round((memory.rss - rss_before) / 2**20, 1),
+        "uss_mb": round(memory.uss / 2**20, 1),
+        "queries": len(latencies),
+        "query_p50_ms": round(latencies[len(latencies) // 2], 4),
+        "query_p95_ms": round(latencies[int(len(latencies) * 0.95)], 4),
+        "query_mean_ms": round(statistics.mean(latencies), 4),
+    }
+
+
+def _run_child(backend: str, repeats: int) -> dict:
+    env = dict(os.environ, VECTOR_BACKEND=backend)
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_vector_backend", "--child", backend, "--repeats", str(repeats)],
+        env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Chroma vs NumPy vector backends.")
+    parser.add_argument("--repeats", type=int, default=20, help="Passes over the query set per backend.")
+    parser.add_argument("--cold", action="store_true", help="Report the first run (includes index builds) instead of a warm run.")
+    parser.add_argument("--output", help="Optional path for JSON results.")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(_child(args.child, args.repeats)))
+        return
+
+    results = []
+    for backend in ("chroma", "numpy"):
+        result = _run_child(backend, args.repeats)
+        if not args.cold:
+            result = _run_child(backend, args.repeats)
+        results.append(result)
+        print(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# backend/benchmarks/check_write_behind.py
+"""
+Crash recovery and cross-worker reads of the write-behind journal (database/write_behind.py),
+against the in-memory collection of the offline benchmarks.
+
+  1. --crashed-workers processes each buffer --sessions sessions (a whole record, then a
+     partial update) with MongoDB failing, and die without flushing.
+  2. --adopters buffers start at the same moment in one journal directory and recover.
+     Every journalled update must be replayed by exactly one of them, and every
+     session must end up stored with its latest values.
+  3. One buffer holds a new session unflushed; a second buffer's collection must still
+     find it (through the first one's journal) instead of returning None.
+  4. Like 3, but the second buffer then updates the session (a diet plan, then an AI
+     overview). Whichever buffer flushes first, the stored record must keep both the
+     first worker's record and the second worker's updates.
+
+Exits with status 1 if any check fails.
+
+Usage (from backend/):
+    python -m benchmarks.check_write_behind --sessions 200 --crashed-workers 3 --adopters 4
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import threading
+from typing import Any, Dict, List
+
+
+class _FailingCollection:
+    def bulk_write(self, requests: List[Any], ordered: bool = True) -> Any:
+        raise ConnectionError("MongoDB is down")
+
+
+class _RecordingCollection:
+    """Forwards to a shared InMemoryCollection and records which sessions this adopter wrote."""
+    def __init__(self, collection: Any):
+        self._collection = collection
+        self.written: List[str] = []
+
+    def bulk_write(self, requests: List[Any], ordered: bool = True) -> Any:
+        # A whole record can take two requests (update if not newer, insert if missing).
+        self.written.extend(dict.fromkeys(request._filter["session_id"] for request in requests))
+        return self._collection.bulk_write(requests, ordered=ordered)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._collection, name)
+
+
+def _buffer(collection: Any, journal_dir: str) -> Any:
+    from database.write_behind import WriteBehindBuffer
+    return WriteBehindBuffer(collection, journal_dir, batch_size=10**6, interval_seconds=3600, max_pending=10**6, fsync=False)
+
+
+def _crash(journal_dir: str, worker: int, sessions: int) -> None:
+    buffer = _buffer(_FailingCollection(), journal_dir)
+    for i in range(sessions):
+        session_id = f"w{worker}-s{i}"
+        buffer.write(session_id, {"session_id": session_id, "step": 1, "plan": {"calories": 1}}, upsert=True, complete=True)
+        buffer.write(session_id, {"step": 2, "plan.calories": 2})
+    buffer.flush()  # fails; the segment stays sealed in the journal
+    os._exit(1)
+
+
+def check_recovery(journal_dir: str, sessions: int, crashed_workers: int, adopters: int) -> List[str]:
+    import subprocess
+    from benchmarks.offline_stubs import InMemoryCollection
+
+    for worker in range(crashed_workers):
+        completed = subprocess.run([sys.executable, "-m", "benchmarks.check_write_behind", "--child-crash", journal_dir, "--worker", str(worker), "--sessions", str(sessions)])
+        assert completed.returncode == 1, "the crashing worker should exit with status 1"
+
+    stored = InMemoryCollection()
+    collections = [_RecordingCollection(stored) for _ in range(adopters)]
+    buffers: List[Any] = [None] * adopters
+    start = threading.Barrier(adopters)
+
+    def adopt(index: int) -> None:
+        start.wait()
+        buffers[index] = _buffer(collections[index], journal_dir)
+
+    threads = [threading.Thread(target=adopt, args=(i,)) for i in range(adopters)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for buffer in buffers:
+        buffer.close()
+
+    failures = []
+    written = [session_id for collection in collections for session_id in collection.written]
+    expected = {f"w{worker}-s{i}" for worker in range(crashed_workers) for i in range(sessions)}
+    if len(written) != len(set(written)):
+        failures.append(f"{len(written) - len(set(written))} sessions were replayed by more than one adopter")
+    if set(written) != expected:
+        failures.append(f"{len(expected - set(written))} journalled sessions were not replayed")
+    stale = [s for s in expected if (stored.find_one({"session_id": s}) or {}).get("plan") != {"calories": 2}]
+    if stale:
+        failures.append(f"{len(stale)} sessions are not stored with their latest update")
+    leftover = os.listdir(journal_dir)
+    if leftover:
+        failures.append(f"journal files left after a clean shutdown: {sorted(leftover)[:5]}")
+    print(f"recovery: {len(set(written))}/{len(expected)} sessions replayed once, by {sum(1 for c in collections if c.written)} of {adopters} adopters")
+    return failures
+
+
+def check_cross_worker_read(journal_dir: str) -> List[str]:
+    from benchmarks.offline_stubs import InMemoryCollection
+    from database.write_behind import BufferedCollection
+
+    stored = InMemoryCollection()
+    fields = ("session_id", "step")
+    writer, reader = _buffer(stored, journal_dir), _buffer(stored, journal_dir)
+    try:
+        BufferedCollection(stored, writer, fields).update_one({"session_id": "new"}, {"$set": {"session_id": "new", "step": 1}}, upsert=True)
+        found = BufferedCollection(stored, reader, fields).find_one({"session_id": "new"}, {"_id": 0, "step": 1})
+        missing = BufferedCollection(stored, reader, fields).find_one({"session_id": "nobody"})
+    finally:
+        writer.close()
+        reader.close()
+    print(f"cross-worker read: {found}")
+    failures = []
+    if found != {"step": 1}:
+        failures.append(f"a session buffered by another worker was read as {found!r}")
+    if missing is not None:
+        failures.append("a session nobody wrote was found")
+    return failures
+
+
+def check_cross_worker_update(journal_dir: str, first_flush: str) -> List[str]:
+    from benchmarks.offline_stubs import InMemoryCollection
+    from database.write_behind import BufferedCollection
+
+    stored = InMemoryCollection()
+    fields = ("session_id", "last_updated", "exercise_predictions", "diet_predictions", "model_versions")
+    created = datetime.datetime(2026, 1, 1, 12, 0, 0, 123456)
+    writer, updater = _buffer(stored, journal_dir), _buffer(stored, journal_dir)
+    try:
+        # /predict_exercise on the writer's worker, then /predict_diet and /ai/overview on the updater's.
+        BufferedCollection(stored, writer, fields).update_one({"session_id": "new"}, {"$set": {
+            "session_id": "new", "last_updated": created, "exercise_predictions": {"exercise_type": "cardio"},
+            "diet_predictions": {}, "model_versions": {"exercise": "e1"}
+        }}, upsert=True)
+        collection = BufferedCollection(stored, updater, fields)
+        if collection.find_one({"session_id": "new"}, {"_id": 0, "exercise_predictions": 1}) is None:
+            return [f"flushing {first_flush} first: the updater could not read the session"]
+        collection.update_one({"session_id": "new"}, {"$set": {
+            "diet_predictions": {"calories": 2000}, "model_versions.diet": "d1", "last_updated": created + datetime.timedelta(seconds=5)
+        }})
+        collection.update_one({"session_id": "new"}, {"$set": {"ai_overview": {"response": "ok"}}})
+        buffers = [writer, updater] if first_flush == "writer" else [updater, writer]
+        for buffer in buffers:
+            buffer.flush()
+    finally:
+        writer.close()
+        updater.close()
+
+    record = stored.find_one({"session_id": "new"}, {"_id": 0}) or {}
+    print(f"cross-worker update, {first_flush} flushed first: {record}")
+    expected = {
+        "exercise_predictions": {"exercise_type": "cardio"}, "diet_predictions": {"calories": 2000},
+        "model_versions": {"exercise": "e1", "diet": "d1"}, "ai_overview": {"response": "ok"}
+    }
+    lost = [field for field, value in expected.items() if record.get(field) != value]
+    return [f"flushing {first_flush} first lost {', '.join(lost)}"] if lost else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check write-behind crash recovery and cross-worker reads.")
+    parser.add_argument("--sessions", type=int, default=200, help="Sessions journalled per crashed worker.")
+    parser.add_argument("--crashed-workers", type=int, default=3)
+    parser.add_argument("--adopters", type=int, default=4, help="Buffers recovering the journal at the same time.")
+    parser.add_argument("--child-crash", help=argparse.SUPPRESS)
+    parser.add_argument("--worker", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_crash:
+        _crash(args.child_crash, args.worker, args.sessions)
+
+    failures = []
+    with tempfile.TemporaryDirectory() as journal_dir:
+        failures += check_recovery(journal_dir, args.sessions, args.crashed_workers, args.adopters)
+    with tempfile.TemporaryDirectory() as journal_dir:
+        failures += check_cross_worker_read(journal_dir)
+    for first_flush in ("writer", "updater"):
+        with tempfile.TemporaryDirectory() as journal_dir:
+            failures += check_cross_worker_update(journal_dir, first_flush)
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    if failures:
+        sys.exit(1)
+    print("All write-behind checks passed.")
+
+
+if __name__ == "__main__":
+    main()
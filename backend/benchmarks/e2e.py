@@ -0,0 +1,314 @@
+# backend/benchmarks/e2e.py
+"""
+End-to-end benchmark of the FastAPI app from main.py with offline stand-ins
+(see benchmarks/offline_stubs.py): in-memory Mongo, a tiny random causal LM,
+random-init YOLO with fixture images, fake embeddings.
+
+Run in-process (ASGI transport, no sockets):
+    python -m benchmarks.e2e run --concurrency 1,4,16 --output bench_e2e.json
+
+Run over local HTTP against the offline app:
+    python -m benchmarks.e2e serve --port 8001
+    python -m benchmarks.e2e run --url http://127.0.0.1:8001
+
+Regression check against a stored baseline (exit code 1 on regression):
+    python -m benchmarks.e2e run --save-baseline benchmarks/baseline.json
+    python -m benchmarks.e2e run --baseline benchmarks/baseline.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import platform
+import random
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+SCENARIOS = ["predict_exercise", "predict_diet", "plan", "two_step_plan", "generate_report", "classify_dish", "ai_overview", "ai_overview_double", "ai_chat", "diet_under_llm_load"]
+LLM_SCENARIOS = {"ai_overview", "ai_overview_double", "ai_chat"}
+# Scenarios measured while the same number of clients keep /ai/overview busy in the background.
+MIXED_SCENARIOS = {"diet_under_llm_load": "predict_diet"}
+
+CHAT_QUESTIONS = [
+    "How many days a week should I do strength training?",
+    "What should I eat after a workout?",
+    "How much protein do I need to build muscle?",
+    "Is yoga good for recovery?",
+    "What is the capital of France?",
+]
+
+
+def user_payload(session_id: str, rng: random.Random) -> Dict[str, Any]:
+    return {
+        "session_id": session_id,
+        "age": rng.randint(18, 70),
+        "gender": rng.choice(["male", "female"]),
+        "height_value": round(rng.uniform(150, 195), 1),
+        "height_unit": "cm",
+        "weight_value": round(rng.uniform(50, 110), 1),
+        "weight_unit": "kg",
+        "calories_intake": rng.randint(1400, 3200),
+    }
+
+
+async def setup_offline_app(seed: int = 0, session_rate_limits: bool = False, precompute_overviews: bool = False) -> Dict[str, Any]:
+    """Wires the offline stand-ins into main's globals and returns what was installed."""
+    import main
+    from benchmarks import offline_stubs
+    from services import overview_service
+    from utils.scheduler import FairScheduler
+    from utils.thread_budget import apply_process_thread_budgets
+
+    # Off by default so LLM scenarios time generation rather than stored overviews of the seeded sessions.
+    overview_service.OVERVIEW_PRECOMPUTE_ENABLED = precompute_overviews
+
+    if not session_rate_limits and isinstance(main.scheduler, FairScheduler):
+        # The benchmark replays a few seeded sessions far faster than real users would.
+        for policy in main.scheduler.policies.values():
+            policy.rate = 0
+
+    # startup_all does this, and it is not run here.
+    apply_process_thread_budgets()
+    offline_stubs.install_in_memory_mongo()
+    offline_stubs.install_report_cache()
+    sources = offline_stubs.install_tabular_models(seed=seed)
+
+    try:
+        main.image_classifier_model = offline_stubs.build_offline_image_classifier()
+    except ImportError as e:
+        print(f"Vision stand-in unavailable ({e}); classify_dish will be skipped.")
+        main.image_classifier_model = None
+
+    main.rag_assistant_instance = await offline_stubs.build_offline_rag_assistant(seed=seed)
+
+    # State is installed directly; the real startup would connect to Mongo and download models.
+    main.app.router.on_startup.clear()
+    main.app.router.on_shutdown.clear()
+    return {"tabular_models": sources, "vision": main.image_classifier_model is not None}
+
+
+class ScenarioContext:
+    def __init__(self, session_ids: List[str], images: List[bytes], seed: int):
+        self.session_ids = session_ids
+        self.images = images
+        self.rng = random.Random(seed)
+        self._counter = itertools.count()
+
+    def pick_session(self) -> str:
+        return self.session_ids[next(self._counter) % len(self.session_ids)]
+
+
+async def send(client: httpx.AsyncClient, scenario: str, ctx: ScenarioContext) -> httpx.Response:
+    if scenario == "predict_exercise":
+        return await client.post("/predict_exercise", json=user_payload(f"bench-{uuid.uuid4()}", ctx.rng))
+    if scenario == "predict_diet":
+        return await client.post("/predict_diet", json={"session_id": ctx.pick_session()})
+    if scenario == "plan":
+        return await client.post("/plan", json=user_payload(f"bench-{uuid.uuid4()}", ctx.rng))
+    if scenario == "two_step_plan":
+        # What the frontend does without /plan; timed as one request.
+        session_id = f"bench-{uuid.uuid4()}"
+        response = await client.post("/predict_exercise", json=user_payload(session_id, ctx.rng))
+        if response.status_code != 200:
+            return response
+        return await client.post("/predict_diet", json={"session_id": session_id})
+    if scenario == "generate_report":
+        return await client.post("/generate_report", json={
+            "session_id": ctx.pick_session(),
+            "user_details": {"first_name": "Bench", "last_name": "User", "email": "bench@example.com"}
+        })
+    if scenario == "classify_dish":
+        image = ctx.images[next(ctx._counter) % len(ctx.images)]
+        return await client.post("/classify_dish", files={"file": ("dish.jpg", image, "image/jpeg")})
+    if scenario == "ai_overview":
+        return await client.post("/ai/overview", json={"session_id": ctx.pick_session(), "message": "Please provide an initial health overview based on my fitness data."})
+    if scenario == "ai_overview_double":
+        # What the frontend does on mount: the same overview requested twice at once; timed as one request.
+        payload = {"session_id": ctx.pick_session(), "message": "Please provide an initial health overview based on my fitness data."}
+        first, second = await asyncio.gather(client.post("/ai/overview", json=payload), client.post("/ai/overview", json=payload))
+        return first if first.status_code != 200 else second
+    if scenario == "ai_chat":
+        return await client.post("/ai/chat", json={"session_id": ctx.pick_session(), "message": ctx.rng.choice(CHAT_QUESTIONS)})
+    raise ValueError(f"Unknown scenario '{scenario}'.")
+
+
+async def seed_sessions(client: httpx.AsyncClient, count: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    session_ids = []
+    for i in range(count):
+        session_id = f"bench-seed-{i}"
+        response = await client.post("/predict_exercise", json=user_payload(session_id, rng))
+        response.raise_for_status()
+        (await client.post("/predict_diet", json={"session_id": session_id})).raise_for_status()
+        session_ids.append(session_id)
+    return session_ids
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] if ordered else 0.0
+
+
+async def run_level(client: httpx.AsyncClient, scenario: str, ctx: ScenarioContext, concurrency: int, total: int) -> Dict[str, Any]:
+    if scenario in MIXED_SCENARIOS:
+        return await run_mixed_level(client, MIXED_SCENARIOS[scenario], ctx, concurrency, total)
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    remaining = itertools.count()
+
+    async def worker():
+        while next(remaining) < total:
+            start = time.perf_counter()
+            try:
+                response = await send(client, scenario, ctx)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 599
+            statuses[status] = statuses.get(status, 0) + 1
+            if status < 400:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": len(latencies),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+    }
+
+
+async def run_mixed_level(client: httpx.AsyncClient, scenario: str, ctx: ScenarioContext, concurrency: int, total: int) -> Dict[str, Any]:
+    """Measures `scenario` while LLM requests compete for the same process."""
+    stop = asyncio.Event()
+    background_statuses: Dict[int, int] = {}
+
+    async def llm_client():
+        while not stop.is_set():
+            try:
+                status = (await send(client, "ai_overview", ctx)).status_code
+            except httpx.HTTPError:
+                status = 599
+            background_statuses[status] = background_statuses.get(status, 0) + 1
+
+    background = [asyncio.create_task(llm_client()) for _ in range(concurrency)]
+    try:
+        level = await run_level(client, scenario, ctx, concurrency, total)
+    finally:
+        stop.set()
+        await asyncio.gather(*background)
+    level["background_llm_statuses"] = {str(k): v for k, v in sorted(background_statuses.items())}
+    return level
+
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    from benchmarks.offline_stubs import build_fixture_images
+
+    meta: Dict[str, Any] = {"python": platform.python_version(), "platform": platform.platform(), "seed": args.seed}
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+        meta["target"] = args.url
+    else:
+        import main
+        meta["target"] = "in-process"
+        meta["stand_ins"] = await setup_offline_app(seed=args.seed, session_rate_limits=args.session_rate_limits, precompute_overviews=args.precompute_overviews)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=args.timeout)
+
+    results: Dict[str, Any] = {}
+    async with client:
+        ctx = ScenarioContext(await seed_sessions(client, args.sessions, args.seed), build_fixture_images(seed=args.seed), args.seed)
+        for scenario in args.scenarios:
+            if scenario == "classify_dish" and not args.url and not meta["stand_ins"]["vision"]:
+                continue
+            total = args.llm_requests if scenario in LLM_SCENARIOS else args.requests
+            await run_level(client, scenario, ctx, 1, min(2, total))  # warm-up
+            results[scenario] = {}
+            for concurrency in args.concurrency:
+                level = await run_level(client, scenario, ctx, concurrency, max(total, concurrency))
+                results[scenario][str(concurrency)] = level
+                print(f"{scenario:>16} c={concurrency:<3} rps={level['throughput_rps']:<9} p50={level['p50_ms']}ms p95={level['p95_ms']}ms p99={level['p99_ms']}ms statuses={level['statuses']}")
+
+    return {"meta": meta, "results": results}
+
+
+def compare_to_baseline(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Flags any scenario/concurrency whose p95 rose or throughput fell by more than `tolerance`."""
+    regressions = []
+    for scenario, levels in current["results"].items():
+        for concurrency, level in levels.items():
+            base = baseline.get("results", {}).get(scenario, {}).get(concurrency)
+            if not base:
+                continue
+            if base["p95_ms"] > 0 and level["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{scenario} c={concurrency}: p95 {base['p95_ms']}ms -> {level['p95_ms']}ms")
+            if base["throughput_rps"] > 0 and level["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+                regressions.append(f"{scenario} c={concurrency}: throughput {base['throughput_rps']} -> {level['throughput_rps']} rps")
+    return regressions
+
+
+def serve(port: int, seed: int) -> None:
+    import uvicorn
+    import main
+
+    asyncio.run(setup_offline_app(seed=seed))
+    uvicorn.run(main.app, host="127.0.0.1", port=port)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark for the VitaFit backend.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Run the benchmark.")
+    run_parser.add_argument("--url", help="Benchmark a running server over HTTP instead of in-process.")
+    run_parser.add_argument("--scenarios", type=lambda s: s.split(","), default=SCENARIOS)
+    run_parser.add_argument("--concurrency", type=lambda s: [int(c) for c in s.split(",")], default=[1, 4, 16])
+    run_parser.add_argument("--requests", type=int, default=64, help="Requests per level for non-LLM scenarios.")
+    run_parser.add_argument("--llm-requests", type=int, default=16, help="Requests per level for LLM scenarios.")
+    run_parser.add_argument("--sessions", type=int, default=32, help="Sessions seeded before measuring.")
+    run_parser.add_argument("--timeout", type=float, default=600.0)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--session-rate-limits", action="store_true", help="Keep the per-session rate limits (in-process only).")
+    run_parser.add_argument("--precompute-overviews", action="store_true", help="Generate overviews in the background after plans are stored (in-process only).")
+    run_parser.add_argument("--output", help="Write machine-readable results to this path.")
+    run_parser.add_argument("--baseline", help="Compare against this stored result file.")
+    run_parser.add_argument("--save-baseline", help="Also store these results as a baseline at this path.")
+    run_parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (0.2 = 20%%).")
+
+    serve_parser = sub.add_parser("serve", help="Serve the offline app over HTTP.")
+    serve_parser.add_argument("--port", type=int, default=8001)
+    serve_parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args.port, args.seed)
+        return
+
+    report = asyncio.run(run_benchmark(args))
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+        if regressions:
+            print("Performance regressions against baseline:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main_cli()
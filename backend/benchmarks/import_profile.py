@@ -0,0 +1,99 @@
+# backend/benchmarks/import_profile.py
+"""
+Measures what `import main` plus subsystem startup imports cost under each
+DEPLOYMENT_PROFILE, using `python -X importtime` in a fresh interpreter per profile.
+
+For every profile it imports main and then the service modules that startup_all()
+would import for the enabled subsystems (no models are loaded), and reports:
+  - import_s:  total cumulative import time of top-level modules (from -X importtime)
+  - wall_s:    wall time of the child interpreter
+  - rss_mb:    peak RSS of the child
+  - heaviest:  the most expensive top-level imports
+
+Usage (from backend/):
+    python -m benchmarks.import_profile --profiles all,tabular,tabular+reports,rag --output import_profile.json
+Profiles are separated by commas; '+' joins subsystems within one profile.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+# Modules startup_all() and the endpoints import for each subsystem.
+SUBSYSTEM_MODULES = {
+    "tabular": ["services.exercise_service", "services.diet_service"],
+    "vision": ["models.Image_Classifier_Model.image_classifier_logic", "ultralytics"],
+    "rag": ["services.rag_service"],
+    "reports": ["services.report_service"],
+}
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+CHILD = """
+import importlib, resource, sys
+import main
+from config.settings import ENABLED_SUBSYSTEMS
+for name in sorted(ENABLED_SUBSYSTEMS):
+    for module in {modules!r}.get(name, []):
+        importlib.import_module(module)
+print("RSS_KB", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, file=sys.stderr)
+"""
+
+
+def parse_importtime(stderr: str) -> Tuple[float, List[Tuple[str, float]]]:
+    """Returns total seconds over top-level imports and the top-level modules by cumulative time."""
+    top_level: List[Tuple[str, float]] = []
+    for line in stderr.splitlines():
+        match = _LINE.match(line)
+        if match and len(match.group(3)) == 1:  # one space of indent = imported directly by the script
+            top_level.append((match.group(4), int(match.group(2)) / 1e6))
+    return sum(seconds for _, seconds in top_level), sorted(top_level, key=lambda item: item[1], reverse=True)
+
+
+def profile_imports(profile: str, top: int) -> Dict[str, Any]:
+    env = dict(os.environ, DEPLOYMENT_PROFILE=profile.replace("+", ","))
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD.format(modules=SUBSYSTEM_MODULES)],
+        env=env, capture_output=True, text=True
+    )
+    wall_s = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"Profile '{profile}' failed to import:\n{result.stderr[-2000:]}")
+
+    import_s, heaviest = parse_importtime(result.stderr)
+    rss_kb = next((int(line.split()[1]) for line in result.stderr.splitlines() if line.startswith("RSS_KB")), 0)
+    return {
+        "profile": profile,
+        "import_s": round(import_s, 3),
+        "wall_s": round(wall_s, 3),
+        "rss_mb": round(rss_kb / 1024, 1),
+        "heaviest": [{"module": name, "cumulative_s": round(seconds, 3)} for name, seconds in heaviest[:top]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import cost of the backend per DEPLOYMENT_PROFILE.")
+    parser.add_argument("--profiles", default="all,tabular,reports,tabular+reports,vision,rag")
+    parser.add_argument("--top", type=int, default=8, help="Heaviest top-level imports to list per profile.")
+    parser.add_argument("--output", help="Optional path for JSON results.")
+    args = parser.parse_args()
+
+    results = [profile_imports(profile, args.top) for profile in args.profiles.split(",")]
+    baseline = next((r for r in results if r["profile"] == "all"), None)
+    for r in results:
+        saved = f"  saves {baseline['import_s'] - r['import_s']:.2f}s / {baseline['rss_mb'] - r['rss_mb']:.0f} MB vs all" if baseline and r is not baseline else ""
+        print(f"{r['profile']:>18}: imports {r['import_s']:.2f}s, wall {r['wall_s']:.2f}s, peak RSS {r['rss_mb']:.0f} MB{saved}")
+        print("                    heaviest: " + ", ".join(f"{h['module']} {h['cumulative_s']:.2f}s" for h in r["heaviest"][:4]))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
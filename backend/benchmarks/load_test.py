@@ -0,0 +1,151 @@
+# backend/benchmarks/load_test.py
+"""
+HTTP load generator for a running backend, with an optional sweep over uvicorn
+worker counts to show how throughput scales.
+
+Against an already running server:
+    python -m benchmarks.load_test --url http://localhost:8000 --endpoint predict_exercise --concurrency 32
+
+Worker sweep (starts `uvicorn main:app --workers N` for each N; with
+SERVING_MODE=inference-client start `python -m services.inference_service` first):
+    SERVING_MODE=inference-client python -m benchmarks.load_test --sweep-workers 1,2,4,8 --endpoint classify_dish --image dish.jpg
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+
+def exercise_payload() -> Dict[str, Any]:
+    return {
+        "session_id": f"load-{uuid.uuid4()}",
+        "age": 30, "gender": "male",
+        "height_value": 180, "height_unit": "cm",
+        "weight_value": 80, "weight_unit": "kg",
+        "calories_intake": 2400,
+    }
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] if ordered else 0.0
+
+
+async def _send(client: httpx.AsyncClient, endpoint: str, image_bytes: Optional[bytes]) -> httpx.Response:
+    if endpoint == "predict_exercise":
+        return await client.post("/predict_exercise", json=exercise_payload())
+    if endpoint == "classify_dish":
+        return await client.post("/classify_dish", files={"file": ("dish.jpg", image_bytes or b"", "image/jpeg")})
+    if endpoint == "ai_chat":
+        return await client.post("/ai/chat", json={"session_id": f"load-{uuid.uuid4()}", "message": "What should I eat after a workout?"})
+    raise ValueError(f"Unsupported endpoint '{endpoint}'.")
+
+
+async def run_load(url: str, endpoint: str, concurrency: int, duration: float, image_bytes: Optional[bytes] = None) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await _send(client, endpoint, image_bytes)
+                if response.status_code >= 400:
+                    errors += 1
+                    continue
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=300, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+
+def _wait_until_ready(url: str, timeout: float) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url + "/", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(1)
+    raise RuntimeError(f"Server at {url} did not become ready within {timeout}s.")
+
+
+def sweep_workers(worker_counts: List[int], port: int, args) -> List[Dict[str, Any]]:
+    results = []
+    url = f"http://127.0.0.1:{port}"
+    for workers in worker_counts:
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+            env=dict(os.environ)
+        )
+        try:
+            _wait_until_ready(url, args.startup_timeout)
+            result = asyncio.run(run_load(url, args.endpoint, args.concurrency, args.duration, args.image_bytes))
+            result["workers"] = workers
+            results.append(result)
+            print(result)
+        finally:
+            server.terminate()
+            server.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the VitaFit backend over HTTP.")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", default="predict_exercise", choices=["predict_exercise", "classify_dish", "ai_chat"])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load per run.")
+    parser.add_argument("--image", help="Image file for classify_dish.")
+    parser.add_argument("--sweep-workers", help="Comma-separated uvicorn worker counts to start and measure, e.g. 1,2,4,8.")
+    parser.add_argument("--port", type=int, default=8765, help="Port for servers started by --sweep-workers.")
+    parser.add_argument("--startup-timeout", type=float, default=600.0)
+    parser.add_argument("--output", help="Optional path for JSON results.")
+    args = parser.parse_args()
+
+    args.image_bytes = None
+    if args.image:
+        with open(args.image, "rb") as f:
+            args.image_bytes = f.read()
+
+    if args.sweep_workers:
+        results = sweep_workers([int(n) for n in args.sweep_workers.split(",")], args.port, args)
+    else:
+        results = [asyncio.run(run_load(args.url, args.endpoint, args.concurrency, args.duration, args.image_bytes))]
+        print(results[0])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
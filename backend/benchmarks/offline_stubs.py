@@ -0,0 +1,392 @@
+# backend/benchmarks/offline_stubs.py
+"""
+Offline stand-ins used by the end-to-end benchmark so it runs with no network,
+no MongoDB and no downloaded weights:
+
+  - InMemoryDatabase: the subset of the pymongo API the backend uses
+  - build_tiny_llm_loader: a tiny randomly initialized Llama with a word-level
+    tokenizer built from the knowledge base, in place of TinyLlama
+  - a random-init YOLOv8n (from its yaml, no weights) plus generated fixture images
+  - synthetic forests for any tabular model pickle missing from models/
+  - deterministic fake embeddings over an exact NumPy vector index
+"""
+import io
+import os
+import copy
+import random
+import re
+import tempfile
+import threading
+import itertools
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+# --- MongoDB ---
+
+def _matches(doc: Dict[str, Any], query: Dict[str, Any]) -> bool:
+    for field, condition in query.items():
+        value = doc.get(field)
+        if isinstance(condition, dict) and any(key.startswith("$") for key in condition):
+            for op, operand in condition.items():
+                if op == "$in" and value not in operand:
+                    return False
+                if op == "$gte" and not (value is not None and value >= operand):
+                    return False
+                if op == "$gt" and not (value is not None and value > operand):
+                    return False
+                if op == "$lte" and not (value is not None and value <= operand):
+                    return False
+                if op == "$lt" and not (value is not None and value < operand):
+                    return False
+                if op == "$exists" and (field in doc) != bool(operand):
+                    return False
+                if op == "$not" and _matches(doc, {field: operand}):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _project(doc: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    include_id = projection.get("_id", 1)
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    if fields and all(fields.values()):
+        projected = {k: doc[k] for k in fields if k in doc}
+    else:
+        projected = {k: v for k, v in doc.items() if fields.get(k, 1)}
+    if include_id and "_id" in doc:
+        projected["_id"] = doc["_id"]
+    else:
+        projected.pop("_id", None)
+    return projected
+
+
+class _Cursor:
+    def __init__(self, docs: List[Dict[str, Any]]):
+        self._docs = docs
+
+    def batch_size(self, size: int) -> "_Cursor":
+        return self
+
+    def limit(self, count: int) -> "_Cursor":
+        if count:
+            self._docs = self._docs[:count]
+        return self
+
+    def sort(self, key: str, direction: int = 1) -> "_Cursor":
+        self._docs.sort(key=lambda d: (d.get(key) is None, d.get(key)), reverse=direction < 0)
+        return self
+
+    def __iter__(self):
+        return iter(self._docs)
+
+
+class InMemoryCollection:
+    """Thread-safe, dict-backed stand-in for a pymongo Collection (session_id lookups are O(1))."""
+
+    def __init__(self):
+        self._docs: Dict[int, Dict[str, Any]] = {}
+        self._by_session: Dict[Any, int] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.indexes: List[Tuple[Any, Dict[str, Any]]] = []
+
+    def _candidates(self, query: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+        session_id = query.get("session_id")
+        if session_id is not None and not isinstance(session_id, dict):
+            doc_id = self._by_session.get(session_id)
+            return [self._docs[doc_id]] if doc_id is not None else []
+        return list(self._docs.values())
+
+    def create_index(self, keys: Any, **kwargs: Any) -> str:
+        self.indexes.append((keys, kwargs))
+        return kwargs.get("name", str(keys))
+
+    def find_one(self, query: Dict[str, Any], projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            for doc in self._candidates(query):
+                if _matches(doc, query):
+                    return _project(doc, projection)
+        return None
+
+    def find(self, query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None) -> _Cursor:
+        query = query or {}
+        with self._lock:
+            return _Cursor([_project(doc, projection) for doc in self._candidates(query) if _matches(doc, query)])
+
+    def count_documents(self, query: Dict[str, Any]) -> int:
+        with self._lock:
+            return sum(1 for doc in self._candidates(query) if _matches(doc, query))
+
+    def insert_one(self, document: Dict[str, Any]) -> SimpleNamespace:
+        with self._lock:
+            return SimpleNamespace(inserted_id=self._insert(copy.deepcopy(document)))
+
+    def _insert(self, document: Dict[str, Any]) -> int:
+        doc_id = document.setdefault("_id", next(self._ids))
+        self._docs[doc_id] = document
+        if "session_id" in document:
+            self._by_session[document["session_id"]] = doc_id
+        return doc_id
+
+    def _apply_update(self, doc: Dict[str, Any], update: Dict[str, Any], inserting: bool) -> None:
+        for field, value in update.get("$set", {}).items():
+            target = doc
+            *parents, field = field.split(".")
+            for parent in parents:
+                target = target.setdefault(parent, {})
+            target[field] = copy.deepcopy(value)
+        if inserting:
+            for field, value in update.get("$setOnInsert", {}).items():
+                doc[field] = copy.deepcopy(value)
+        for field, value in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + value
+
+    def update_one(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False) -> SimpleNamespace:
+        with self._lock:
+            for doc in self._candidates(query):
+                if _matches(doc, query):
+                    self._apply_update(doc, update, inserting=False)
+                    if "session_id" in doc:
+                        self._by_session[doc["session_id"]] = doc["_id"]
+                    return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+            if not upsert:
+                return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+            doc = {k: v for k, v in query.items() if not isinstance(v, dict)}
+            self._apply_update(doc, update, inserting=True)
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=self._insert(doc))
+
+    def bulk_write(self, requests: List[Any], ordered: bool = True) -> SimpleNamespace:
+        upserted = modified = 0
+        for request in requests:
+            result = self.update_one(request._filter, request._doc, upsert=bool(request._upsert))
+            upserted += result.upserted_id is not None
+            modified += result.modified_count
+        return SimpleNamespace(upserted_count=upserted, modified_count=modified)
+
+    def delete_many(self, query: Dict[str, Any]) -> SimpleNamespace:
+        with self._lock:
+            doomed = [doc["_id"] for doc in self._candidates(query) if _matches(doc, query)]
+            for doc_id in doomed:
+                doc = self._docs.pop(doc_id)
+                self._by_session.pop(doc.get("session_id"), None)
+        return SimpleNamespace(deleted_count=len(doomed))
+
+
+class InMemoryDatabase:
+    def __init__(self):
+        self._collections: Dict[str, InMemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> InMemoryCollection:
+        return self._collections.setdefault(name, InMemoryCollection())
+
+
+def install_in_memory_mongo() -> InMemoryDatabase:
+    from config.settings import WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_ENABLED, WRITE_BEHIND_FSYNC, WRITE_BEHIND_INTERVAL_SECONDS, WRITE_BEHIND_MAX_PENDING
+    from database import mongodb_client
+    db = InMemoryDatabase()
+    mongodb_client.db = db
+    mongodb_client.mongo_client = SimpleNamespace(close=lambda: None)
+    if WRITE_BEHIND_ENABLED:
+        from database.write_behind import WriteBehindBuffer
+        mongodb_client.predictions_buffer = WriteBehindBuffer(
+            db["predictions"], tempfile.mkdtemp(prefix="vitafit-bench-journal-"), WRITE_BEHIND_BATCH_SIZE,
+            WRITE_BEHIND_INTERVAL_SECONDS, WRITE_BEHIND_MAX_PENDING, WRITE_BEHIND_FSYNC
+        )
+        mongodb_client.predictions_buffer.start()
+    return db
+
+
+
+def install_report_cache() -> str:
+    """Points the report PDF cache's disk tier at a temporary directory."""
+    from config.settings import REPORT_CACHE_DISK_MB, REPORT_CACHE_MEMORY_MB
+    from services import report_service
+    from utils.blob_cache import BlobCache
+    directory = tempfile.mkdtemp(prefix="vitafit-bench-reports-")
+    report_service._report_cache = BlobCache(
+        int(REPORT_CACHE_MEMORY_MB * 1024 * 1024), directory, int(REPORT_CACHE_DISK_MB * 1024 * 1024), suffix=".pdf"
+    )
+    return directory
+
+# --- Tabular models ---
+
+def _synthetic_exercise_frame(rows: int, rng: random.Random):
+    import pandas as pd
+    records = []
+    for _ in range(rows):
+        height_in = rng.uniform(58, 78)
+        weight_kg = rng.uniform(45, 120)
+        records.append({
+            "age": rng.randint(18, 70),
+            "gender": rng.randint(0, 1),
+            "height": height_in,
+            "weight": weight_kg,
+            "bmi": weight_kg / ((height_in * 0.0254) ** 2),
+            "calories_intake": rng.randint(1200, 3500),
+        })
+    return pd.DataFrame(records)
+
+
+def install_tabular_models(seed: int = 0) -> Dict[str, str]:
+    """
+    Installs the exercise and diet models into their services. Pickles present under
+    models/ are used as-is; missing ones are replaced by forests fit on synthetic data.
+    Returns which source each model came from.
+    """
+    import joblib
+    import numpy as np
+    import pandas as pd
+    from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+    from sklearn.multioutput import MultiOutputClassifier
+    from config.settings import COMPACT_FORESTS_ENABLED, EXERCISE_MODELS_PATH, DIET_MODELS_PATH
+    from services.compact_forest import convert_model, load_forest
+    from services.diet_service import DIET_FEATURE_COLUMNS_ORDER
+    from services.model_registry import model_registry
+
+    rng = random.Random(seed)
+    sources = {}
+
+    def load_or_fit(path: str, fit: Callable[[], Any], name: str) -> Any:
+        # Served the way the services load them, so compact forests are benchmarked when enabled.
+        if os.path.exists(path):
+            sources[name] = path
+            return load_forest(path)
+        sources[name] = "synthetic"
+        model = fit()
+        return convert_model(model) if COMPACT_FORESTS_ENABLED else model
+
+    exercise_encoders = joblib.load(os.path.join(EXERCISE_MODELS_PATH, "label_encoders.pkl"))
+    diet_encoders = joblib.load(os.path.join(DIET_MODELS_PATH, "diet_label_encoders.pkl"))
+    X = _synthetic_exercise_frame(2000, rng)
+    n_types = len(exercise_encoders["exercise_type"].classes_)
+    n_intensities = len(exercise_encoders["intensity_level"].classes_)
+
+    def fit_classifier():
+        y = np.column_stack([[rng.randrange(n_types) for _ in range(len(X))], [rng.randrange(n_intensities) for _ in range(len(X))]])
+        return MultiOutputClassifier(RandomForestClassifier(n_estimators=100, max_depth=12, random_state=seed)).fit(X, y)
+
+    def fit_exercise_regressor():
+        y = np.column_stack([
+            [rng.randint(1, 7) for _ in range(len(X))],
+            [rng.uniform(20, 90) for _ in range(len(X))],
+            [rng.uniform(100, 700) for _ in range(len(X))],
+        ])
+        return RandomForestRegressor(n_estimators=100, max_depth=12, random_state=seed).fit(X, y)
+
+    def fit_diet_regressor():
+        diet_X = X.copy()
+        diet_X["exercise_type"] = [rng.randrange(n_types) for _ in range(len(X))]
+        diet_X["intensity_level"] = [rng.randrange(n_intensities) for _ in range(len(X))]
+        diet_X["frequency_per_week"] = [rng.randint(1, 7) for _ in range(len(X))]
+        diet_X["activity_level"] = [rng.randrange(len(diet_encoders["activity_level"].classes_)) for _ in range(len(X))]
+        y = np.column_stack([
+            [rng.uniform(1400, 3500) for _ in range(len(X))],
+            [rng.uniform(50, 200) for _ in range(len(X))],
+            [rng.uniform(100, 400) for _ in range(len(X))],
+            [rng.uniform(40, 120) for _ in range(len(X))],
+        ])
+        return RandomForestRegressor(n_estimators=100, max_depth=12, random_state=seed).fit(pd.DataFrame(diet_X)[DIET_FEATURE_COLUMNS_ORDER], y)
+
+    model_registry.install("exercise", {
+        "classifier": load_or_fit(os.path.join(EXERCISE_MODELS_PATH, "multi_classifier.pkl"), fit_classifier, "exercise_classifier"),
+        "regressor": load_or_fit(os.path.join(EXERCISE_MODELS_PATH, "multi_regressor.pkl"), fit_exercise_regressor, "exercise_regressor"),
+        "encoders": exercise_encoders,
+    }, version=f"offline-{seed}")
+    model_registry.install("diet", {
+        "regressor": load_or_fit(os.path.join(DIET_MODELS_PATH, "diet_model_rf.pkl"), fit_diet_regressor, "diet_regressor"),
+        "encoders": diet_encoders,
+    }, version=f"offline-{seed}")
+    return sources
+
+
+# --- Vision ---
+
+def build_fixture_images(count: int = 4, size: Tuple[int, int] = (640, 480), seed: int = 0) -> List[bytes]:
+    """Random shapes on a plain background, encoded as JPEG."""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    images = []
+    for _ in range(count):
+        img = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(12):
+            x0, y0 = rng.randrange(size[0]), rng.randrange(size[1])
+            box = [x0, y0, x0 + rng.randrange(20, 200), y0 + rng.randrange(20, 200)]
+            draw.ellipse(box, fill=tuple(rng.randrange(256) for _ in range(3)))
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def build_offline_image_classifier() -> Optional[Any]:
+    """YOLOv8n built from its yaml with random weights: same compute, no download."""
+    from models.Image_Classifier_Model.image_classifier_logic import load_image_classifier
+    return load_image_classifier("yolov8n.yaml")
+
+
+# --- RAG ---
+
+def build_tiny_llm_loader(corpus: Iterable[str], seed: int = 0, hidden_size: int = 64, layers: int = 2) -> Callable[[str], Tuple[Any, Any]]:
+    """
+    Returns an `llm_loader` for initialize_rag_components that builds a tiny,
+    randomly initialized Llama and a word-level tokenizer over the corpus vocabulary.
+    """
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast # type:ignore
+
+    vocab = {"<unk>": 0, "</s>": 1}
+    for text in corpus:
+        for word in re.findall(r"\w+|[^\w\s]", text):
+            vocab.setdefault(word, len(vocab))
+
+    def loader(device: str) -> Tuple[Any, Any]:
+        tokenizer_backend = Tokenizer(models.WordLevel(vocab=vocab, unk_token="<unk>"))
+        tokenizer_backend.pre_tokenizer = pre_tokenizers.Whitespace()
+        tokenizer = PreTrainedTokenizerFast(tokenizer_object=tokenizer_backend, unk_token="<unk>", eos_token="</s>", model_max_length=8192)
+        torch.manual_seed(seed)
+        config = LlamaConfig(
+            vocab_size=len(vocab), hidden_size=hidden_size, intermediate_size=hidden_size * 2,
+            num_hidden_layers=layers, num_attention_heads=4, num_key_value_heads=4,
+            max_position_embeddings=8192, eos_token_id=1, pad_token_id=1
+        )
+        model = LlamaForCausalLM(config).to(device)
+        model.eval()
+        return tokenizer, model
+
+    return loader
+
+
+async def build_offline_rag_assistant(seed: int = 0) -> Any:
+    """Real chunking, retriever and chain code paths over fake embeddings and a tiny LM."""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from services import rag_service
+    from services.numpy_vector_store import NumpyVectorStore
+    from services.retrieval_service import CachedEmbeddings
+    from utils.lru_cache import content_hash
+
+    documents = rag_service.load_knowledge_base_chunks()
+    version = content_hash("offline-benchmark", *(doc.page_content for doc in documents))
+    rag_service.knowledge_base_chunks = documents
+    rag_service.knowledge_base_version = version
+
+    embeddings = CachedEmbeddings(DeterministicFakeEmbedding(size=384), index_version=version)
+    vectorstore = NumpyVectorStore.build(documents, embeddings, tempfile.mkdtemp(prefix="vitafit-bench-index-"), version=version)
+
+    corpus = [doc.page_content for doc in documents] + [
+        "You are VitaFit, a friendly and knowledgeable fitness assistant. Based on the following user's fitness and diet data "
+        "provide a concise and encouraging health overview. Does the following question strictly fall under health fitness "
+        "nutrition wellness or exercise science? Answer with only 'YES' or 'NO'. Question Answer Health Overview User Data"
+    ]
+    return await rag_service.initialize_rag_components(
+        vectorstore,
+        llm_loader=build_tiny_llm_loader(corpus, seed=seed),
+        overview_contexts_path=os.path.join(tempfile.mkdtemp(prefix="vitafit-bench-overview-"), "overview_contexts.json")
+    )
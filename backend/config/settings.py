@@ -5,6 +5,20 @@ load_dotenv()
 
 MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
 DB_NAME = os.getenv("DB_NAME", "vitafit")
+# Session records expire this many days after their last update (0 keeps them forever).
+SESSION_TTL_DAYS = int(os.getenv("SESSION_TTL_DAYS", "30"))
+
+# --- Deployment profile ---
+# Comma-separated subsystems this process serves: tabular (/predict_exercise, /predict_diet, /plan),
+# vision (/classify_dish), rag (/ai/*) and reports (/generate_report), or "all".
+# A disabled subsystem's dependencies are never imported and its endpoints answer 503.
+SUBSYSTEMS = ("tabular", "vision", "rag", "reports")
+DEPLOYMENT_PROFILE = os.getenv("DEPLOYMENT_PROFILE", "all").lower()
+ENABLED_SUBSYSTEMS = set(SUBSYSTEMS) if DEPLOYMENT_PROFILE == "all" else {name.strip() for name in DEPLOYMENT_PROFILE.split(",") if name.strip()}
+_unknown_subsystems = ENABLED_SUBSYSTEMS - set(SUBSYSTEMS)
+if _unknown_subsystems:
+    raise ValueError(f"Unknown subsystem(s) in DEPLOYMENT_PROFILE: {', '.join(sorted(_unknown_subsystems))}; "
+                     f"valid names are {', '.join(SUBSYSTEMS)}, or \"all\"")
 
 SETTINGS_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -13,12 +27,192 @@ BACKEND_ROOT = os.path.abspath(os.path.join(SETTINGS_DIR, os.pardir))
 EXERCISE_MODELS_PATH = os.path.abspath(os.path.join(BACKEND_ROOT, "models", "Exercise_Models"))
 DIET_MODELS_PATH = os.path.abspath(os.path.join(BACKEND_ROOT, "models", "Diet_Recommendation_Models"))
 IMAGE_CLASSIFIER_MODELS_PATH = os.path.abspath(os.path.join(BACKEND_ROOT, "models", "Image_Classifier_Model"))
+# How often model files are checked for a new version to hot-swap in (0 disables).
+MODEL_RELOAD_INTERVAL_SECONDS = float(os.getenv("MODEL_RELOAD_INTERVAL_SECONDS", "30"))
+# Serve the exercise and diet forests from memory-mapped node arrays converted from the
+# pickles (verified to predict identically; false loads the pickles with scikit-learn).
+COMPACT_FORESTS_ENABLED = os.getenv("COMPACT_FORESTS_ENABLED", "true").lower() == "true"
+# Most users accepted by one /plan/batch request.
+PLAN_BATCH_MAX_SIZE = int(os.getenv("PLAN_BATCH_MAX_SIZE", "100"))
 
 KNOWLEDGE_BASE_DATA_DIR = os.path.abspath(os.path.join(BACKEND_ROOT, "data"))
 VECTOR_DB_PERSIST_PATH = os.path.abspath(os.path.join(BACKEND_ROOT, "vector_db"))
+NUMPY_VECTOR_INDEX_PATH = os.path.abspath(os.path.join(BACKEND_ROOT, "vector_index"))
+# Retrieved context for /ai/overview per exercise_type x intensity_level, rebuilt when the knowledge base changes.
+OVERVIEW_CONTEXTS_PATH = os.path.abspath(os.path.join(BACKEND_ROOT, "overview_contexts.json"))
+# "chroma" (persistent Chroma/SQLite/HNSW store) or "numpy" (memory-mapped exact search,
+# shared read-only across worker processes; suited to the small knowledge base).
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
 
 LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME", "TinyLlama/TinyLlama-1.1B-Chat-v1.0")
+# Generation for /ai/chat and /ai/overview is stopped after this many seconds (0 disables),
+# and as soon as the client disconnects.
+LLM_REQUEST_DEADLINE_SECONDS = float(os.getenv("LLM_REQUEST_DEADLINE_SECONDS", "120"))
 
 HF_TOKEN = os.getenv("HF_TOKEN")
 
-EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "BAAI/bge-small-en-v1.5")
\ No newline at end of file
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "BAAI/bge-small-en-v1.5")
+
+# --- Knowledge base ingestion ---
+# Processes that parse and chunk files when the index is (re)built (1 parses in-process).
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Chunks per embed call and per vector store write; bounds the vectors held in memory.
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+# Texts per forward pass inside the embedding model.
+EMBEDDING_ENCODE_BATCH_SIZE = int(os.getenv("EMBEDDING_ENCODE_BATCH_SIZE", "64"))
+
+# --- Retrieval ---
+# "dense" (vector store only), "bm25" (lexical index only) or "hybrid" (lexical
+# fast path for keyword queries, reciprocal-rank fusion with dense otherwise).
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+BM25_K1 = float(os.getenv("BM25_K1", "1.5"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Queries with at most this many content terms, all found together in the top
+# lexical hit, are answered from the BM25 index without an embedding call.
+LEXICAL_MAX_QUERY_TERMS = int(os.getenv("LEXICAL_MAX_QUERY_TERMS", "4"))
+# Memoized query embeddings and retrieval results, keyed by content hash and the
+# knowledge base version. 0 disables the respective cache.
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+
+# --- Conversation memory ---
+# /ai/chat keeps recent turns per session in at most this many LLM tokens (0 disables
+# memory); older turns are folded into a running summary of at most SUMMARY_TOKENS.
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "384"))
+CONVERSATION_SUMMARY_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "128"))
+# Conversations kept per process, and seconds of inactivity after which one is dropped.
+CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", "5000"))
+CONVERSATION_IDLE_SECONDS = float(os.getenv("CONVERSATION_IDLE_SECONDS", "1800"))
+
+# --- Overview precompute ---
+# After /predict_diet or /plan stores a plan, its /ai/overview is generated in the background
+# and stored with the record. This work only runs while no interactive LLM request is queued,
+# and yields as soon as one arrives. At most MAX_PENDING sessions wait per worker.
+OVERVIEW_PRECOMPUTE_ENABLED = os.getenv("OVERVIEW_PRECOMPUTE_ENABLED", "true").lower() == "true"
+OVERVIEW_PRECOMPUTE_MAX_PENDING = int(os.getenv("OVERVIEW_PRECOMPUTE_MAX_PENDING", "64"))
+
+# --- Write-behind ---
+# When enabled, prediction record updates are journalled locally and written to MongoDB
+# in bulk by a background thread, every BATCH_SIZE sessions or INTERVAL_SECONDS. Reads
+# of a buffered session come from the buffer, which is per worker process, or from
+# another worker's journal for a session MongoDB does not have yet.
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500"))
+WRITE_BEHIND_INTERVAL_SECONDS = float(os.getenv("WRITE_BEHIND_INTERVAL_SECONDS", "1.0"))
+# Past this many buffered sessions, requests write synchronously until MongoDB catches up.
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+WRITE_BEHIND_JOURNAL_DIR = os.getenv("WRITE_BEHIND_JOURNAL_DIR", os.path.join(BACKEND_ROOT, "write_behind_journal"))
+# fsync every journal append (survives power loss); "false" only survives a process crash.
+WRITE_BEHIND_FSYNC = os.getenv("WRITE_BEHIND_FSYNC", "true").lower() == "true"
+
+# --- Reports ---
+# Rendered report PDFs are cached by a hash of their inputs: up to MEMORY_MB per
+# process, and up to DISK_MB in REPORT_CACHE_DIR shared by the workers (0 disables a tier).
+REPORT_CACHE_MEMORY_MB = float(os.getenv("REPORT_CACHE_MEMORY_MB", "64"))
+REPORT_CACHE_DISK_MB = float(os.getenv("REPORT_CACHE_DISK_MB", "1024"))
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", os.path.join(BACKEND_ROOT, "report_cache"))
+# Reports carry personal details, so only the client may store them by default; clients
+# revalidate GET /reports/{session_id} with If-None-Match and get 304 while the record is unchanged.
+REPORT_CACHE_CONTROL = os.getenv("REPORT_CACHE_CONTROL", "private, no-cache")
+# /reports/export renders PDFs in this many processes (1 renders in the API process),
+# reads records from Mongo BATCH_SIZE at a time, and exports at most MAX_SESSIONS reports.
+REPORT_EXPORT_WORKERS = int(os.getenv("REPORT_EXPORT_WORKERS", str(min(4, os.cpu_count() or 1))))
+REPORT_EXPORT_BATCH_SIZE = int(os.getenv("REPORT_EXPORT_BATCH_SIZE", "64"))
+REPORT_EXPORT_MAX_SESSIONS = int(os.getenv("REPORT_EXPORT_MAX_SESSIONS", "5000"))
+
+# --- Serving ---
+# "standalone": every worker loads all models itself (default).
+# "inference-client": HTTP workers load only the small tabular models and reach the
+# YOLO, embedding and LLM models in a shared inference process over local IPC
+# (start it with `python -m services.inference_service`).
+SERVING_MODE = os.getenv("SERVING_MODE", "standalone").lower()
+# Directory (mode 0700, owned by the server's user) for the default socket and key file:
+# $XDG_RUNTIME_DIR/vitafit, or backend/.run without XDG_RUNTIME_DIR. Never a shared
+# directory like /tmp, where another user could put files there first.
+INFERENCE_RUNTIME_DIR = os.getenv(
+    "INFERENCE_RUNTIME_DIR",
+    os.path.join(os.environ["XDG_RUNTIME_DIR"], "vitafit") if os.getenv("XDG_RUNTIME_DIR") else os.path.join(BACKEND_ROOT, ".run")
+)
+# Unix socket path, or host:port for TCP on localhost.
+INFERENCE_SERVER_ADDRESS = os.getenv("INFERENCE_SERVER_ADDRESS", os.path.join(INFERENCE_RUNTIME_DIR, "inference.sock"))
+# The IPC channel unpickles what it receives, so it is authenticated with a secret key.
+# Unset, the server generates one into INFERENCE_SERVER_AUTHKEY_FILE (mode 0600), where
+# workers of the same user read it.
+INFERENCE_SERVER_AUTHKEY = os.getenv("INFERENCE_SERVER_AUTHKEY", "")
+INFERENCE_SERVER_AUTHKEY_FILE = os.getenv("INFERENCE_SERVER_AUTHKEY_FILE", os.path.join(INFERENCE_RUNTIME_DIR, "inference.key"))
+# TCP addresses other than loopback are refused unless this is set (and then need INFERENCE_SERVER_AUTHKEY).
+INFERENCE_SERVER_ALLOW_REMOTE = os.getenv("INFERENCE_SERVER_ALLOW_REMOTE", "false").lower() == "true"
+
+# --- Observability ---
+# Hot-path diagnostics are logged at DEBUG; the default level keeps them off.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Stage spans are exported over OTLP (configure OTEL_EXPORTER_OTLP_ENDPOINT) when enabled.
+OTEL_ENABLED = os.getenv("OTEL_ENABLED", "false").lower() == "true"
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "vitafit-backend")
+# Bearer token for the /admin/* endpoints (request profiling); empty leaves them disabled (404).
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+# Stack sampling period while a profile runs, and the longest time box a profile may have.
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "600"))
+
+# --- Scheduling ---
+# Requests are admitted per endpoint class: "tabular" (/predict_exercise, /predict_diet,
+# /plan), "vision" (/classify_dish), "llm" (/ai/chat, /ai/overview) and "reports"
+# (/generate_report, and /reports/export for as long as its archive streams).
+# Per-class settings are given as "tabular=16,vision=2,llm=1,reports=1".
+def _per_class(name: str, default: str) -> dict:
+    raw = os.getenv(name, default)
+    return {key.strip(): float(value) for key, value in (item.split("=", 1) for item in raw.split(",") if item.strip())}
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+# Total requests doing work at once in this worker, across all classes.
+SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", str(max(2, os.cpu_count() or 2))))
+# Reports get one slot by default: an export holds its slot for minutes, and all classes share the total.
+SCHEDULER_CLASS_LIMITS = _per_class("SCHEDULER_CLASS_LIMITS", "tabular=16,vision=2,llm=1,reports=1")
+# Share of freed slots each class gets while several classes are queued (weighted fair queuing).
+SCHEDULER_CLASS_WEIGHTS = _per_class("SCHEDULER_CLASS_WEIGHTS", "tabular=8,vision=2,llm=1,reports=1")
+# Load shedding, off by default so requests queue rather than fail: requests beyond a class's
+# queue length, or queued longer than its timeout, get 503 (unset or 0: unbounded, no timeout),
+# e.g. "tabular=256,vision=16,llm=8,reports=16" and "tabular=2,vision=10,llm=30,reports=30".
+SCHEDULER_MAX_QUEUE = _per_class("SCHEDULER_MAX_QUEUE", "")
+SCHEDULER_QUEUE_TIMEOUT_SECONDS = _per_class("SCHEDULER_QUEUE_TIMEOUT_SECONDS", "")
+# Per-client-address token buckets (requests per second and burst size); unset or 0 disables.
+# Over the limit is 429, e.g. "tabular=5,vision=1,llm=0.2,reports=1" and "tabular=20,vision=5,llm=3,reports=5".
+SCHEDULER_CLIENT_RATE = _per_class("SCHEDULER_CLIENT_RATE", "")
+SCHEDULER_CLIENT_BURST = _per_class("SCHEDULER_CLIENT_BURST", "")
+# Identical /ai/overview (same session) and /classify_dish (same image) requests arriving
+# while one is in progress wait for it and share its result instead of redoing the work.
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+# --- Thread budgets ---
+# Native threads each workload may use, so concurrent LLM, embedding, YOLO and forest
+# work does not run more busy threads than there are cores. Workloads: "llm",
+# "embedding", "vision", "tabular", and the "render" and "ingest" worker processes.
+THREAD_BUDGETS_ENABLED = os.getenv("THREAD_BUDGETS_ENABLED", "true").lower() == "true"
+_CPUS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+# Intra-op threads per workload (torch.set_num_threads for torch work, n_jobs for pickled forests).
+THREAD_BUDGETS = {key: max(1, int(value)) for key, value in _per_class(
+    "THREAD_BUDGETS",
+    f"llm={max(1, _CPUS // 2)},embedding={max(1, _CPUS // 4)},vision={max(1, _CPUS // 4)},tabular=1,render=1,ingest=1",
+).items()}
+# Optional core pinning per workload (Linux), e.g. "llm=0-3,vision=4-5,tabular=6+7";
+# workloads left out run on the cores the process started with.
+def _cpu_sets(name: str) -> dict:
+    sets = {}
+    for item in os.getenv(name, "").split(","):
+        if not item.strip():
+            continue
+        key, value = item.split("=", 1)
+        cpus = set()
+        for part in value.split("+"):
+            first, _, last = part.partition("-")
+            cpus.update(range(int(first), int(last or first) + 1))
+        sets[key.strip()] = cpus
+    return sets
+
+THREAD_AFFINITY = _cpu_sets("THREAD_AFFINITY")
+# Process-wide: torch inter-op threads (only settable before torch runs any work) and
+# the BLAS/OpenMP pools used by numpy and scikit-learn.
+TORCH_INTEROP_THREADS = int(os.getenv("TORCH_INTEROP_THREADS", "1"))
+BLAS_THREADS = int(os.getenv("BLAS_THREADS", "1"))
@@ -1,14 +1,34 @@
 # backend/database/mongodb_client.py
 import os
-from pymongo import MongoClient
+import datetime
+from pymongo import MongoClient, ASCENDING
+from pymongo.errors import DuplicateKeyError, OperationFailure
 from typing import Optional, Any
-from config.settings import MONGODB_URI, DB_NAME
+from config.settings import (
+    MONGODB_URI, DB_NAME, SESSION_TTL_DAYS, WRITE_BEHIND_ENABLED, WRITE_BEHIND_BATCH_SIZE,
+    WRITE_BEHIND_INTERVAL_SECONDS, WRITE_BEHIND_MAX_PENDING, WRITE_BEHIND_JOURNAL_DIR, WRITE_BEHIND_FSYNC
+)
 
 mongo_client: Optional[MongoClient] = None
 db: Optional[Any] = None
+# Set when WRITE_BEHIND_ENABLED; "predictions" is then served through it.
+predictions_buffer: Optional[Any] = None
+
+# Fields each reader actually needs from a session record in "predictions".
+DIET_INPUT_PROJECTION = {"_id": 0, "processed_features": 1, "exercise_predictions": 1, "raw_user_input": 1}
+REPORT_PROJECTION = {"_id": 0, "session_id": 1, "raw_user_input": 1, "exercise_predictions": 1, "diet_predictions": 1}
+# Also returns the stored "ai_overview", which services/overview_service.py removes before prompting.
+OVERVIEW_PROJECTION = {"_id": 0, "timestamp": 0, "last_updated": 0, "processed_features": 0, "model_versions": 0}
+# One-off data migrations record themselves here, so only one worker ever runs each.
+MIGRATIONS_COLLECTION = "migrations"
+# Every field of a session record, as /predict_exercise and /plan write it.
+PREDICTION_RECORD_FIELDS = (
+    "session_id", "timestamp", "last_updated", "raw_user_input", "processed_features",
+    "exercise_predictions", "diet_predictions", "model_versions"
+)
 
 async def connect_to_mongodb():
-    global mongo_client, db
+    global mongo_client, db, predictions_buffer
     if mongo_client is None:
         try:
             mongo_client = MongoClient(MONGODB_URI)
@@ -18,9 +38,67 @@ async def connect_to_mongodb():
         except Exception as e:
             print(f"Failed to connect to MongoDB: {e}")
             raise
+        ensure_session_indexes(db["predictions"])
+        if WRITE_BEHIND_ENABLED:
+            from database.write_behind import WriteBehindBuffer
+            predictions_buffer = WriteBehindBuffer(
+                db["predictions"], WRITE_BEHIND_JOURNAL_DIR, WRITE_BEHIND_BATCH_SIZE,
+                WRITE_BEHIND_INTERVAL_SECONDS, WRITE_BEHIND_MAX_PENDING, WRITE_BEHIND_FSYNC
+            )
+            predictions_buffer.start()
+            print(f"Write-behind enabled for predictions (journal in {WRITE_BEHIND_JOURNAL_DIR}).")
+
+def ensure_session_indexes(collection: Any, ttl_days: int = SESSION_TTL_DAYS):
+    """
+    Creates the unique session_id index every endpoint looks up by, and a TTL index
+    on last_updated so abandoned sessions expire. Safe to call on every startup.
+    """
+    try:
+        collection.create_index([("session_id", ASCENDING)], unique=True, name="session_id_unique")
+    except OperationFailure as e:
+        # Existing duplicate session_ids block the unique index; still avoid collection scans.
+        print(f"Warning: could not create unique session_id index ({e}). Creating a non-unique index instead.")
+        collection.create_index([("session_id", ASCENDING)], name="session_id_lookup")
+
+    if ttl_days <= 0:
+        return
+    ttl_seconds = ttl_days * 24 * 60 * 60
+    # Records written before last_updated was always set only carry their creation timestamp.
+    run_migration_once(collection.database, f"{collection.name}.backfill_last_updated", lambda: collection.update_many(
+        {"last_updated": {"$exists": False}}, [{"$set": {"last_updated": "$timestamp"}}]
+    ))
+    try:
+        collection.create_index([("last_updated", ASCENDING)], expireAfterSeconds=ttl_seconds, name="last_updated_ttl")
+    except OperationFailure:
+        # The TTL changed since the index was created; update it in place.
+        collection.database.command("collMod", collection.name, index={"name": "last_updated_ttl", "expireAfterSeconds": ttl_seconds})
+    print(f"Session indexes ensured (session_id unique, last_updated TTL {ttl_days} days).")
+
+def run_migration_once(database: Any, name: str, migrate: Any) -> bool:
+    """
+    Runs `migrate` unless some process already has: the first worker to insert the
+    migration's marker document runs it; the others skip it. A failed run removes
+    the marker so the next startup tries again. True if it ran here.
+    """
+    markers = database[MIGRATIONS_COLLECTION]
+    try:
+        markers.insert_one({"_id": name, "started_at": datetime.datetime.utcnow()})
+    except DuplicateKeyError:
+        return False
+    try:
+        migrate()
+    except Exception:
+        markers.delete_one({"_id": name})
+        raise
+    markers.update_one({"_id": name}, {"$set": {"finished_at": datetime.datetime.utcnow()}})
+    print(f"Migration {name} done.")
+    return True
 
 async def close_mongodb_connection():
-    global mongo_client
+    global mongo_client, predictions_buffer
+    if predictions_buffer is not None:
+        predictions_buffer.close()
+        predictions_buffer = None
     if mongo_client:
         mongo_client.close()
         mongo_client = None
@@ -30,4 +108,7 @@ def get_db_collection(collection_name: str):
     global db
     if db is None:
         raise Exception("MongoDB database connection not established.")
-    return db[collection_name]
\ No newline at end of file
+    if collection_name == "predictions" and predictions_buffer is not None:
+        from database.write_behind import BufferedCollection
+        return BufferedCollection(db[collection_name], predictions_buffer, PREDICTION_RECORD_FIELDS)
+    return db[collection_name]
@@ -0,0 +1,471 @@
+# backend/database/write_behind.py
+"""
+Write-behind persistence for the "predictions" collection (WRITE_BEHIND_ENABLED).
+
+Endpoints keep calling update_one({"session_id": ...}, {"$set": ...}). With write-behind
+on, the update is appended to a local journal, merged into an in-process buffer keyed
+by session_id, and the request returns without waiting for MongoDB. A flusher thread
+writes the buffer with one unordered bulk_write once it holds WRITE_BEHIND_BATCH_SIZE
+sessions or WRITE_BEHIND_INTERVAL_SECONDS have passed. Reads of a session that is
+still buffered are answered from the buffer, merged over the stored document when the
+buffered update is partial.
+
+The journal is a directory of append-only segments, one set per process. A flush seals
+the current segment and deletes it once the bulk write succeeded; a failed flush puts
+the updates back and keeps the segment. Each process holds a lock on its own segments,
+and a process that starts up replays the segments of processes that are gone, so
+buffered updates survive a crash. Replaying is safe because every update is a $set.
+
+The buffer is per process. A read of a session that is in neither this buffer nor
+MongoDB also looks in the other processes' journal segments (indexed incrementally),
+so a record written through one worker can be read through another straight away.
+A partial update of such a record is buffered as the whole record with the update
+applied. Whole records are flushed so that the one with the later last_updated wins,
+whichever process flushes first. An update to a record that is already stored is only
+seen by other workers once it is flushed.
+"""
+import os
+import copy
+import glob
+import datetime
+import uuid
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import json_util
+from pymongo import UpdateOne
+from pymongo.results import UpdateResult
+
+from utils.file_lock import lock_file
+from utils.lru_cache import LRUCache
+from utils.observability import WRITE_BEHIND_FLUSHES, WRITE_BEHIND_PENDING, logger, stage_timer
+
+JOURNAL_SUFFIX = ".journal"
+LOCK_SUFFIX = ".lock"
+# Every write of a whole record sets it; of two whole records, the one with the later value wins.
+VERSION_FIELD = "last_updated"
+# Sessions read from other processes' journals, kept for the update that usually follows the read.
+JOURNALLED_SESSIONS_CACHED = 1024
+
+
+def _set_path(document: Dict[str, Any], path: str, value: Any) -> None:
+    parts = path.split(".")
+    for part in parts[:-1]:
+        child = document.get(part)
+        if not isinstance(child, dict):
+            child = document[part] = {}
+        document = child
+    document[parts[-1]] = value
+
+
+def apply_set(document: Dict[str, Any], fields: Dict[str, Any]) -> Dict[str, Any]:
+    """`document` with a $set of `fields` (dotted paths included) applied, as MongoDB would."""
+    for path, value in fields.items():
+        _set_path(document, path, value)
+    return document
+
+
+def apply_projection(document: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Top-level inclusion or exclusion projection, the kind the endpoints use."""
+    if not projection:
+        return document
+    included = [field for field, flag in projection.items() if flag and field != "_id"]
+    if included:
+        return {field: document[field] for field in included if field in document}
+    return {field: value for field, value in document.items() if projection.get(field, 1)}
+
+
+class _Pending:
+    """A session's buffered $set fields. `complete` is true when they are the whole record."""
+    def __init__(self, fields: Dict[str, Any], upsert: bool, complete: bool):
+        self.fields = fields
+        self.upsert = upsert
+        self.complete = complete
+
+    def merge(self, newer: "_Pending") -> "_Pending":
+        if newer.complete:
+            return _Pending(dict(newer.fields), newer.upsert or self.upsert, True)
+        fields = dict(self.fields)
+        for path, value in newer.fields.items():
+            # Setting a parent replaces any buffered paths below it; setting below a
+            # buffered parent updates that value, so one $set never has both.
+            for buffered in [p for p in fields if p.startswith(path + ".")]:
+                del fields[buffered]
+            parent = next((p for p in fields if path.startswith(p + ".") and isinstance(fields[p], dict)), None)
+            if parent is not None:
+                fields[parent] = apply_set(copy.deepcopy(fields[parent]), {path[len(parent) + 1:]: value})
+            else:
+                fields[path] = value
+        return _Pending(fields, self.upsert or newer.upsert, self.complete)
+
+
+def _merge_into(target: Dict[str, _Pending], session_id: str, entry: _Pending) -> None:
+    previous = target.get(session_id)
+    target[session_id] = previous.merge(entry) if previous is not None else entry
+
+
+def _to_millis(value: Any) -> Any:
+    # MongoDB (and the journal) keep datetimes to the millisecond; versions must compare the same everywhere.
+    if isinstance(value, datetime.datetime):
+        return value.replace(microsecond=value.microsecond // 1000 * 1000)
+    return value
+
+
+def _update_requests(session_id: str, entry: _Pending) -> List[UpdateOne]:
+    version = entry.fields.get(VERSION_FIELD)
+    if not entry.complete or version is None:
+        return [UpdateOne({"session_id": session_id}, {"$set": entry.fields}, upsert=entry.upsert)]
+    # Another process may have stored a later version of the whole record (see BufferedCollection):
+    # replace the stored record only if it is not newer, and insert it only if there is none.
+    requests = [UpdateOne({"session_id": session_id, VERSION_FIELD: {"$not": {"$gt": version}}}, {"$set": entry.fields})]
+    if entry.upsert:
+        requests.append(UpdateOne({"session_id": session_id}, {"$setOnInsert": entry.fields}, upsert=True))
+    return requests
+
+
+class _JournalIndex:
+    """
+    Where each session's updates are in other processes' journal segments. Segments are
+    append-only, so a lookup only reads what was appended since the previous one.
+    """
+    def __init__(self, journal_dir: str, owner: str):
+        self.journal_dir = journal_dir
+        self._own_prefix = os.path.join(journal_dir, owner + ".")
+        # Segment path -> (bytes indexed, session_id -> offsets of its lines).
+        self._segments: Dict[str, Tuple[int, Dict[str, List[int]]]] = {}
+        self._lock = threading.Lock()
+
+    def _offsets(self, path: str, session_id: str) -> List[int]:
+        indexed, offsets = self._segments.get(path, (0, {}))
+        if os.path.getsize(path) > indexed:
+            with open(path, "rb") as f:
+                f.seek(indexed)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # still being written; indexed on a later lookup
+                    try:
+                        offsets.setdefault(json_util.loads(line)["s"], []).append(indexed)
+                    except ValueError:
+                        pass
+                    indexed += len(line)
+            self._segments[path] = (indexed, offsets)
+        return offsets.get(session_id, [])
+
+    @staticmethod
+    def _read(path: str, offsets: List[int]) -> List[_Pending]:
+        entries = []
+        with open(path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                item = json_util.loads(f.readline())
+                entries.append(_Pending(item["f"], item["u"], item["c"]))
+        return entries
+
+    def lookup(self, session_id: str) -> Optional[_Pending]:
+        by_owner: Dict[str, _Pending] = {}
+        with self._lock:
+            paths = sorted(path for path in glob.glob(os.path.join(self.journal_dir, "*" + JOURNAL_SUFFIX)) if not path.startswith(self._own_prefix))
+            for gone in self._segments.keys() - set(paths):
+                del self._segments[gone]  # flushed, or adopted under another name
+            for path in paths:
+                try:
+                    entries = self._read(path, self._offsets(path, session_id))
+                except FileNotFoundError:
+                    self._segments.pop(path, None)
+                    continue  # flushed meanwhile, so the update is in MongoDB now
+                for entry in entries:
+                    _merge_into(by_owner, os.path.basename(path).split(".", 1)[0], entry)
+        if not by_owner:
+            return None
+        # Processes are not ordered among themselves: whole records oldest version first, then partial updates.
+        ordered = sorted(by_owner.values(), key=lambda entry: (not entry.complete, str(entry.fields.get(VERSION_FIELD, ""))))
+        merged = ordered[0]
+        for entry in ordered[1:]:
+            merged = merged.merge(entry)
+        return merged
+
+
+class WriteBehindBuffer:
+    def __init__(self, collection: Any, journal_dir: str, batch_size: int, interval_seconds: float, max_pending: int, fsync: bool):
+        self.collection = collection
+        self.journal_dir = journal_dir
+        self.batch_size = batch_size
+        self.interval_seconds = interval_seconds
+        self.max_pending = max_pending
+        self.fsync = fsync
+
+        self._pending: Dict[str, _Pending] = {}
+        self._flushing: Dict[str, _Pending] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+        os.makedirs(journal_dir, exist_ok=True)
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._lock_file = open(os.path.join(journal_dir, self.owner + LOCK_SUFFIX), "w")
+        lock_file(self._lock_file, blocking=False)
+        self._segment_number = 0
+        self._segment = self._open_segment()
+        # Segments whose updates are buffered but not yet in MongoDB, oldest first.
+        self._sealed: List[str] = self._recover()
+        self._journals = _JournalIndex(journal_dir, self.owner)
+        self._journalled = LRUCache(JOURNALLED_SESSIONS_CACHED)
+
+    # --- Journal ---
+
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self.journal_dir, f"{self.owner}.{number:08d}{JOURNAL_SUFFIX}")
+
+    def _open_segment(self):
+        self._segment_number += 1
+        return open(self._segment_path(self._segment_number), "a", encoding="utf-8")
+
+    def _seal_segment(self) -> str:
+        path = self._segment.name
+        self._segment.close()
+        self._segment = self._open_segment()
+        return path
+
+    def _append(self, session_id: str, entry: _Pending) -> None:
+        self._segment.write(json_util.dumps({"s": session_id, "f": entry.fields, "u": entry.upsert, "c": entry.complete}) + "\n")
+        self._segment.flush()
+        if self.fsync:
+            os.fsync(self._segment.fileno())
+
+    def _recover(self) -> List[str]:
+        """
+        Buffers the updates journalled by processes that no longer run, and adopts their
+        segments. Each segment is renamed into this process's namespace while the dead
+        owner's lock is still held, so a process starting at the same time finds it
+        either locked or gone, never unowned, and cannot replay it a second time.
+        """
+        adopted: List[str] = []
+        owners = {os.path.basename(path)[:-len(LOCK_SUFFIX)] for path in glob.glob(os.path.join(self.journal_dir, "*" + LOCK_SUFFIX))}
+        # Segments without a lock file were adopted by a process that then died too.
+        owners.update(os.path.basename(path).split(".", 1)[0] for path in glob.glob(os.path.join(self.journal_dir, "*" + JOURNAL_SUFFIX)))
+        for owner in sorted(owners - {self.owner}):
+            lock_path = os.path.join(self.journal_dir, owner + LOCK_SUFFIX)
+            with open(lock_path, "a") as owner_lock:
+                try:
+                    lock_file(owner_lock, blocking=False)
+                except BlockingIOError:
+                    continue  # the owner is still running
+                for segment in sorted(glob.glob(os.path.join(self.journal_dir, f"{owner}.*{JOURNAL_SUFFIX}"))):
+                    # Numbered below this process's own segments, so the journal stays in order.
+                    path = os.path.join(self.journal_dir, f"{self.owner}.{0:08d}-{len(adopted):06d}{JOURNAL_SUFFIX}")
+                    os.rename(segment, path)
+                    self._replay(path)
+                    adopted.append(path)
+            # Removed once closed (Windows cannot remove an open file); by then it has no segments
+            # left, so a process that locks it meanwhile adopts nothing and removes it too.
+            self._remove([lock_path])
+        if not self._pending:
+            self._remove(adopted)
+            return []
+        if adopted:
+            print(f"Write-behind: recovered {len(self._pending)} buffered sessions from {len(adopted)} journal segments.")
+        return adopted
+
+    @staticmethod
+    def _remove(paths: List[str]) -> None:
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _read_segment(path: str) -> List[Tuple[str, _Pending]]:
+        updates = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    item = json_util.loads(line)
+                except ValueError:
+                    break  # the last line of a crashed process may be cut short
+                updates.append((item["s"], _Pending(item["f"], item["u"], item["c"])))
+        return updates
+
+    def _replay(self, path: str) -> None:
+        for session_id, entry in self._read_segment(path):
+            _merge_into(self._pending, session_id, entry)
+
+    def journalled(self, session_id: str) -> Optional[_Pending]:
+        """
+        The session's update as buffered by other processes, read from their journal
+        segments. For reads that miss here and in MongoDB: with several workers, the
+        write may sit in another worker's buffer. Remembered for a following write().
+        """
+        entry = self._journals.lookup(session_id)
+        if entry is not None:
+            self._journalled.put(session_id, entry)
+        return entry
+
+    # --- Writes and reads ---
+
+    def write(self, session_id: str, fields: Dict[str, Any], upsert: bool = False, complete: bool = False) -> None:
+        """Buffers a $set of `fields` on the session's record; `complete` marks a whole record."""
+        if VERSION_FIELD in fields:
+            fields = {**fields, VERSION_FIELD: _to_millis(fields[VERSION_FIELD])}
+        entry = _Pending(fields, upsert, complete)
+        with self._lock:
+            over_limit = len(self._pending) >= self.max_pending
+        if over_limit:
+            # MongoDB is not keeping up (or is down): write in the caller until it is.
+            if not self.flush():
+                raise RuntimeError("Write-behind buffer is full and MongoDB is not accepting writes.")
+        with self._lock:
+            if not complete and session_id not in self._pending and session_id not in self._flushing:
+                journalled = self._journalled.pop(session_id)
+                if journalled is not None:
+                    # The record is still unflushed in another process. Updating a document that
+                    # is not stored yet would change nothing, so buffer the whole record with this
+                    # update applied; the flushes keep whichever version is later.
+                    entry = journalled.merge(entry)
+            self._append(session_id, entry)
+            _merge_into(self._pending, session_id, entry)
+            WRITE_BEHIND_PENDING.set(len(self._pending))
+            if len(self._pending) >= self.batch_size:
+                self._wake.notify()
+
+    def pending(self, session_id: str) -> Optional[_Pending]:
+        """The session's buffered update (being flushed or not), or None."""
+        with self._lock:
+            flushing = self._flushing.get(session_id)
+            pending = self._pending.get(session_id)
+        if flushing is not None and pending is not None:
+            return flushing.merge(pending)
+        return pending or flushing
+
+    def __len__(self) -> int:
+        return len(self._pending) + len(self._flushing)
+
+    # --- Flushing ---
+
+    def flush(self) -> bool:
+        """Writes everything buffered so far with one bulk_write; False if it failed and was kept."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return True
+                batch, self._pending = self._pending, {}
+                self._flushing = batch
+                sealed = self._sealed + [self._seal_segment()]
+                self._sealed = []
+            try:
+                with stage_timer("mongo_write"):
+                    self.collection.bulk_write(
+                        [request for session_id, entry in batch.items() for request in _update_requests(session_id, entry)],
+                        ordered=False
+                    )
+            except Exception as e:
+                logger.error("Write-behind flush of %d sessions failed; will retry: %s", len(batch), e)
+                WRITE_BEHIND_FLUSHES.labels("failed").inc()
+                with self._lock:
+                    for session_id, entry in self._pending.items():
+                        _merge_into(batch, session_id, entry)
+                    self._pending, self._flushing = batch, {}
+                    self._sealed = sealed + self._sealed
+                return False
+            with self._lock:
+                self._flushing = {}
+                WRITE_BEHIND_PENDING.set(len(self._pending))
+            WRITE_BEHIND_FLUSHES.labels("written").inc()
+            self._remove(sealed)
+            return True
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                self._wake.wait_for(lambda: self._stopped or len(self._pending) >= self.batch_size, timeout=self.interval_seconds)
+                stopped = self._stopped
+            if stopped:
+                return
+            self.flush()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="write-behind-flusher", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """Stops the flusher and writes what is left; the journal stays if that write fails."""
+        with self._lock:
+            self._stopped = True
+            self._wake.notify()
+        if self._thread is not None:
+            self._thread.join()
+        flushed = self.flush()
+        self._segment.close()
+        if flushed:
+            os.remove(self._segment.name)
+            self._lock_file.close()
+            os.remove(self._lock_file.name)
+        else:
+            self._lock_file.close()  # released, so the next process replays the journal
+
+
+class BufferedCollection:
+    """
+    The "predictions" collection as the endpoints use it, with write-behind. update_one
+    on a single session is buffered and find_one reads through the buffer. Every other
+    operation first flushes the buffer, then goes straight to the collection.
+    An upsert that sets every field in `record_fields` is a whole record, which
+    find_one can then answer without reading MongoDB.
+    """
+    def __init__(self, collection: Any, buffer: WriteBehindBuffer, record_fields: Tuple[str, ...]):
+        self._collection = collection
+        self._buffer = buffer
+        self._record_fields = frozenset(record_fields)
+
+    @staticmethod
+    def _session_only(query: Dict[str, Any]) -> Optional[str]:
+        session_id = query.get("session_id") if len(query) == 1 else None
+        return session_id if isinstance(session_id, str) else None
+
+    def update_one(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False) -> UpdateResult:
+        session_id = self._session_only(query)
+        if session_id is None or set(update) != {"$set"}:
+            self._buffer.flush()
+            return self._collection.update_one(query, update, upsert=upsert)
+        fields = update["$set"]
+        self._buffer.write(session_id, fields, upsert=upsert, complete=upsert and self._record_fields <= fields.keys())
+        return UpdateResult({}, acknowledged=False)
+
+    def find_one(self, query: Dict[str, Any], projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        session_id = self._session_only(query)
+        entry = self._buffer.pending(session_id) if session_id is not None else None
+        if entry is None:
+            if session_id is None:
+                self._buffer.flush()
+                return self._collection.find_one(query, projection)
+            document = self._collection.find_one(query, projection)
+            if document is not None:
+                return document
+            # Not stored yet, perhaps because another worker buffered it (e.g. /predict_exercise
+            # there, /predict_diet here). Its journal has it; read it rather than answer 404.
+            entry = self._buffer.journalled(session_id)
+            if entry is None:
+                # Flushed between the two reads, or really missing.
+                return self._collection.find_one(query, projection)
+
+        if entry.complete:
+            document: Optional[Dict[str, Any]] = {"session_id": session_id}
+        else:
+            document = self._collection.find_one(query, {"_id": 0})
+            if document is None and not entry.upsert:
+                return None  # an update of a record that does not exist changes nothing
+            document = document or {"session_id": session_id}
+        apply_set(document, copy.deepcopy(entry.fields))
+        return apply_projection(document, projection)
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._collection, name)
+        if not callable(attribute):
+            return attribute
+
+        def flushed_first(*args: Any, **kwargs: Any) -> Any:
+            self._buffer.flush()
+            return attribute(*args, **kwargs)
+        return flushed_first
@@ -1,23 +1,39 @@
 # backend/main.py
 import os
 import uuid
+import hashlib
+import secrets
+import asyncio
 import datetime
-import json
-from typing import Optional, Any
-from fastapi import FastAPI, HTTPException, Request, Response, UploadFile, File, Depends
-from fastapi.responses import StreamingResponse
+from contextlib import AsyncExitStack
+from typing import Optional, Any, Literal, TYPE_CHECKING
+from fastapi import FastAPI, HTTPException, Request, Response, UploadFile, File, Depends, Header
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from PIL import Image
 import io
-from config.settings import DB_NAME, IMAGE_CLASSIFIER_MODELS_PATH 
-from database.mongodb_client import connect_to_mongodb, close_mongodb_connection, get_db_collection
-from models.request_models import UserInput, UserPersonalDetails, ReportRequest, DietPlanRequest, ChatRequest
-from services.exercise_service import load_exercise_models, predict_exercise
-from services.diet_service import load_diet_models, predict_diet
-from services.report_service import generate_report as generate_pdf_report
-from models.Image_Classifier_Model.image_classifier_logic import ImageClassifier, DetectionResponse
+from config.settings import ADMIN_TOKEN, DB_NAME, IMAGE_CLASSIFIER_MODELS_PATH, SERVING_MODE, DEPLOYMENT_PROFILE, ENABLED_SUBSYSTEMS, MODEL_RELOAD_INTERVAL_SECONDS, REPORT_EXPORT_BATCH_SIZE, REPORT_EXPORT_MAX_SESSIONS
+from database.mongodb_client import connect_to_mongodb, close_mongodb_connection, get_db_collection, DIET_INPUT_PROJECTION, REPORT_PROJECTION
+from models.request_models import UserInput, UserPersonalDetails, ReportRequest, ReportExportRequest, DietPlanRequest, ChatRequest, PlanBatchRequest, ProfileRequest
+from models.Image_Classifier_Model.image_classifier_logic import DetectionResponse
 from utils.helpers import convert_numpy_types
-from services.rag_service import RAGAssistant, load_rag_knowledge_base, initialize_rag_components 
+from services.inference_service import connect_to_inference_server
+from services.model_registry import model_registry
+from utils.cancellation import GenerationCancelled, request_cancellation
+from utils.scheduler import scheduler
+from utils.single_flight import SingleFlight
+from utils.profiler import ProfilingMiddleware, profiler
+from utils.thread_budget import apply_process_thread_budgets
+from utils.observability import configure_logging, init_tracing, logger, metrics_response, stage_timer, RequestLatencyMiddleware
+
+# Subsystem services are imported where they are used, so a process only pays for the
+# heavy libraries (torch, ultralytics, transformers, langchain, reportlab, sklearn) of
+# the subsystems enabled by DEPLOYMENT_PROFILE.
+if TYPE_CHECKING:
+    from models.Image_Classifier_Model.image_classifier_logic import ImageClassifier
+    from services.rag_service import RAGAssistant
 
 # --- FastAPI App Initialization ---
 app = FastAPI(
@@ -35,9 +51,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-image_classifier_model: Optional[ImageClassifier] = None
-rag_assistant_instance: Optional[RAGAssistant] = None
+configure_logging()
+init_tracing(app)
+
+app.add_middleware(RequestLatencyMiddleware)
+app.add_middleware(ProfilingMiddleware)
+
+image_classifier_model: Optional["ImageClassifier"] = None
+rag_assistant_instance: Optional["RAGAssistant"] = None
 knowledge_base_instance: Any = None 
+model_watch_task: Optional[asyncio.Task] = None
+# Identical requests in flight share one computation (see utils/single_flight.py).
+dish_flights = SingleFlight("classify_dish")
 
 # --- Startup Events ---
 @app.on_event("startup")
@@ -47,7 +72,14 @@ async def startup_all():
     1. Connect to MongoDB.
     2. Load Machine Learning Models (Exercise, Diet, Image Classifier).
     3. Initialize RAG components (Knowledge Base, LLM, Retriever).
+    With SERVING_MODE=inference-client, the image classifier and RAG components are
+    proxies to the shared inference server instead of local copies.
+    Only the subsystems enabled by DEPLOYMENT_PROFILE are loaded.
+    Process-wide thread limits (THREAD_BUDGETS) are applied before anything runs.
     """
+    print(f"Deployment profile '{DEPLOYMENT_PROFILE}': {', '.join(sorted(ENABLED_SUBSYSTEMS))}")
+    apply_process_thread_budgets()
+
     # 1. Connect to MongoDB
     try:
         await connect_to_mongodb()
@@ -57,35 +89,57 @@ async def startup_all():
         raise HTTPException(status_code=500, detail=f"Server startup error: Failed to connect to MongoDB. {e}")
 
     # 2. Load Machine Learning Models
-    try:
-        await load_exercise_models()
-        print("Exercise models loaded successfully!")
-        await load_diet_models()
-        print("Diet models loaded successfully!")
-        
-        global image_classifier_model
-        yolo_model_file_name = "image_classification.pt"
-        full_yolo_model_path = os.path.join(IMAGE_CLASSIFIER_MODELS_PATH, yolo_model_file_name)
-        
+    if "tabular" in ENABLED_SUBSYSTEMS:
+        try:
+            from services.exercise_service import load_exercise_models
+            from services.diet_service import load_diet_models
+            await load_exercise_models()
+            print("Exercise models loaded successfully!")
+            await load_diet_models()
+            print("Diet models loaded successfully!")
+            
+        except HTTPException as e:
+            raise e
+        except Exception as e:
+            print(f"An unexpected error occurred during ML model loading: {e}")
+            raise HTTPException(status_code=500, detail=f"Server startup error: Failed to load ML models. {e}")
+
+    # New versions of the models loaded from files are swapped in without a restart.
+    global image_classifier_model, knowledge_base_instance, rag_assistant_instance, model_watch_task
+    if MODEL_RELOAD_INTERVAL_SECONDS > 0:
+        model_watch_task = asyncio.create_task(model_registry.watch(MODEL_RELOAD_INTERVAL_SECONDS))
+
+    if SERVING_MODE == "inference-client":
+        if not ENABLED_SUBSYSTEMS & {"vision", "rag"}:
+            return
+        try:
+            image_classifier_model, rag_assistant_instance = connect_to_inference_server()
+        except Exception as e:
+            print(f"FATAL ERROR: Could not reach the inference server: {e}")
+            raise HTTPException(status_code=500, detail=f"Server startup error: Failed to connect to the inference server. {e}")
+        return
+
+    if "vision" in ENABLED_SUBSYSTEMS:
+        from models.Image_Classifier_Model.image_classifier_logic import image_classifier_spec
+
+        def swap_image_classifier(bundle):
+            global image_classifier_model
+            image_classifier_model = bundle["classifier"]
+
+        model_registry.register(image_classifier_spec(IMAGE_CLASSIFIER_MODELS_PATH, on_swap=swap_image_classifier))
         try:
-            image_classifier_model = ImageClassifier(model_path=full_yolo_model_path)
-            if image_classifier_model.yolo_model is None:
-                raise RuntimeError("YOLO model did not load correctly within ImageClassifier.")
-            print(f"Image classifier model loaded successfully from {full_yolo_model_path}!")
+            bundle = await model_registry.load("vision")
+            print(f"Image classifier model loaded successfully (version {bundle.version})!")
         except Exception as e:
             print(f"Error loading image classifier model: {e}")
-            image_classifier_model = None 
             print("Warning: Image classification endpoint will not be available.")
 
-    except HTTPException as e:
-        raise e
-    except Exception as e:
-        print(f"An unexpected error occurred during ML model loading: {e}")
-        raise HTTPException(status_code=500, detail=f"Server startup error: Failed to load ML models. {e}")
+    if "rag" not in ENABLED_SUBSYSTEMS:
+        return
 
     # --- NEW: 3. Initialize RAG Components ---
-    global knowledge_base_instance, rag_assistant_instance 
     try:
+        from services.rag_service import load_rag_knowledge_base, initialize_rag_components
         knowledge_base_instance = await load_rag_knowledge_base() 
         rag_assistant_instance = await initialize_rag_components(knowledge_base=knowledge_base_instance)
         print("RAG Assistant components loaded successfully!")
@@ -99,148 +153,326 @@ async def startup_all():
 @app.on_event("shutdown")
 async def shutdown_all():
     """Closes all necessary connections on application shutdown."""
+    if model_watch_task is not None:
+        model_watch_task.cancel()
+    if "reports" in ENABLED_SUBSYSTEMS:
+        from services.report_export import shutdown_render_pool
+        shutdown_render_pool()
+    if "rag" in ENABLED_SUBSYSTEMS:
+        from services.overview_service import cancel_overview_precomputes
+        cancel_overview_precomputes()
+        overview_contexts = getattr(rag_assistant_instance, "overview_contexts", None)
+        if overview_contexts is not None:
+            await run_in_threadpool(overview_contexts.persist)
     await close_mongodb_connection()
     print("Disconnected from MongoDB.")
 
+def require_subsystem(name: str):
+    """Dependency that answers 503 for endpoints of subsystems left out of DEPLOYMENT_PROFILE."""
+    async def dependency():
+        if name not in ENABLED_SUBSYSTEMS:
+            raise HTTPException(status_code=503, detail=f"The '{name}' service is not enabled on this server (DEPLOYMENT_PROFILE={DEPLOYMENT_PROFILE}).")
+    return dependency
+
+async def require_admin(authorization: Optional[str] = Header(None)):
+    """Dependency for /admin/*: a Bearer ADMIN_TOKEN; without one configured the endpoints do not exist."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Admin token required.", headers={"WWW-Authenticate": "Bearer"})
+
+def client_address(request: Request) -> Optional[str]:
+    """Key for the scheduler's rate limits. Session ids are client-chosen, so they would not limit anyone."""
+    return request.client.host if request.client else None
+
 # --- Dependency to get the RAG Assistant instance ---
 async def get_rag_assistant_dependency():
+    if "rag" not in ENABLED_SUBSYSTEMS:
+        raise HTTPException(status_code=503, detail=f"AI services are not enabled on this server (DEPLOYMENT_PROFILE={DEPLOYMENT_PROFILE}).")
     if rag_assistant_instance is None:
         raise HTTPException(status_code=503, detail="AI services are not initialized or failed to load during startup.")
     return rag_assistant_instance
 
+def schedule_overview_precompute_if_enabled(session_id: str) -> None:
+    """Starts the session's /ai/overview in the background when this process serves the AI endpoints."""
+    if "rag" in ENABLED_SUBSYSTEMS and rag_assistant_instance is not None:
+        from services.overview_service import schedule_overview_precompute
+        schedule_overview_precompute(rag_assistant_instance, session_id)
+
 # --- API Endpoints ---
 
 @app.get("/")
 async def read_root():
     return {"message": "Welcome to the Fitness and Diet Prediction API!"}
 
-@app.post("/predict_exercise")
-async def predict_exercise_plan_endpoint(user_input: UserInput):
-    predictions_collection = get_db_collection("predictions")
-    exercise_predictions = predict_exercise(user_input)
-    prediction_record = {
-        "session_id": user_input.session_id,
-        "timestamp": datetime.datetime.utcnow(),
-        "raw_user_input": convert_numpy_types(user_input.dict()),
-        "processed_features": None,
-        "exercise_predictions": convert_numpy_types(exercise_predictions),
-        "diet_predictions": {}
-    }
-    from services.exercise_service import preprocess_user_data_for_exercise, label_encoders as exercise_label_encoders
-    if exercise_label_encoders is None:
-          raise HTTPException(status_code=500, detail="Exercise label encoders not loaded during initial startup.")
-    
-    _, processed_core_features = preprocess_user_data_for_exercise(user_input)
-    prediction_record["processed_features"] = convert_numpy_types(processed_core_features)
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    return metrics_response()
+
+@app.get("/models")
+async def model_versions_endpoint():
+    """Model versions currently served by this worker."""
+    return model_registry.versions()
 
+@app.post("/admin/profile", include_in_schema=False, dependencies=[Depends(require_admin)])
+async def start_profile_endpoint(profile_request: ProfileRequest):
+    """Profiles this worker's next requests to one endpoint; see utils/profiler.py."""
     try:
-        predictions_collection.update_one(
-            {"session_id": user_input.session_id},
-            {"$set": prediction_record},
-            upsert=True
-        )
-        print(f"Exercise predictions for session {user_input.session_id} stored/updated in MongoDB.")
-    except Exception as e:
-        print(f"Error storing exercise predictions in MongoDB: {e}")
-        print(f"Invalid document: {prediction_record}")
-        raise HTTPException(status_code=500, detail=f"Failed to store exercise predictions in database: {e}")
+        session = profiler.start(profile_request.endpoint, profile_request.requests, profile_request.seconds,
+                                 profile_request.sample_interval_ms, profile_request.torch_ops)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return session.summary()
+
+@app.get("/admin/profile", include_in_schema=False, dependencies=[Depends(require_admin)])
+async def profile_status_endpoint():
+    if profiler.last is None:
+        raise HTTPException(status_code=404, detail="No profile has been started on this worker.")
+    return profiler.last.summary()
+
+@app.get("/admin/profile/stacks", include_in_schema=False, dependencies=[Depends(require_admin)])
+async def profile_stacks_endpoint(kind: Literal["python", "torch"] = "python"):
+    """Folded stacks of the latest profile, for flamegraph.pl, speedscope or inferno."""
+    if profiler.last is None:
+        raise HTTPException(status_code=404, detail="No profile has been started on this worker.")
+    return PlainTextResponse(profiler.last.folded(kind))
+
+@app.delete("/admin/profile", include_in_schema=False, dependencies=[Depends(require_admin)])
+async def stop_profile_endpoint():
+    session = profiler.stop()
+    if session is None:
+        raise HTTPException(status_code=404, detail="No profile has been started on this worker.")
+    return session.summary()
+
+@app.post("/predict_exercise", dependencies=[Depends(require_subsystem("tabular"))])
+async def predict_exercise_plan_endpoint(user_input: UserInput, request: Request):
+    from services.exercise_service import predict_exercise, preprocess_user_data_for_exercise, get_exercise_bundle
+    async with scheduler.slot("tabular", client_address(request)):
+        predictions_collection = get_db_collection("predictions")
+        # The whole request uses one model version, even if a new one is swapped in meanwhile.
+        exercise_bundle = get_exercise_bundle()
+        if exercise_bundle is None:
+              raise HTTPException(status_code=500, detail="Exercise label encoders not loaded during initial startup.")
+        exercise_predictions = predict_exercise(user_input, exercise_bundle)
+        now = datetime.datetime.utcnow()
+        prediction_record = {
+            "session_id": user_input.session_id,
+            "timestamp": now,
+            "last_updated": now,
+            "raw_user_input": convert_numpy_types(user_input.dict()),
+            "processed_features": None,
+            "exercise_predictions": convert_numpy_types(exercise_predictions),
+            "diet_predictions": {},
+            "model_versions": {"exercise": exercise_bundle.version}
+        }
+    
+        _, processed_core_features = preprocess_user_data_for_exercise(user_input, exercise_bundle["encoders"])
+        prediction_record["processed_features"] = convert_numpy_types(processed_core_features)
+
+        try:
+            with stage_timer("mongo_write"):
+                predictions_collection.update_one(
+                    {"session_id": user_input.session_id},
+                    {"$set": prediction_record},
+                    upsert=True
+                )
+            logger.debug("Exercise predictions for session %s stored/updated in MongoDB.", user_input.session_id)
+        except Exception as e:
+            logger.error("Error storing exercise predictions in MongoDB: %s", e)
+            logger.debug("Invalid document: %s", prediction_record)
+            raise HTTPException(status_code=500, detail=f"Failed to store exercise predictions in database: {e}")
 
-    return {
-        "session_id": user_input.session_id,
-        "exercise_plan": exercise_predictions,
-        "message": "Exercise plan generated. You can now generate a diet plan with more details if desired."
-    }
+        return {
+            "session_id": user_input.session_id,
+            "exercise_plan": exercise_predictions,
+            "message": "Exercise plan generated. You can now generate a diet plan with more details if desired."
+        }
 
-@app.post("/predict_diet")
-async def predict_diet_plan_endpoint(diet_request: DietPlanRequest):
-    predictions_collection = get_db_collection("predictions")
-    prediction_record = predictions_collection.find_one({"session_id": diet_request.session_id})
+@app.post("/predict_diet", dependencies=[Depends(require_subsystem("tabular"))])
+async def predict_diet_plan_endpoint(diet_request: DietPlanRequest, request: Request):
+    from services.diet_service import predict_diet, get_diet_bundle
+    async with scheduler.slot("tabular", client_address(request)):
+        predictions_collection = get_db_collection("predictions")
+        with stage_timer("mongo_read"):
+            prediction_record = predictions_collection.find_one({"session_id": diet_request.session_id}, DIET_INPUT_PROJECTION)
 
-    if not prediction_record:
-        raise HTTPException(status_code=404, detail=f"No exercise predictions found for session ID: {diet_request.session_id}. Please submit initial user data first.")
+        if not prediction_record:
+            raise HTTPException(status_code=404, detail=f"No exercise predictions found for session ID: {diet_request.session_id}. Please submit initial user data first.")
 
-    processed_core_features = prediction_record.get('processed_features', {})
-    exercise_predictions = prediction_record.get('exercise_predictions', {})
-    raw_user_input = prediction_record.get('raw_user_input', {})
+        processed_core_features = prediction_record.get('processed_features', {})
+        exercise_predictions = prediction_record.get('exercise_predictions', {})
+        raw_user_input = prediction_record.get('raw_user_input', {})
 
-    if not processed_core_features or not exercise_predictions:
-        raise HTTPException(status_code=500, detail="Incomplete stored data for session. Cannot generate diet plan.")
+        if not processed_core_features or not exercise_predictions:
+            raise HTTPException(status_code=500, detail="Incomplete stored data for session. Cannot generate diet plan.")
 
-    diet_predictions = predict_diet(processed_core_features, exercise_predictions, raw_user_input)
+        diet_bundle = get_diet_bundle()
+        diet_predictions = predict_diet(processed_core_features, exercise_predictions, raw_user_input, diet_bundle)
 
+        try:
+            with stage_timer("mongo_write"):
+                predictions_collection.update_one(
+                    {"session_id": diet_request.session_id},
+                    {"$set": {
+                        "diet_predictions": convert_numpy_types(diet_predictions),
+                        "model_versions.diet": diet_bundle.version if diet_bundle else None,
+                        "last_updated": datetime.datetime.utcnow()
+                    }}
+                )
+            logger.debug("Diet predictions for session %s updated in MongoDB.", diet_request.session_id)
+        except Exception as e:
+            logger.error("Error updating diet predictions in MongoDB: %s", e)
+            logger.debug("Invalid diet document for update: %s", diet_predictions)
+            raise HTTPException(status_code=500, detail=f"Failed to update diet predictions in database: {e}")
+
+        schedule_overview_precompute_if_enabled(diet_request.session_id)
+        return {
+            "session_id": diet_request.session_id,
+            "diet_plan": diet_predictions,
+            "message": "Diet plan generated successfully!"
+        }
+
+@app.post("/plan", dependencies=[Depends(require_subsystem("tabular"))])
+async def plan_endpoint(user_input: UserInput, request: Request):
+    """Exercise and diet plan in one request; same result as /predict_exercise followed by /predict_diet."""
+    from services.plan_service import build_plan_records, store_plan_records, plan_response
+    async with scheduler.slot("tabular", client_address(request)):
+        record = build_plan_records([user_input])[0]
+        try:
+            store_plan_records(get_db_collection("predictions"), [record])
+            logger.debug("Plan for session %s stored/updated in MongoDB.", user_input.session_id)
+        except Exception as e:
+            logger.error("Error storing plan in MongoDB: %s", e)
+            raise HTTPException(status_code=500, detail=f"Failed to store plan in database: {e}")
+
+        schedule_overview_precompute_if_enabled(user_input.session_id)
+        return {**plan_response(record), "message": "Exercise and diet plans generated successfully!"}
+
+@app.post("/plan/batch", dependencies=[Depends(require_subsystem("tabular"))])
+async def plan_batch_endpoint(batch_request: PlanBatchRequest, request: Request):
+    """/plan for several users: one model call per model and one bulk write for the whole batch."""
+    from services.plan_service import build_plan_records, store_plan_records, plan_response
+    session_ids = [user.session_id for user in batch_request.users]
+    if len(set(session_ids)) != len(session_ids):
+        raise HTTPException(status_code=400, detail="Each user in a batch needs its own session_id.")
+
+    async with scheduler.slot("tabular", client_address(request)):
+        records = await run_in_threadpool(build_plan_records, batch_request.users)
+        try:
+            await run_in_threadpool(store_plan_records, get_db_collection("predictions"), records)
+        except Exception as e:
+            logger.error("Error storing plan batch in MongoDB: %s", e)
+            raise HTTPException(status_code=500, detail=f"Failed to store plans in database: {e}")
+
+        return {"plans": [plan_response(record) for record in records]}
+
+@app.post("/generate_report", response_class=Response, dependencies=[Depends(require_subsystem("reports"))])
+async def generate_report_endpoint(request: Request, report_request: ReportRequest):
+    from services.report_service import generate_report as generate_pdf_report
+    async with scheduler.slot("reports", client_address(request)):
+        return await generate_pdf_report(report_request)
+
+@app.get("/reports/{session_id}", response_class=Response, dependencies=[Depends(require_subsystem("reports"))])
+async def get_report_endpoint(session_id: str, request: Request, if_none_match: Optional[str] = Header(None)):
+    """
+    The session's report as a cacheable GET: a matching If-None-Match gets 304. It has no
+    personal details section, which would put them in URLs and access logs; reports with
+    one come from POST /generate_report.
+    """
+    from services.report_service import report_response
+    async with scheduler.slot("reports", client_address(request)):
+        return await report_response(session_id, None, if_none_match)
+
+@app.post("/reports/export", response_class=StreamingResponse, dependencies=[Depends(require_subsystem("reports")), Depends(require_admin)])
+async def export_reports_endpoint(request: Request, export_request: ReportExportRequest):
+    """Bulk export of any sessions' reports, so admin-only like /admin/*."""
+    from services.report_export import export_query, stream_report_zip
+    query = export_query(export_request)
     try:
-        predictions_collection.update_one(
-            {"session_id": diet_request.session_id},
-            {"$set": {
-                "diet_predictions": convert_numpy_types(diet_predictions),
-                "last_updated": datetime.datetime.utcnow()
-            }}
-        )
-        print(f"Diet predictions for session {diet_request.session_id} updated in MongoDB.")
+        predictions_collection = get_db_collection("predictions")
     except Exception as e:
-        print(f"Error updating diet predictions in MongoDB: {e}")
-        print(f"Invalid diet document for update: {convert_numpy_types(diet_predictions)}")
-        raise HTTPException(status_code=500, detail=f"Failed to update diet predictions in database: {e}")
-
-    return {
-        "session_id": diet_request.session_id,
-        "diet_plan": diet_predictions,
-        "message": "Diet plan generated successfully!"
-    }
-
-@app.post("/generate_report", response_class=StreamingResponse)
-async def generate_report_endpoint(report_request: ReportRequest):
-    return await generate_pdf_report(report_request)
-
-@app.post("/classify_dish", response_model=DetectionResponse)
-async def classify_dish_endpoint(file: UploadFile = File(...)):
-    if image_classifier_model is None:
+        raise HTTPException(status_code=500, detail=f"Database error: {e}")
+
+    # The slot is taken before the response starts, so a busy server still answers 503,
+    # and is held until the whole archive has been sent.
+    slot = AsyncExitStack()
+    await slot.enter_async_context(scheduler.slot("reports", client_address(request)))
+    cursor = predictions_collection.find(query, REPORT_PROJECTION).batch_size(REPORT_EXPORT_BATCH_SIZE).limit(REPORT_EXPORT_MAX_SESSIONS)
+
+    async def archive():
+        try:
+            async for chunk in stream_report_zip(cursor, export_request.session_ids):
+                yield chunk
+        finally:
+            await slot.aclose()
+
+    filename = f"Fitness_Reports_{datetime.date.today()}.zip"
+    # The background task releases the slot if the stream never started.
+    return StreamingResponse(archive(), media_type="application/zip", background=BackgroundTask(slot.aclose),
+                             headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+@app.post("/classify_dish", response_model=DetectionResponse, dependencies=[Depends(require_subsystem("vision"))])
+async def classify_dish_endpoint(request: Request, file: UploadFile = File(...)):
+    classifier = image_classifier_model  # keep this version for the whole request
+    if classifier is None:
         raise HTTPException(status_code=500, detail="Dish detection model is not loaded or available.")
 
     if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="Invalid file type. Please upload an image.")
 
-    try:
-        image_bytes = await file.read()
-        detection_response = image_classifier_model.predict_dish_from_image(image_bytes)
-        return detection_response
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Dish detection failed: {str(e)}")
+    image_bytes = await file.read()
 
-@app.post("/ai/overview")
-async def get_ai_overview_endpoint(chat_request: ChatRequest, rag: RAGAssistant = Depends(get_rag_assistant_dependency)):
-    predictions_collection = get_db_collection("predictions")
-    session_id = chat_request.session_id
+    async def detect_dish() -> DetectionResponse:
+        async with scheduler.slot("vision", client_address(request)):
+            try:
+                return await run_in_threadpool(classifier.predict_dish_from_image, image_bytes)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Dish detection failed: {str(e)}")
 
-    user_data_record = predictions_collection.find_one({"session_id": session_id})
+    # Clients retry slow uploads; a retry of the same image joins the detection already running.
+    return await dish_flights.do(hashlib.sha256(image_bytes).hexdigest(), detect_dish)
 
-    if not user_data_record:
-        raise HTTPException(status_code=404, detail=f"No fitness data found for session ID: {session_id}. Please submit your personal details and generate a plan first.")
+def cancelled_generation_error(e: GenerationCancelled) -> HTTPException:
+    # 499 is the de-facto "client closed request" status; nobody reads the body, but it keeps metrics honest.
+    if e.reason == "deadline":
+        return HTTPException(status_code=504, detail="The AI response took too long and was cancelled. Please try again.")
+    return HTTPException(status_code=499, detail="Client disconnected; AI response cancelled.")
 
-    user_data_for_llm = {
-        k: v for k, v in user_data_record.items() 
-        if k not in ["_id", "timestamp", "processed_features"]
-    }
-    user_data_context_str = json.dumps(user_data_for_llm, indent=2)
+@app.post("/ai/overview")
+async def get_ai_overview_endpoint(chat_request: ChatRequest, request: Request, rag: Any = Depends(get_rag_assistant_dependency)):
+    from services.overview_service import get_overview
+    session_id = chat_request.session_id
 
     try:
-        response = await rag.get_initial_overview(user_data_context_str)
-        return {"response": response}
+        async with request_cancellation(request):
+            # Usually precomputed when the plan was stored. Otherwise a request joins a generation
+            # already running for the same record (the frontend asks twice on mount, or the
+            # background precompute is still going).
+            return await get_overview(rag, session_id, client_key=client_address(request))
+    except HTTPException:
+        raise
+    except GenerationCancelled as e:
+        raise cancelled_generation_error(e)
     except Exception as e:
-        print(f"Error generating AI overview for session {session_id}: {e}")
+        logger.error("Error generating AI overview for session %s: %s", session_id, e)
         raise HTTPException(status_code=500, detail=f"Failed to generate AI overview: {str(e)}")
 
 @app.post("/ai/chat")
-async def ai_chat_endpoint(chat_request: ChatRequest, rag: RAGAssistant = Depends(get_rag_assistant_dependency)):
+async def ai_chat_endpoint(chat_request: ChatRequest, request: Request, rag: Any = Depends(get_rag_assistant_dependency)):
     """
     Handles follow-up questions within the AI chat interface.
     """
     user_question = chat_request.message
     session_id = chat_request.session_id 
 
-    try:
-        response = await rag.chat_with_ai(user_question, session_id)
-        return {"response": response}
-    except Exception as e:
-        print(f"Error processing AI chat message for session {session_id}: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to process AI chat message: {str(e)}")
\ No newline at end of file
+    async with scheduler.slot("llm", client_address(request)):
+        try:
+            async with request_cancellation(request):
+                response = await rag.chat_with_ai(user_question, session_id)
+            return {"response": response}
+        except GenerationCancelled as e:
+            raise cancelled_generation_error(e)
+        except Exception as e:
+            logger.error("Error processing AI chat message for session %s: %s", session_id, e)
+            raise HTTPException(status_code=500, detail=f"Failed to process AI chat message: {str(e)}")
\ No newline at end of file
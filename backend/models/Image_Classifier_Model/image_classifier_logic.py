@@ -3,9 +3,14 @@
 import os
 import io
 from PIL import Image
-from typing import List, Dict, Union, Any, Optional
-from ultralytics import YOLO
+from typing import Callable, List, Dict, Union, Any, Optional, TYPE_CHECKING
 from pydantic import BaseModel
+from utils.observability import stage_timer
+from utils.profiler import op_profile
+from utils.thread_budget import thread_budget
+
+if TYPE_CHECKING:
+    from ultralytics import YOLO
 
 
 class DishInfo(BaseModel):
@@ -51,12 +56,14 @@ DISH_DATABASE = {
 
 class ImageClassifier:
     def __init__(self, model_path: str):
-        self.yolo_model: Optional[YOLO] = None
+        self.yolo_model: Optional["YOLO"] = None
         self.model_path = model_path
         self._load_model()
 
     def _load_model(self):
         try:
+            # Imported here so processes without the vision subsystem never load ultralytics/torch.
+            from ultralytics import YOLO
             self.yolo_model = YOLO(self.model_path)
             print(f"YOLOv8 model loaded successfully from {self.model_path}")
         except Exception as e:
@@ -68,9 +75,12 @@ class ImageClassifier:
             raise Exception("Image detection model is not loaded. Cannot perform prediction.")
 
         try:
-            img = Image.open(io.BytesIO(image_bytes))
+            with stage_timer("yolo_decode"):
+                img = Image.open(io.BytesIO(image_bytes))
+                img.load()
 
-            results = self.yolo_model.predict(source=img, conf=0.4, iou=0.7, imgsz=640, verbose=False)
+            with stage_timer("yolo_infer"), thread_budget("vision"), op_profile("yolo"):
+                results = self.yolo_model.predict(source=img, conf=0.4, iou=0.7, imgsz=640, verbose=False)
 
             best_dish_info: Optional[DishInfo] = None
             max_confidence = -1.0 
@@ -110,4 +120,40 @@ class ImageClassifier:
                 )
 
         except Exception as e:
-            raise Exception(f"An error occurred during dish prediction: {e}")
\ No newline at end of file
+            raise Exception(f"An error occurred during dish prediction: {e}")
+
+
+def load_image_classifier(model_path: str) -> Optional[ImageClassifier]:
+    """Loads the YOLO dish classifier, returning None (endpoint disabled) if it fails."""
+    try:
+        classifier = ImageClassifier(model_path=model_path)
+        if classifier.yolo_model is None:
+            raise RuntimeError("YOLO model did not load correctly within ImageClassifier.")
+        print(f"Image classifier model loaded successfully from {model_path}!")
+        return classifier
+    except Exception as e:
+        print(f"Error loading image classifier model: {e}")
+        print("Warning: Image classification endpoint will not be available.")
+        return None
+
+
+IMAGE_CLASSIFIER_MODEL_FILE = "image_classification.pt"
+
+
+def _load_image_classifier_objects(paths: Dict[str, str]) -> Dict[str, Any]:
+    classifier = ImageClassifier(model_path=paths[IMAGE_CLASSIFIER_MODEL_FILE])
+    if classifier.yolo_model is None:
+        raise RuntimeError("YOLO model did not load correctly within ImageClassifier.")
+    return {"classifier": classifier}
+
+
+def _warm_up_image_classifier(objects: Dict[str, Any]) -> None:
+    blank = io.BytesIO()
+    Image.new("RGB", (640, 480), (255, 255, 255)).save(blank, format="JPEG")
+    objects["classifier"].predict_dish_from_image(blank.getvalue())
+
+
+def image_classifier_spec(models_dir: str, on_swap: Callable[[Any], None]) -> Any:
+    """Model registry entry for the dish classifier; `on_swap` receives each new version."""
+    from services.model_registry import ModelSpec
+    return ModelSpec("vision", models_dir, [IMAGE_CLASSIFIER_MODEL_FILE], _load_image_classifier_objects, _warm_up_image_classifier, on_swap=on_swap)
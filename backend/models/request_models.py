@@ -1,6 +1,8 @@
 # backend/models/request_models.py
-from typing import Optional, Literal
+import datetime
+from typing import List, Optional, Literal
 from pydantic import BaseModel, Field
+from config.settings import PLAN_BATCH_MAX_SIZE, PROFILE_MAX_SECONDS, REPORT_EXPORT_MAX_SESSIONS
 
 class UserInput(BaseModel):
     session_id: str = Field(..., description="Unique session ID from frontend to track user's predictions.")
@@ -13,6 +15,10 @@ class UserInput(BaseModel):
     calories_intake: int = Field(..., gt=0, description="User's daily calorie intake.")
 
 
+class PlanBatchRequest(BaseModel):
+    users: List[UserInput] = Field(..., min_length=1, max_length=PLAN_BATCH_MAX_SIZE, description="Users to build exercise and diet plans for, one session each.")
+
+
 class UserPersonalDetails(BaseModel):
     first_name: Optional[str] = None
     last_name: Optional[str] = None
@@ -23,6 +29,22 @@ class ReportRequest(BaseModel):
     session_id: str = Field(..., description="Session ID to retrieve stored predictions.")
     user_details: Optional[UserPersonalDetails] = None
 
+class ReportExportFilter(BaseModel):
+    session_id_prefix: Optional[str] = Field(None, min_length=1, description="Export sessions whose ID starts with this prefix.")
+    updated_after: Optional[datetime.datetime] = Field(None, description="Export sessions last updated at or after this time (UTC if no offset is given).")
+    updated_before: Optional[datetime.datetime] = Field(None, description="Export sessions last updated before this time (UTC if no offset is given).")
+
+class ReportExportRequest(BaseModel):
+    session_ids: Optional[List[str]] = Field(None, min_length=1, max_length=REPORT_EXPORT_MAX_SESSIONS, description="Sessions to export; give either this or filter.")
+    filter: Optional[ReportExportFilter] = None
+
+class ProfileRequest(BaseModel):
+    endpoint: str = Field(..., pattern=r"^/", description="Path of the endpoint to profile, e.g. /ai/chat.")
+    requests: Optional[int] = Field(20, gt=0, description="Profile this many requests; null profiles every request until the time box ends.")
+    seconds: float = Field(60, gt=0, le=PROFILE_MAX_SECONDS, description="Stop after this many seconds even if fewer requests arrived.")
+    sample_interval_ms: Optional[float] = Field(None, ge=1, le=1000, description="Stack sampling period; defaults to PROFILE_SAMPLE_INTERVAL_MS.")
+    torch_ops: bool = Field(True, description="Also record torch operator timings for LLM generation and YOLO inference.")
+
 class DietPlanRequest(BaseModel):
     session_id: str = Field(..., description="Session ID to retrieve previous exercise predictions and user data.")
 
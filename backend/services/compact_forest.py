@@ -0,0 +1,369 @@
+# backend/services/compact_forest.py
+"""
+Compact runtime for the scikit-learn random forests under models/.
+
+A pickled forest is hundreds of DecisionTree objects, and sklearn predicts with a
+joblib dispatch per tree, which dominates single-row latency. Here each forest is
+flattened into a few contiguous node arrays: left and right child, split feature,
+threshold, and leaf values. All trees are concatenated, and leaves point to
+themselves, so one row is routed through every tree at once with max_depth
+vectorized steps. The arrays are stored as .npy files next to the pickle and
+memory-mapped, so worker processes share their pages instead of each unpickling
+its own copy.
+
+Predictions equal sklearn's bit for bit. Rows are cast to float32 and compared with
+the float64 thresholds, as in sklearn's tree code. Leaf values are summed tree by
+tree in order (np.cumsum, not np.sum's pairwise sum) and divided by the tree count.
+That is what sklearn does when it predicts sequentially; with n_jobs > 1, sklearn's
+own sums are added in thread completion order. A forest is only written after it
+matched the pickle on a test set, and load_forest() falls back to the pickle
+whenever that is not possible.
+
+Usage (from backend/), to convert ahead of time instead of on first load:
+    python -m services.compact_forest models/Exercise_Models/multi_classifier.pkl
+"""
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import joblib
+import numpy as np
+
+from config.settings import COMPACT_FORESTS_ENABLED
+from utils.thread_budget import limit_estimator_jobs
+
+FORMAT_VERSION = 1
+FOREST_SUFFIX = ".forest"
+META_FILE = "meta.json"
+# Random rows checked against the pickle, on top of rows placed on every split threshold.
+VERIFY_RANDOM_ROWS = 2000
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def forest_dir_for(pickle_path: str) -> str:
+    return os.path.splitext(pickle_path)[0] + FOREST_SUFFIX
+
+
+# --- Conversion ---
+
+def _is_forest(model: Any) -> bool:
+    estimators = getattr(model, "estimators_", None)
+    return bool(estimators) and all(hasattr(tree, "tree_") for tree in estimators)
+
+
+def _flatten_forest(forest: Any, is_classifier: bool) -> Dict[str, Any]:
+    """Node arrays for one fitted forest (RandomForest*/ExtraTrees*)."""
+    trees = [estimator.tree_ for estimator in forest.estimators_]
+    offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+    left, right, feature, threshold, value = [], [], [], [], []
+    for offset, tree in zip(offsets, trees):
+        nodes = np.arange(tree.node_count)
+        is_leaf = tree.children_left == -1
+        left.append(np.where(is_leaf, nodes, tree.children_left) + offset)
+        right.append(np.where(is_leaf, nodes, tree.children_right) + offset)
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        threshold.append(np.where(is_leaf, 0.0, tree.threshold))
+        # The same values DecisionTree*.predict(_proba) reads from tree_.predict().
+        value.append(tree.value if is_classifier else tree.value[:, :, 0])
+
+    arrays = {
+        "left": np.concatenate(left).astype(np.int32),
+        "right": np.concatenate(right).astype(np.int32),
+        "feature": np.concatenate(feature).astype(np.int32),
+        "threshold": np.concatenate(threshold).astype(np.float64),
+        "value": np.ascontiguousarray(np.concatenate(value), dtype=np.float64),
+        "roots": offsets[:-1].astype(np.int32),
+    }
+    meta: Dict[str, Any] = {
+        "n_trees": len(trees),
+        "max_depth": int(max(tree.max_depth for tree in trees)),
+        "n_outputs": int(forest.n_outputs_),
+        "n_classes": None,
+    }
+    if is_classifier:
+        classes = forest.classes_ if forest.n_outputs_ > 1 else [forest.classes_]
+        for k, output_classes in enumerate(classes):
+            if output_classes.dtype == object:
+                raise ValueError("Forests with object-typed class labels are not supported.")
+            arrays[f"classes_{k}"] = np.asarray(output_classes)
+        meta["n_classes"] = [len(output_classes) for output_classes in classes]
+    return {"arrays": arrays, "meta": meta}
+
+
+def convert_model(model: Any) -> "CompactForest":
+    """A CompactForest (in memory) for a forest or a MultiOutput* wrapper of forests."""
+    from sklearn.base import is_classifier
+
+    classifier = bool(is_classifier(model))
+    if _is_forest(model):
+        forests, wrapper = [model], False
+    elif hasattr(model, "estimators_") and all(_is_forest(estimator) for estimator in model.estimators_):
+        forests, wrapper = list(model.estimators_), True
+    else:
+        raise ValueError(f"{type(model).__name__} is not a forest or a MultiOutput wrapper of forests.")
+
+    flattened = [_flatten_forest(forest, classifier) for forest in forests]
+    feature_names = getattr(model, "feature_names_in_", getattr(forests[0], "feature_names_in_", None))
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "kind": "classifier" if classifier else "regressor",
+        "multioutput_wrapper": wrapper,
+        "n_features": int(forests[0].n_features_in_),
+        "feature_names": [str(name) for name in feature_names] if feature_names is not None else None,
+        "forests": [item["meta"] for item in flattened],
+    }
+    return CompactForest(meta, [item["arrays"] for item in flattened])
+
+
+def verification_rows(compact: "CompactForest", random_rows: int = VERIFY_RANDOM_ROWS, seed: int = 0) -> np.ndarray:
+    """Random rows spanning every feature's split range, plus rows just below, on and above each threshold."""
+    rng = np.random.default_rng(seed)
+    n_features = compact.n_features
+    thresholds: List[List[float]] = [[] for _ in range(n_features)]
+    for forest in compact.forests:
+        internal = forest.left != np.arange(len(forest.left))
+        for feature, threshold in zip(forest.feature[internal], forest.threshold[internal]):
+            thresholds[feature].append(threshold)
+
+    low = np.array([min(values) - 1.0 if values else 0.0 for values in thresholds])
+    high = np.array([max(values) + 1.0 if values else 1.0 for values in thresholds])
+    rows = [rng.uniform(low, high, size=(random_rows, n_features))]
+    base = rng.uniform(low, high, size=n_features)
+    for feature, values in enumerate(thresholds):
+        for threshold in values[:500]:
+            at = np.float32(threshold)
+            for candidate in (np.nextafter(at, np.float32(-np.inf)), at, np.nextafter(at, np.float32(np.inf))):
+                row = base.copy()
+                row[feature] = candidate
+                rows.append(row[None, :])
+    return np.vstack(rows)
+
+
+@contextmanager
+def _sequential_reference(model: Any) -> Iterator[Any]:
+    """The pickle with every forest at n_jobs=1 for the block, so its sums are in tree order."""
+    estimators = [estimator for estimator in [model] + list(getattr(model, "estimators_", [])) if hasattr(estimator, "n_jobs")]
+    previous = [estimator.n_jobs for estimator in estimators]
+    for estimator in estimators:
+        estimator.n_jobs = 1
+    try:
+        yield model
+    finally:
+        for estimator, n_jobs in zip(estimators, previous):
+            estimator.n_jobs = n_jobs
+
+
+def verify(model: Any, compact: "CompactForest", rows: Optional[np.ndarray] = None) -> int:
+    """Rows where the compact forest's predictions differ from the pickle's (0 means bit-for-bit equal)."""
+    import pandas as pd
+
+    rows = verification_rows(compact) if rows is None else rows
+    X = pd.DataFrame(rows, columns=compact.feature_names) if compact.feature_names else rows
+    with _sequential_reference(model) as reference:
+        expected = np.asarray(reference.predict(X))
+    actual = compact.predict(X)
+    if expected.shape != actual.shape or expected.dtype != actual.dtype:
+        return len(rows)
+    equal = (expected == actual).reshape(len(rows), -1)
+    return int(np.count_nonzero(~equal.all(axis=1)))
+
+
+# --- Runtime ---
+
+class _FlatForest:
+    def __init__(self, meta: Dict[str, Any], arrays: Dict[str, np.ndarray]):
+        self.n_trees = meta["n_trees"]
+        self.max_depth = meta["max_depth"]
+        self.n_outputs = meta["n_outputs"]
+        self.n_classes = meta["n_classes"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        self.classes = [arrays[f"classes_{k}"] for k in range(len(self.n_classes))] if self.n_classes else None
+
+    def mean_leaf_value(self, X: np.ndarray) -> np.ndarray:
+        """The forest average of the leaf values each row reaches, summed in tree order."""
+        node = np.repeat(self.roots[None, :], len(X), axis=0)
+        rows = np.arange(len(X))[:, None]
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        total = np.cumsum(self.value[node], axis=1)[:, -1]
+        total /= self.n_trees
+        return total
+
+    def predict_classes(self, X: np.ndarray) -> np.ndarray:
+        proba = self.mean_leaf_value(X)
+        if self.n_outputs == 1:
+            return self.classes[0].take(np.argmax(proba[:, 0, :self.n_classes[0]], axis=1), axis=0)
+        predictions = np.empty((len(X), self.n_outputs), dtype=self.classes[0].dtype)
+        for k in range(self.n_outputs):
+            predictions[:, k] = self.classes[k].take(np.argmax(proba[:, k, :self.n_classes[k]], axis=1), axis=0)
+        return predictions
+
+    def predict_values(self, X: np.ndarray) -> np.ndarray:
+        values = self.mean_leaf_value(X)
+        return values[:, 0] if self.n_outputs == 1 else values
+
+
+class CompactForest:
+    """Drop-in predict() for a converted forest or MultiOutput* wrapper of forests."""
+    def __init__(self, meta: Dict[str, Any], arrays: List[Dict[str, np.ndarray]]):
+        self.meta = meta
+        self.is_classifier = meta["kind"] == "classifier"
+        self.n_features = meta["n_features"]
+        self.feature_names = meta["feature_names"]
+        self.forests = [_FlatForest(forest_meta, forest_arrays) for forest_meta, forest_arrays in zip(meta["forests"], arrays)]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for forest in self.forests for array in (forest.left, forest.right, forest.feature, forest.threshold, forest.value, forest.roots))
+
+    def _as_float32(self, X: Any) -> np.ndarray:
+        if self.feature_names is not None and hasattr(X, "columns"):
+            X = X[self.feature_names]
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"X has shape {X.shape}, but this forest expects {self.n_features} features.")
+        if not np.isfinite(X).all():
+            raise ValueError("Input X contains NaN or infinity.")
+        return X
+
+    def predict(self, X: Any) -> np.ndarray:
+        X = self._as_float32(X)
+        predict_one = (lambda forest: forest.predict_classes(X)) if self.is_classifier else (lambda forest: forest.predict_values(X))
+        if self.meta["multioutput_wrapper"]:
+            return np.asarray([predict_one(forest) for forest in self.forests]).T
+        return predict_one(self.forests[0])
+
+    def save(self, directory: str, source_sha256: str) -> None:
+        """Writes the arrays and meta.json to `directory`, replacing whatever is there."""
+        parent = os.path.dirname(os.path.abspath(directory))
+        staging = tempfile.mkdtemp(prefix=os.path.basename(directory) + ".", dir=parent)
+        try:
+            for index, forest in enumerate(self.forests):
+                forest_dir = os.path.join(staging, str(index))
+                os.makedirs(forest_dir)
+                arrays = {"left": forest.left, "right": forest.right, "feature": forest.feature,
+                          "threshold": forest.threshold, "value": forest.value, "roots": forest.roots}
+                for k, classes in enumerate(forest.classes or []):
+                    arrays[f"classes_{k}"] = classes
+                for name, array in arrays.items():
+                    np.save(os.path.join(forest_dir, name + ".npy"), array)
+            with open(os.path.join(staging, META_FILE), "w", encoding="utf-8") as f:
+                json.dump({**self.meta, "source_sha256": source_sha256}, f, indent=2)
+            # mkdtemp's 0700 would hide the forest from workers of other users, unlike the pickle.
+            for root, dirs, files in os.walk(staging):
+                os.chmod(root, 0o755)
+                for name in files:
+                    os.chmod(os.path.join(root, name), 0o644)
+            # Swap directories; processes still mapping the old files keep their pages.
+            retired = None
+            if os.path.exists(directory):
+                retired = tempfile.mkdtemp(prefix=os.path.basename(directory) + ".old.", dir=parent)
+                os.rename(directory, os.path.join(retired, "forest"))
+            os.rename(staging, directory)
+            if retired:
+                shutil.rmtree(retired, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "CompactForest":
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"{directory} has format version {meta.get('format_version')}, expected {FORMAT_VERSION}.")
+        arrays = []
+        for index, forest_meta in enumerate(meta["forests"]):
+            forest_dir = os.path.join(directory, str(index))
+            names = ["left", "right", "feature", "threshold", "value", "roots"]
+            names += [f"classes_{k}" for k in range(len(forest_meta["n_classes"] or []))]
+            arrays.append({name: np.load(os.path.join(forest_dir, name + ".npy"), mmap_mode="r" if mmap else None) for name in names})
+        return cls(meta, arrays)
+
+
+def _stored_source_sha256(directory: str) -> Optional[str]:
+    try:
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            return json.load(f).get("source_sha256")
+    except (OSError, ValueError):
+        return None
+
+
+def convert_file(pickle_path: str) -> CompactForest:
+    """Converts a pickled forest, verifies it against the pickle and saves it next to it."""
+    source_sha256 = file_sha256(pickle_path)
+    model = joblib.load(pickle_path)
+    compact = convert_model(model)
+    mismatches = verify(model, compact)
+    if mismatches:
+        raise ValueError(f"Compact forest for {pickle_path} differs from the pickle on {mismatches} test rows.")
+    directory = forest_dir_for(pickle_path)
+    compact.save(directory, source_sha256)
+    return CompactForest.load(directory)
+
+
+def load_forest(pickle_path: str) -> Any:
+    """
+    The model in `pickle_path`, as a memory-mapped CompactForest when enabled. A missing
+    or outdated conversion is redone (and verified); anything that cannot be converted
+    or verified is served from the pickle as before.
+    """
+    if not COMPACT_FORESTS_ENABLED:
+        return limit_estimator_jobs(joblib.load(pickle_path))
+    directory = forest_dir_for(pickle_path)
+    source_sha256 = file_sha256(pickle_path)
+    if _stored_source_sha256(directory) == source_sha256:
+        try:
+            return CompactForest.load(directory)
+        except (OSError, ValueError) as e:
+            print(f"Compact forest {directory} could not be loaded ({e}); converting again.")
+
+    model = joblib.load(pickle_path)
+    try:
+        compact = convert_model(model)
+        mismatches = verify(model, compact)
+    except ValueError as e:
+        print(f"Serving {os.path.basename(pickle_path)} with scikit-learn: {e}")
+        return model
+    if mismatches:
+        print(f"Serving {os.path.basename(pickle_path)} with scikit-learn: the compact forest differed on {mismatches} test rows.")
+        return model
+    try:
+        compact.save(directory, source_sha256)
+        print(f"Converted {os.path.basename(pickle_path)} to a compact forest in {directory} ({compact.nbytes / 1e6:.1f} MB).")
+        return CompactForest.load(directory)
+    except OSError as e:
+        print(f"Compact forest for {os.path.basename(pickle_path)} kept in memory; could not write {directory}: {e}")
+        return compact
+
+
+def main(paths: List[str]) -> None:
+    for path in paths:
+        compact = convert_file(path)
+        trees = sum(forest.n_trees for forest in compact.forests)
+        print(f"{path}: {trees} trees, {compact.nbytes / 1e6:.1f} MB of node arrays, identical predictions -> {forest_dir_for(path)}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m services.compact_forest <model.pkl> [<model.pkl> ...]")
+        sys.exit(2)
+    main(sys.argv[1:])
@@ -0,0 +1,106 @@
+# backend/services/conversation_memory.py
+"""
+Per-session memory for /ai/chat with a fixed token budget.
+
+Each session keeps its most recent turns verbatim, plus a running summary of older
+turns. After every turn the oldest turns are folded into the summary until the
+rendered history fits in `token_budget` tokens, and the summary is trimmed to
+`summary_tokens`. So the history added to a prompt stops growing after a few turns,
+however long the conversation runs. The summary is extractive (the first sentence
+of each question and answer), so compaction needs no extra LLM call.
+
+Sessions live in an LRU bounded to `max_sessions`. Sessions idle for longer than
+`idle_seconds` are dropped.
+"""
+import re
+import time
+from collections import deque
+from typing import Callable, Deque, List, Optional
+
+from utils.lru_cache import LRUCache
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+# Longest fragment of a question or answer kept in the summary, in characters.
+SUMMARY_FRAGMENT_CHARS = 160
+
+
+def _first_sentence(text: str) -> str:
+    sentence = _SENTENCE_END.split(" ".join(text.split()), maxsplit=1)[0]
+    if len(sentence) > SUMMARY_FRAGMENT_CHARS:
+        sentence = sentence[:SUMMARY_FRAGMENT_CHARS].rsplit(" ", 1)[0] + "..."
+    return sentence
+
+
+class Turn:
+    def __init__(self, question: str, answer: str):
+        self.question = question
+        self.answer = answer
+
+    def render(self) -> str:
+        return f"User: {self.question}\nVitaFit: {self.answer}"
+
+
+class ConversationMemory:
+    def __init__(self):
+        self.summary: List[str] = []  # one entry per folded turn, oldest first
+        self.turns: Deque[Turn] = deque()
+        self.last_used = time.monotonic()
+
+    def render(self) -> str:
+        parts = []
+        if self.summary:
+            parts.append("Earlier in this conversation: " + " ".join(self.summary))
+        parts.extend(turn.render() for turn in self.turns)
+        return "\n".join(parts)
+
+
+class ConversationStore:
+    def __init__(self, count_tokens: Callable[[str], int], token_budget: int, summary_tokens: int, max_sessions: int, idle_seconds: float):
+        self.count_tokens = count_tokens
+        self.token_budget = token_budget
+        self.summary_tokens = min(summary_tokens, token_budget)
+        self.idle_seconds = idle_seconds
+        self._sessions = LRUCache(max_sessions)
+
+    def _is_idle(self, memory: ConversationMemory, now: float) -> bool:
+        return self.idle_seconds > 0 and now - memory.last_used > self.idle_seconds
+
+    def _get(self, session_id: str) -> Optional[ConversationMemory]:
+        memory = self._sessions.get(session_id)
+        if memory is not None and self._is_idle(memory, time.monotonic()):
+            self._sessions.pop(session_id)
+            return None
+        return memory
+
+    def history(self, session_id: str) -> str:
+        """The session's summary and recent turns, ready to put in a prompt ("" for a new session)."""
+        memory = self._get(session_id)
+        return memory.render() if memory is not None else ""
+
+    def record(self, session_id: str, question: str, answer: str) -> None:
+        now = time.monotonic()
+        # Least recently used first, so this stops at the first session still in use.
+        self._sessions.evict_while(lambda memory: self._is_idle(memory, now))
+
+        memory = self._get(session_id) or ConversationMemory()
+        memory.turns.append(Turn(question, answer))
+        memory.last_used = now
+        self._compact(memory)
+        self._sessions.put(session_id, memory)
+
+    def clear(self, session_id: str) -> None:
+        self._sessions.pop(session_id)
+
+    def _compact(self, memory: ConversationMemory) -> None:
+        while memory.turns and self.count_tokens(memory.render()) > self.token_budget:
+            oldest = memory.turns.popleft()
+            memory.summary.append(f"The user asked: {_first_sentence(oldest.question)} VitaFit answered: {_first_sentence(oldest.answer)}")
+            while len(memory.summary) > 1 and self.count_tokens(" ".join(memory.summary)) > self.summary_tokens:
+                memory.summary.pop(0)
+            if self.count_tokens(" ".join(memory.summary)) > self.summary_tokens:
+                memory.summary = []  # a single fragment over the summary budget
+        if self.count_tokens(memory.render()) > self.token_budget:
+            memory.summary = []
+
+    def __len__(self) -> int:
+        return len(self._sessions)
@@ -1,124 +1,142 @@
 # backend/services/diet_service.py
-import os
 import joblib
 import pandas as pd
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from fastapi import HTTPException
 from config.settings import DIET_MODELS_PATH
 from utils.helpers import convert_numpy_types, infer_activity_level
+from services.compact_forest import load_forest
+from services.model_registry import ModelBundle, ModelSpec, model_registry
+from utils.observability import logger, stage_timer
+from utils.thread_budget import thread_budget
 
 
-diet_regressor: Optional[Any] = None
-diet_label_encoders: Optional[Dict[str, Any]] = None
-
 DIET_FEATURE_COLUMNS_ORDER = [
     "age", "gender", "height", "weight", "bmi", "calories_intake",
     "exercise_type", "intensity_level", "frequency_per_week", "activity_level"
 ]
+DIET_MODEL_FILES = ["diet_model_rf.pkl", "diet_label_encoders.pkl"]
+
+# Fixed inputs used to run one inference on every newly loaded version.
+WARM_UP_FEATURES = {"age": 30, "gender": 1, "height": 68.9, "weight": 75.0, "bmi": 24.5, "calories_intake": 2200}
+WARM_UP_EXERCISE = {"exercise_type": "cardio", "intensity_level": "medium", "frequency_per_week": 3}
+WARM_UP_RAW_INPUT = {"gender": "male"}
+
+
+def _load_diet_objects(paths: Dict[str, str]) -> Dict[str, Any]:
+    loaded_diet_encoders = joblib.load(paths["diet_label_encoders.pkl"])
+    if not isinstance(loaded_diet_encoders, dict):
+        print("Warning: diet_label_encoders.pkl is not a dictionary. It might still work if gender is handled differently in diet model.")
+    return {"regressor": load_forest(paths["diet_model_rf.pkl"]), "encoders": loaded_diet_encoders}
 
-async def load_diet_models():
-    """Loads the diet prediction model and its label encoders."""
-    global diet_regressor, diet_label_encoders
 
+def _warm_up_diet(objects: Dict[str, Any]) -> None:
+    predictions = predict_diet(WARM_UP_FEATURES, WARM_UP_EXERCISE, WARM_UP_RAW_INPUT, ModelBundle("diet", "warm-up", objects, signature=()))
+    if "error" in predictions:
+        raise RuntimeError(predictions["error"])
+
+
+model_registry.register(ModelSpec("diet", DIET_MODELS_PATH, DIET_MODEL_FILES, _load_diet_objects, _warm_up_diet))
+
+
+async def load_diet_models():
+    """Loads the diet prediction model and its label encoders into the model registry."""
     try:
-        diet_regressor = joblib.load(os.path.join(DIET_MODELS_PATH, "diet_model_rf.pkl"))
-        loaded_diet_encoders = joblib.load(os.path.join(DIET_MODELS_PATH, "diet_label_encoders.pkl"))
-        
-        if not isinstance(loaded_diet_encoders, dict):
-            print("Warning: diet_label_encoders.pkl is not a dictionary. It might still work if gender is handled differently in diet model.")
-        
-        diet_label_encoders = loaded_diet_encoders
-        print("Diet prediction model and encoders loaded successfully!")
+        bundle = await model_registry.load("diet")
+        print(f"Diet prediction model and encoders loaded successfully (version {bundle.version})!")
     except FileNotFoundError as e:
         print(f"Error loading diet model: {e}. Make sure diet_model_rf.pkl and diet_label_encoders.pkl are in {DIET_MODELS_PATH}")
-        diet_regressor = None
-        diet_label_encoders = None
         print("Warning: Diet prediction model will not be available due to missing files.")
         raise HTTPException(status_code=500, detail=f"Server setup error: Missing diet model files. {e}")
     except Exception as e:
         print(f"An unexpected error occurred loading diet model: {e}")
-        diet_regressor = None
-        diet_label_encoders = None
         print(f"Warning: Diet prediction model will not be available due to error: {e}")
         raise HTTPException(status_code=500, detail=f"Server setup error: Failed to load diet model. {e}")
 
-def get_diet_models_and_encoders():
-    """Returns the loaded diet models and encoders, or None if not loaded."""
-    if not all([diet_regressor, diet_label_encoders]):
-        return None, None
-    return diet_regressor, diet_label_encoders
+def get_diet_bundle() -> Optional[ModelBundle]:
+    """Returns the current diet model version; callers keep it for the whole request."""
+    return model_registry.get("diet")
 
-def predict_diet(processed_core_features: Dict[str, Any], exercise_predictions: Dict[str, Any], raw_user_input: Dict[str, Any]) -> Dict[str, Any]:
+def predict_diet(processed_core_features: Dict[str, Any], exercise_predictions: Dict[str, Any], raw_user_input: Dict[str, Any], bundle: Optional[ModelBundle] = None) -> Dict[str, Any]:
     """
-    Performs diet predictions based on processed user data and exercise predictions.
-    Assumes models and encoders are already loaded.
+    Performs diet predictions based on processed user data and exercise predictions,
+    with the given model version (default: the current one).
     """
-    regressor, encoders = get_diet_models_and_encoders()
-    if not all([regressor, encoders]):
+    return predict_diet_batch([(processed_core_features, exercise_predictions, raw_user_input)], bundle)[0]
+
+def _diet_model_row(processed_core_features: Dict[str, Any], exercise_predictions: Dict[str, Any], raw_user_input: Dict[str, Any], encoders: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Encodes one user's features and exercise predictions into a diet model input row."""
+    freq_for_activity = int(exercise_predictions.get("frequency_per_week", 0))
+
+    activity_level = infer_activity_level(
+        freq_for_activity,
+        exercise_predictions["intensity_level"]
+    )
+
+    diet_gender_raw = raw_user_input['gender'].lower()
+
+    if encoders is not None and 'gender' in encoders and encoders['gender'] is not None:
+        try:
+            diet_encoded_gender = encoders['gender'].transform([diet_gender_raw])[0]
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid gender for diet model: '{diet_gender_raw}'. Must be one of: {list(encoders['gender'].classes_)}")
+    else:
+        logger.warning("Diet model's 'gender' LabelEncoder is missing. Using pre-processed gender from exercise step.")
+        diet_encoded_gender = processed_core_features["gender"]
+
+    if (
+        encoders is None or
+        'exercise_type' not in encoders or encoders['exercise_type'] is None or
+        'intensity_level' not in encoders or encoders['intensity_level'] is None or
+        'activity_level' not in encoders or encoders['activity_level'] is None
+    ):
+        raise HTTPException(status_code=500, detail="Diet label encoders for exercise_type, intensity_level, or activity_level are missing or not loaded.")
+
+    return {
+        "age": processed_core_features["age"],
+        "gender": diet_encoded_gender,
+        "height": processed_core_features["height"],
+        "weight": processed_core_features["weight"],
+        "bmi": processed_core_features["bmi"],
+        "calories_intake": processed_core_features["calories_intake"],
+        "exercise_type": encoders['exercise_type'].transform([exercise_predictions["exercise_type"]])[0],
+        "intensity_level": encoders['intensity_level'].transform([exercise_predictions["intensity_level"]])[0],
+        "frequency_per_week": freq_for_activity,
+        "activity_level": encoders['activity_level'].transform([activity_level])[0]
+    }
+
+def predict_diet_batch(items: List[Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]], bundle: Optional[ModelBundle] = None) -> List[Dict[str, Any]]:
+    """
+    Diet predictions for several users with one model call. Each item is
+    (processed_core_features, exercise_predictions, raw_user_input); results are in order.
+    """
+    bundle = bundle or get_diet_bundle()
+    if bundle is None:
         raise HTTPException(status_code=500, detail="Diet prediction models or encoders are not loaded. Server might be misconfigured.")
+    regressor, encoders = bundle["regressor"], bundle["encoders"]
 
-    diet_predictions = {}
     try:
-        freq_for_activity = int(exercise_predictions.get("frequency_per_week", 0))
-        
-        activity_level = infer_activity_level(
-            freq_for_activity,
-            exercise_predictions["intensity_level"]
-        )
-        
-        diet_gender_raw = raw_user_input['gender'].lower()
-
-        if encoders is not None and 'gender' in encoders and encoders['gender'] is not None:
-            try:
-                diet_encoded_gender = encoders['gender'].transform([diet_gender_raw])[0]
-            except ValueError:
-                raise HTTPException(status_code=400, detail=f"Invalid gender for diet model: '{diet_gender_raw}'. Must be one of: {list(encoders['gender'].classes_)}")
-        else:
-            print("WARNING: Diet model's 'gender' LabelEncoder is missing. Using pre-processed gender from exercise step.")
-            diet_encoded_gender = processed_core_features["gender"]
-
-        if (
-            encoders is None or
-            'exercise_type' not in encoders or encoders['exercise_type'] is None or
-            'intensity_level' not in encoders or encoders['intensity_level'] is None or
-            'activity_level' not in encoders or encoders['activity_level'] is None
-        ):
-            raise HTTPException(status_code=500, detail="Diet label encoders for exercise_type, intensity_level, or activity_level are missing or not loaded.")
-        
-        encoded_exercise_type = encoders['exercise_type'].transform([exercise_predictions["exercise_type"]])[0]
-        encoded_intensity_level = encoders['intensity_level'].transform([exercise_predictions["intensity_level"]])[0]
-        encoded_activity_level = encoders['activity_level'].transform([activity_level])[0]
-
-        diet_model_input_data = {
-            "age": processed_core_features["age"],
-            "gender": diet_encoded_gender,
-            "height": processed_core_features["height"],
-            "weight": processed_core_features["weight"],
-            "bmi": processed_core_features["bmi"],
-            "calories_intake": processed_core_features["calories_intake"],
-            "exercise_type": encoded_exercise_type,
-            "intensity_level": encoded_intensity_level,
-            "frequency_per_week": freq_for_activity,
-            "activity_level": encoded_activity_level
-        }
-        
-        df_for_diet_model = pd.DataFrame([diet_model_input_data])[DIET_FEATURE_COLUMNS_ORDER]
+        with stage_timer("diet_preprocess"):
+            rows = [_diet_model_row(processed, exercise, raw, encoders) for processed, exercise, raw in items]
+            df_for_diet_model = pd.DataFrame(rows)[DIET_FEATURE_COLUMNS_ORDER]
 
         if regressor is None:
             raise HTTPException(status_code=500, detail="Diet prediction model is not loaded.")
-        y_diet_pred = regressor.predict(df_for_diet_model)
-        diet_predictions = {
-            "recommended_calories": round(y_diet_pred[0, 0], 2),
-            "protein_grams_per_day": round(y_diet_pred[0, 1], 2),
-            "carbs_grams_per_day": round(y_diet_pred[0, 2], 2),
-            "fats_grams_per_day": round(y_diet_pred[0, 3], 2)
-        }
-        return convert_numpy_types(diet_predictions)
+        with stage_timer("diet_predict"), thread_budget("tabular"):
+            y_diet_pred = regressor.predict(df_for_diet_model)
+        return [
+            convert_numpy_types({
+                "recommended_calories": round(y_diet_pred[i, 0], 2),
+                "protein_grams_per_day": round(y_diet_pred[i, 1], 2),
+                "carbs_grams_per_day": round(y_diet_pred[i, 2], 2),
+                "fats_grams_per_day": round(y_diet_pred[i, 3], 2)
+            })
+            for i in range(len(rows))
+        ]
 
     except Exception as e:
-        print(f"Warning: Error during diet prediction: {str(e)}")
+        logger.warning("Error during diet prediction: %s", e)
         if not regressor or not encoders:
-            diet_predictions = {"error": "Diet model not fully loaded or available."}
-            return diet_predictions
+            return [{"error": "Diet model not fully loaded or available."} for _ in items]
         else:
             raise HTTPException(status_code=500, detail=f"Could not generate diet plan due to internal error: {str(e)}")
\ No newline at end of file
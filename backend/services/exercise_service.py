@@ -1,35 +1,50 @@
 # backend/services/exercise_service.py
-import os
 import joblib
 import pandas as pd
-import nest_asyncio
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from fastapi import HTTPException
 from config.settings import EXERCISE_MODELS_PATH
 from models.request_models import UserInput
 from utils.helpers import convert_numpy_types
+from services.compact_forest import load_forest
+from services.model_registry import ModelBundle, ModelSpec, model_registry
+from utils.observability import stage_timer
+from utils.thread_budget import thread_budget
 
 
-multi_clf: Optional[Any] = None
-multi_reg: Optional[Any] = None
-label_encoders: Optional[Dict[str, Any]] = None
-
 EXERCISE_FEATURE_COLUMNS_ORDER = ["age", "gender", "height", "weight", "bmi", "calories_intake"]
+EXERCISE_MODEL_FILES = ["multi_classifier.pkl", "multi_regressor.pkl", "label_encoders.pkl"]
+
+# A fixed, valid input used to run one inference on every newly loaded version.
+WARM_UP_INPUT = UserInput(
+    session_id="model-warm-up", age=30, gender="male", height_value=175, height_unit="cm",
+    weight_value=75, weight_unit="kg", calories_intake=2200
+)
+
+
+def _load_exercise_objects(paths: Dict[str, str]) -> Dict[str, Any]:
+    loaded_encoders = joblib.load(paths["label_encoders.pkl"])
+    if not isinstance(loaded_encoders, dict) or 'gender' not in loaded_encoders:
+        raise ValueError("label_encoders.pkl is not a dictionary or is missing 'gender' encoder.")
+    return {
+        "classifier": load_forest(paths["multi_classifier.pkl"]),
+        "regressor": load_forest(paths["multi_regressor.pkl"]),
+        "encoders": loaded_encoders,
+    }
 
 
-async def load_exercise_models():
-    """Loads the exercise prediction models and their label encoders."""
-    global multi_clf, multi_reg, label_encoders
+def _warm_up_exercise(objects: Dict[str, Any]) -> None:
+    predict_exercise(WARM_UP_INPUT, ModelBundle("exercise", "warm-up", objects, signature=()))
 
-    try:
-        multi_clf = joblib.load(os.path.join(EXERCISE_MODELS_PATH, "multi_classifier.pkl"))
-        multi_reg = joblib.load(os.path.join(EXERCISE_MODELS_PATH, "multi_regressor.pkl"))
-        loaded_encoders = joblib.load(os.path.join(EXERCISE_MODELS_PATH, "label_encoders.pkl"))
 
-        if not isinstance(loaded_encoders, dict) or 'gender' not in loaded_encoders:
-            raise ValueError("label_encoders.pkl is not a dictionary or is missing 'gender' encoder.")
-        label_encoders = loaded_encoders
-        print("Exercise prediction models and encoders loaded successfully!")
+model_registry.register(ModelSpec("exercise", EXERCISE_MODELS_PATH, EXERCISE_MODEL_FILES, _load_exercise_objects, _warm_up_exercise))
+
+
+async def load_exercise_models():
+    """Loads the exercise prediction models and their label encoders into the model registry."""
+    try:
+        bundle = await model_registry.load("exercise")
+        print(f"Exercise prediction models and encoders loaded successfully (version {bundle.version})!")
 
     except FileNotFoundError as e:
         print(f"Error loading exercise models: {e}. Make sure .pkl files are in {EXERCISE_MODELS_PATH}")
@@ -38,12 +53,20 @@ async def load_exercise_models():
         print(f"An unexpected error occurred loading exercise models: {e}")
         raise HTTPException(status_code=500, detail=f"Server setup error: Failed to load exercise models. {e}")
 
-def preprocess_user_data_for_exercise(data: UserInput) -> tuple[pd.DataFrame, Dict[str, Any]]:
+def get_exercise_bundle() -> Optional[ModelBundle]:
+    """Returns the current exercise model version; callers keep it for the whole request."""
+    return model_registry.get("exercise")
+
+def preprocess_user_data_for_exercise(data: UserInput, label_encoders: Optional[Dict[str, Any]] = None) -> tuple[pd.DataFrame, Dict[str, Any]]:
     """
     Preprocesses raw user input into a DataFrame suitable for the exercise models.
     Handles unit conversions, BMI calculation, and categorical encoding for gender.
     Returns the DataFrame and a dictionary of processed core features for later use.
+    Uses the current model version's encoders unless `label_encoders` is given.
     """
+    if label_encoders is None:
+        bundle = get_exercise_bundle()
+        label_encoders = bundle["encoders"] if bundle else None
     if label_encoders is None or 'gender' not in label_encoders:
         raise HTTPException(status_code=500, detail="Gender LabelEncoder not loaded or missing from 'label_encoders'.")
     
@@ -82,54 +105,47 @@ def preprocess_user_data_for_exercise(data: UserInput) -> tuple[pd.DataFrame, Di
 
     return df_for_exercise_model, processed_core_features
 
-def get_exercise_models_and_encoders():
-    """Returns the loaded exercise models and encoders, or None if not loaded."""
-    if not all([multi_clf, multi_reg, label_encoders]):
-        return None, None, None
-    return multi_clf, multi_reg, label_encoders
+def predict_exercise(user_input_data: UserInput, bundle: Optional[ModelBundle] = None) -> Dict[str, Any]:
+    """
+    Performs exercise predictions based on user input, with the given model version
+    (default: the current one).
+    """
+    exercise_predictions, _ = predict_exercise_batch([user_input_data], bundle)[0]
+    return exercise_predictions
 
-def predict_exercise(user_input_data: UserInput) -> Dict[str, Any]:
+def predict_exercise_batch(user_inputs: List[UserInput], bundle: Optional[ModelBundle] = None) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
     """
-    Performs exercise predictions based on user input.
-    Ensures models and encoders are loaded before prediction.
+    Exercise predictions for several users with one call per model. Returns
+    (exercise_predictions, processed_core_features) for each input, in order.
     """
-    clf, reg, encoders = get_exercise_models_and_encoders()
-    if not all([clf, reg, encoders]):
-        import asyncio
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            nest_asyncio.apply()
-            loop.run_until_complete(load_exercise_models())
-        else:
-            loop.run_until_complete(load_exercise_models())
-        clf, reg, encoders = get_exercise_models_and_encoders()
-        if not all([clf, reg, encoders]):
-            raise HTTPException(status_code=500, detail="Exercise models or encoders are not loaded. Server might be misconfigured.")
-
-    if clf is None or reg is None or encoders is None:
+    bundle = bundle or get_exercise_bundle()
+    if bundle is None:
         raise HTTPException(status_code=500, detail="Exercise models or encoders are not loaded. Cannot perform prediction.")
+    clf, reg, encoders = bundle["classifier"], bundle["regressor"], bundle["encoders"]
 
-    df_for_exercise, processed_core_features = preprocess_user_data_for_exercise(user_input_data)
+    with stage_timer("exercise_preprocess"):
+        processed = [preprocess_user_data_for_exercise(user_input, encoders)[1] for user_input in user_inputs]
+        df_for_exercise = pd.DataFrame(processed)[EXERCISE_FEATURE_COLUMNS_ORDER]
 
     try:
-        y_class_pred_encoded = clf.predict(df_for_exercise)
-        y_reg_pred = reg.predict(df_for_exercise)
-
-        predicted_exercise_type = encoders['exercise_type'].inverse_transform([y_class_pred_encoded[0, 0]])[0]
-        predicted_intensity_level = encoders['intensity_level'].inverse_transform([y_class_pred_encoded[0, 1]])[0]
-        
-        predicted_frequency_per_week_val = round(y_reg_pred[0, 0])
-        predicted_duration_minutes = round(y_reg_pred[0, 1], 2)
-        predicted_estimated_calorie_burn = round(y_reg_pred[0, 2], 2)
-
-        exercise_predictions = {
-            "exercise_type": predicted_exercise_type,
-            "intensity_level": predicted_intensity_level,
-            "frequency_per_week": int(predicted_frequency_per_week_val),
-            "duration_minutes": predicted_duration_minutes,
-            "estimated_calorie_burn": predicted_estimated_calorie_burn
-        }
-        return convert_numpy_types(exercise_predictions)
+        with stage_timer("exercise_predict"), thread_budget("tabular"):
+            y_class_pred_encoded = clf.predict(df_for_exercise)
+            y_reg_pred = reg.predict(df_for_exercise)
+
+        predicted_exercise_types = encoders['exercise_type'].inverse_transform(y_class_pred_encoded[:, 0])
+        predicted_intensity_levels = encoders['intensity_level'].inverse_transform(y_class_pred_encoded[:, 1])
+
+        results = []
+        for i, processed_core_features in enumerate(processed):
+            exercise_predictions = {
+                "exercise_type": predicted_exercise_types[i],
+                "intensity_level": predicted_intensity_levels[i],
+                "frequency_per_week": int(round(y_reg_pred[i, 0])),
+                "duration_minutes": round(y_reg_pred[i, 1], 2),
+                "estimated_calorie_burn": round(y_reg_pred[i, 2], 2)
+            }
+            results.append((convert_numpy_types(exercise_predictions), processed_core_features))
+        return results
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error during exercise prediction: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error during exercise prediction: {str(e)}")
@@ -0,0 +1,250 @@
+# backend/services/inference_service.py
+"""
+Dedicated local inference process for the heavy models (YOLO, embeddings, LLM).
+
+HTTP workers started with SERVING_MODE=inference-client connect to this process over
+a Unix socket (or localhost TCP) instead of loading their own copies, so request
+handling can scale to every core without multiplying model RAM.
+
+Run it before the workers:
+    python -m services.inference_service
+    SERVING_MODE=inference-client uvicorn main:app --workers 8
+"""
+import os
+import stat
+import uuid
+import asyncio
+import secrets
+import threading
+from multiprocessing.managers import BaseManager
+from typing import Any, Dict, Optional, Tuple, Union
+
+from starlette.concurrency import run_in_threadpool
+
+from config.settings import (
+    IMAGE_CLASSIFIER_MODELS_PATH,
+    INFERENCE_SERVER_ADDRESS,
+    INFERENCE_SERVER_ALLOW_REMOTE,
+    INFERENCE_SERVER_AUTHKEY,
+    INFERENCE_SERVER_AUTHKEY_FILE
+)
+from utils.cancellation import DISCONNECT_POLL_INTERVAL, CancellationToken, cancellation_scope, current_cancellation
+
+
+class InferenceManager(BaseManager):
+    pass
+
+
+LOOPBACK_HOSTS = {"127.0.0.1", "localhost", "::1"}
+
+
+def parse_address(address: str) -> Union[str, Tuple[str, int]]:
+    """
+    'host:port' becomes a TCP address; anything else is a Unix socket path. Anything
+    but loopback needs INFERENCE_SERVER_ALLOW_REMOTE and an explicit authkey, since
+    whoever holds the key can run code in the inference process.
+    """
+    if not address.startswith("/") and ":" in address:
+        host, port = address.rsplit(":", 1)
+        host = host.strip("[]")
+        if host not in LOOPBACK_HOSTS:
+            if not INFERENCE_SERVER_ALLOW_REMOTE:
+                raise ValueError(f"INFERENCE_SERVER_ADDRESS {address} is not a loopback address; set INFERENCE_SERVER_ALLOW_REMOTE=true to serve it anyway.")
+            if not INFERENCE_SERVER_AUTHKEY:
+                raise ValueError("A non-loopback INFERENCE_SERVER_ADDRESS needs INFERENCE_SERVER_AUTHKEY to be set.")
+        return host, int(port)
+    return address
+
+
+def ensure_private_dir(path: str) -> None:
+    """
+    Creates `path` with mode 0700, or checks that it is a directory of this user that
+    no one else can write to. The socket and key file go in it, so another user cannot
+    put a file or link there first or connect before the socket's mode is set.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise RuntimeError(f"{path} is not a directory; it must be one only this user can write to.")
+    if hasattr(os, "getuid") and info.st_uid != os.getuid():
+        raise RuntimeError(f"{path} belongs to another user; point INFERENCE_RUNTIME_DIR at a directory of this user.")
+    if info.st_mode & 0o022:
+        raise RuntimeError(f"{path} is writable by other users; use a private directory (mode 0700) for the inference socket and key.")
+
+
+def inference_authkey(create: bool = False) -> bytes:
+    """
+    INFERENCE_SERVER_AUTHKEY, or else the key in INFERENCE_SERVER_AUTHKEY_FILE. With
+    create=True (the server) a missing key file is written with a fresh random key.
+    """
+    if INFERENCE_SERVER_AUTHKEY:
+        return INFERENCE_SERVER_AUTHKEY.encode()
+    if create:
+        key = secrets.token_hex(32)
+        if os.path.exists(INFERENCE_SERVER_AUTHKEY_FILE):
+            os.remove(INFERENCE_SERVER_AUTHKEY_FILE)
+        # O_EXCL: never write the key through a file or link someone else put there.
+        fd = os.open(INFERENCE_SERVER_AUTHKEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(key)
+        return key.encode()
+    try:
+        with open(INFERENCE_SERVER_AUTHKEY_FILE) as f:
+            key = f.read().strip()
+    except OSError as e:
+        raise RuntimeError(f"No inference server key: set INFERENCE_SERVER_AUTHKEY or start the inference server first ({e}).")
+    if not key:
+        raise RuntimeError(f"{INFERENCE_SERVER_AUTHKEY_FILE} is empty; restart the inference server or set INFERENCE_SERVER_AUTHKEY.")
+    return key.encode()
+
+
+class InferenceService:
+    """
+    Server-side facade over the loaded models. The manager serves each client
+    connection on its own thread; async RAG calls are run on one dedicated event loop.
+    RAG calls take the client's remaining deadline and a request id that cancel()
+    can later target when the HTTP client disconnects.
+    """
+    def __init__(self, image_classifier: Optional[Any], rag_assistant: Optional[Any]):
+        self.image_classifier = image_classifier
+        self.rag_assistant = rag_assistant
+        self._active: Dict[str, CancellationToken] = {}
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="inference-loop", daemon=True).start()
+
+    def _run(self, coro) -> Any:
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _cancellable(self, coro, request_id: Optional[str], deadline_seconds: Optional[float]) -> Any:
+        with cancellation_scope(CancellationToken.with_timeout(deadline_seconds)) as token:
+            if request_id:
+                self._active[request_id] = token
+            try:
+                return await coro
+            finally:
+                self._active.pop(request_id or "", None)
+
+    def cancel(self, request_id: str, reason: str) -> None:
+        token = self._active.get(request_id)
+        if token is not None:
+            token.cancel(reason)
+
+    def status(self) -> Dict[str, bool]:
+        return {"image_classifier": self.image_classifier is not None, "rag_assistant": self.rag_assistant is not None}
+
+    def classify_dish(self, image_bytes: bytes) -> Dict[str, Any]:
+        if self.image_classifier is None:
+            raise RuntimeError("Dish detection model is not loaded in the inference server.")
+        return self.image_classifier.predict_dish_from_image(image_bytes).model_dump()
+
+    def get_initial_overview(
+        self, user_data_context: str, exercise_type: Optional[str] = None, intensity_level: Optional[str] = None,
+        request_id: Optional[str] = None, deadline_seconds: Optional[float] = None
+    ) -> str:
+        if self.rag_assistant is None:
+            raise RuntimeError("AI services are not loaded in the inference server.")
+        return self._run(self._cancellable(self.rag_assistant.get_initial_overview(user_data_context, exercise_type, intensity_level), request_id, deadline_seconds))
+
+    def chat_with_ai(self, user_question: str, session_id: str, request_id: Optional[str] = None, deadline_seconds: Optional[float] = None) -> str:
+        if self.rag_assistant is None:
+            raise RuntimeError("AI services are not loaded in the inference server.")
+        return self._run(self._cancellable(self.rag_assistant.chat_with_ai(user_question, session_id), request_id, deadline_seconds))
+
+
+# --- Client side (HTTP workers) ---
+
+class RemoteImageClassifier:
+    """Drop-in for ImageClassifier that forwards predictions to the inference server."""
+    def __init__(self, proxy: Any):
+        self._proxy = proxy
+
+    def predict_dish_from_image(self, image_bytes: bytes):
+        from models.Image_Classifier_Model.image_classifier_logic import DetectionResponse
+        return DetectionResponse(**self._proxy.classify_dish(image_bytes))
+
+
+class RemoteRAGAssistant:
+    """
+    Drop-in for RAGAssistant; IPC calls run in the threadpool so the event loop stays free.
+    The request's deadline is forwarded, and a disconnect is relayed with cancel().
+    """
+    def __init__(self, proxy: Any):
+        self._proxy = proxy
+
+    async def _call(self, method: str, *args: Any) -> str:
+        token = current_cancellation()
+        request_id = uuid.uuid4().hex
+        call = asyncio.ensure_future(run_in_threadpool(
+            getattr(self._proxy, method), *args, request_id=request_id, deadline_seconds=token.remaining() if token else None
+        ))
+        if token is not None:
+            while not call.done():
+                await asyncio.wait({call}, timeout=DISCONNECT_POLL_INTERVAL)
+                if not call.done() and token.cancelled:
+                    await run_in_threadpool(self._proxy.cancel, request_id, token.reason)
+                    break
+        return await call
+
+    async def get_initial_overview(self, user_data_context: str, exercise_type: Optional[str] = None, intensity_level: Optional[str] = None) -> str:
+        return await self._call("get_initial_overview", user_data_context, exercise_type, intensity_level)
+
+    async def chat_with_ai(self, user_question: str, session_id: str) -> str:
+        return await self._call("chat_with_ai", user_question, session_id)
+
+
+def connect_to_inference_server() -> Tuple[Optional[RemoteImageClassifier], Optional[RemoteRAGAssistant]]:
+    """Connects to the inference server and returns proxies for the models it has loaded."""
+    InferenceManager.register("inference")
+    manager = InferenceManager(address=parse_address(INFERENCE_SERVER_ADDRESS), authkey=inference_authkey())
+    manager.connect()
+    proxy = manager.inference()  # type: ignore[attr-defined]
+    status = proxy.status()
+    print(f"Connected to inference server at {INFERENCE_SERVER_ADDRESS}: {status}")
+    return (
+        RemoteImageClassifier(proxy) if status["image_classifier"] else None,
+        RemoteRAGAssistant(proxy) if status["rag_assistant"] else None,
+    )
+
+
+# --- Server entry point ---
+
+async def _load_models() -> Tuple[Optional[Any], Optional[Any]]:
+    from models.Image_Classifier_Model.image_classifier_logic import load_image_classifier
+    from services.rag_service import load_rag_knowledge_base, initialize_rag_components
+
+    image_classifier = load_image_classifier(os.path.join(IMAGE_CLASSIFIER_MODELS_PATH, "image_classification.pt"))
+    knowledge_base = await load_rag_knowledge_base()
+    rag_assistant = await initialize_rag_components(knowledge_base=knowledge_base)
+    return image_classifier, rag_assistant
+
+
+def serve():
+    from utils.thread_budget import apply_process_thread_budgets
+
+    apply_process_thread_budgets()
+    # Refuse a bad address or an unsafe directory before spending minutes loading models.
+    address = parse_address(INFERENCE_SERVER_ADDRESS)
+    if isinstance(address, str):
+        ensure_private_dir(os.path.dirname(os.path.abspath(address)))
+    if not INFERENCE_SERVER_AUTHKEY:
+        ensure_private_dir(os.path.dirname(os.path.abspath(INFERENCE_SERVER_AUTHKEY_FILE)))
+    image_classifier, rag_assistant = asyncio.run(_load_models())
+    service = InferenceService(image_classifier, rag_assistant)
+
+    if isinstance(address, str) and os.path.exists(address):
+        os.remove(address)
+
+    InferenceManager.register("inference", callable=lambda: service)
+    manager = InferenceManager(address=address, authkey=inference_authkey(create=True))
+    # The socket is created 0600 rather than chmodded after it is already listening.
+    previous_umask = os.umask(0o177)
+    try:
+        server = manager.get_server()
+    finally:
+        os.umask(previous_umask)
+    print(f"Inference server listening on {INFERENCE_SERVER_ADDRESS}.")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    serve()
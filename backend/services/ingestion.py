@@ -0,0 +1,221 @@
+# backend/services/ingestion.py
+"""
+Knowledge base ingestion for when the vector index is (re)built.
+
+Files are parsed and chunked in a pool of worker processes. The chunks are then
+embedded in fixed-size batches, and each batch is handed to a writer thread that
+stores it while the next batch is being embedded. At most three batches of vectors
+are in memory at any time (one being embedded, one queued, one being written),
+however large the corpus is.
+"""
+import os
+import time
+import uuid
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import TextLoader, PyPDFLoader
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from utils.thread_budget import init_worker_thread_budget
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+SUPPORTED_EXTENSIONS = (".txt", ".pdf")
+# Starting worker processes costs a few seconds (each one imports langchain), so
+# smaller corpora are parsed in-process.
+PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+
+# langchain_chroma's default collection, which existing persisted indexes use.
+CHROMA_COLLECTION = "langchain"
+# Collection metadata holding the knowledge base version the Chroma index was built from.
+CHROMA_VERSION_KEY = "knowledge_base_version"
+# In the persist directory; held while the index is checked and rebuilt.
+CHROMA_LOCK_FILE = ".index.lock"
+
+# Receives one batch of chunks and their embeddings, in document order.
+BatchWriter = Callable[[List[Document], List[List[float]]], None]
+
+
+class IngestionStats:
+    """Counts and timings of one ingestion run; embed and write overlap, so they add up to more than index_s."""
+    def __init__(self):
+        self.files = 0
+        self.chunks = 0
+        self.parse_s = 0.0
+        self.index_s = 0.0
+        self.embed_s = 0.0
+        self.write_s = 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        elapsed = self.parse_s + self.index_s
+        return self.chunks / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.chunks} chunks from {self.files} files in {self.parse_s + self.index_s:.2f}s "
+            f"({self.chunks_per_second:.1f} chunks/s; parse {self.parse_s:.2f}s, embed {self.embed_s:.2f}s, write {self.write_s:.2f}s)"
+        )
+
+
+def list_knowledge_base_files(data_dir: str) -> List[str]:
+    paths = []
+    for root, _, files in os.walk(data_dir):
+        for file in files:
+            file_path = os.path.join(root, file)
+            if file.endswith(SUPPORTED_EXTENSIONS):
+                paths.append(file_path)
+            else:
+                print(f"Skipping unsupported file type: {file_path}")
+    return paths
+
+
+def load_file_chunks(file_path: str) -> Tuple[List[Document], int]:
+    """Loads one .txt or .pdf file and splits it; returns the chunks and the number of pages."""
+    if file_path.endswith(".pdf"):
+        loader = PyPDFLoader(file_path)
+    else:
+        loader = TextLoader(file_path, encoding='utf-8')
+    pages = loader.load()
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return text_splitter.split_documents(pages), len(pages)
+
+
+def _load_file_chunks_or_error(file_path: str) -> Tuple[List[Document], int, Optional[str]]:
+    # Runs in a worker process; errors are returned so one bad file doesn't fail the pool.
+    try:
+        chunks, pages = load_file_chunks(file_path)
+        return chunks, pages, None
+    except Exception as e:
+        return [], 0, str(e)
+
+
+def load_chunks(data_dir: str, workers: int, stats: Optional[IngestionStats] = None) -> List[Document]:
+    """
+    Chunks every supported file under `data_dir`, in up to `workers` processes for
+    large corpora. Chunks keep the os.walk file order.
+    """
+    start = time.perf_counter()
+    paths = list_knowledge_base_files(data_dir)
+    workers = min(workers, len(paths), os.cpu_count() or 1)
+    if workers > 1 and sum(os.path.getsize(path) for path in paths) >= PARALLEL_MIN_BYTES:
+        # "spawn", because the parent usually has torch loaded already, and its thread
+        # pools do not survive a fork safely.
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker_thread_budget, initargs=("ingest",)
+        ) as pool:
+            results = list(pool.map(_load_file_chunks_or_error, paths))
+    else:
+        results = [_load_file_chunks_or_error(path) for path in paths]
+
+    documents: List[Document] = []
+    for path, (chunks, pages, error) in zip(paths, results):
+        if error is not None:
+            print(f"Error loading {path}: {error}")
+            continue
+        documents.extend(chunks)
+        print(f"Loaded and chunked {pages} pages from {path}")
+
+    if stats is not None:
+        stats.files = sum(1 for _, _, error in results if error is None)
+        stats.parse_s = time.perf_counter() - start
+    return documents
+
+
+def uncached(embeddings: Embeddings) -> Embeddings:
+    """The model behind a CachedEmbeddings; bulk indexing would only churn its LRU."""
+    return getattr(embeddings, "inner", embeddings)
+
+
+def index_documents(documents: List[Document], embeddings: Embeddings, write_batch: BatchWriter, batch_size: int, stats: Optional[IngestionStats] = None) -> IngestionStats:
+    """
+    Embeds `documents` `batch_size` chunks at a time and passes each batch to
+    `write_batch` on a writer thread, so storing one batch overlaps embedding the next.
+    """
+    stats = stats or IngestionStats()
+    embedder = uncached(embeddings)
+    pending: "queue.Queue[Optional[Tuple[List[Document], List[List[float]]]]]" = queue.Queue(maxsize=1)
+    errors: List[BaseException] = []
+
+    def writer() -> None:
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            if errors:
+                continue  # keep draining so the producer never blocks
+            start = time.perf_counter()
+            try:
+                write_batch(*item)
+            except BaseException as e:
+                errors.append(e)
+            stats.write_s += time.perf_counter() - start
+
+    start = time.perf_counter()
+    writer_thread = threading.Thread(target=writer, name="kb-index-writer", daemon=True)
+    writer_thread.start()
+    try:
+        for offset in range(0, len(documents), batch_size):
+            if errors:
+                break
+            batch = documents[offset:offset + batch_size]
+            embed_start = time.perf_counter()
+            vectors = embedder.embed_documents([doc.page_content for doc in batch])
+            stats.embed_s += time.perf_counter() - embed_start
+            pending.put((batch, vectors))
+    finally:
+        pending.put(None)
+        writer_thread.join()
+    if errors:
+        raise errors[0]
+
+    stats.chunks = len(documents)
+    stats.index_s = time.perf_counter() - start
+    return stats
+
+
+def open_chroma_collection(persist_directory: str) -> Tuple[Any, Any]:
+    """The persistent Chroma client at `persist_directory` and its CHROMA_COLLECTION, created if missing."""
+    import chromadb
+    client = chromadb.PersistentClient(path=persist_directory)
+    # Embeddings are always computed here, never by Chroma.
+    return client, client.get_or_create_collection(CHROMA_COLLECTION, embedding_function=None)
+
+
+def chroma_index_version(collection: Any) -> Optional[str]:
+    return (collection.metadata or {}).get(CHROMA_VERSION_KEY)
+
+
+def rebuild_chroma_collection(client: Any, version: str, documents: List[Document], embedding: Embeddings,
+                              batch_size: int, stats: Optional[IngestionStats] = None) -> Any:
+    """Replaces CHROMA_COLLECTION with an index of `documents`, tagged with `version` once complete."""
+    try:
+        client.delete_collection(CHROMA_COLLECTION)
+    except Exception:
+        pass  # there was none
+    collection = client.create_collection(CHROMA_COLLECTION, embedding_function=None)
+    index_documents(documents, embedding, chroma_batch_writer(collection, client.get_max_batch_size()), batch_size, stats)
+    # Tagged last: an interrupted build has no version and is rebuilt on the next start.
+    collection.modify(metadata={CHROMA_VERSION_KEY: version})
+    return collection
+
+
+def chroma_batch_writer(collection: Any, max_batch: int) -> BatchWriter:
+    """Writes precomputed embeddings straight into a Chroma collection, at most `max_batch` per call (client.get_max_batch_size())."""
+    def write(batch: List[Document], vectors: List[List[float]]) -> None:
+        for offset in range(0, len(batch), max_batch):
+            docs = batch[offset:offset + max_batch]
+            collection.upsert(
+                ids=[str(uuid.uuid4()) for _ in docs],
+                embeddings=vectors[offset:offset + max_batch],
+                documents=[doc.page_content for doc in docs],
+                metadatas=[doc.metadata or None for doc in docs]
+            )
+    return write
@@ -0,0 +1,101 @@
+# backend/services/llm_runtime.py
+import time
+import contextvars
+from typing import Any, List, Optional
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList # type:ignore
+from langchain_huggingface import HuggingFacePipeline
+
+from utils.cancellation import GenerationCancelled, current_cancellation
+from utils.observability import LLM_CANCELLATIONS, LLM_PROMPT_TOKENS, LLM_RECLAIMED_SECONDS, LLM_TOKENS, logger, record_stage
+from utils.profiler import op_profile
+from utils.thread_budget import thread_budget
+
+
+class GenerationTrace:
+    """Per-generation timing state, filled in by GenerationProbe as tokens are produced."""
+    def __init__(self, pipeline_name: str, max_new_tokens: Optional[int] = None):
+        self.pipeline_name = pipeline_name
+        self.max_new_tokens = max_new_tokens
+        self.start_ns = time.time_ns()
+        self.first_token_ns: Optional[int] = None
+        self.steps = 0
+        self.cancelled_reason: Optional[str] = None
+
+    def on_step(self) -> None:
+        if self.first_token_ns is None:
+            self.first_token_ns = time.time_ns()
+        self.steps += 1
+
+    def finish(self) -> None:
+        end_ns = time.time_ns()
+        first_token_ns = self.first_token_ns or end_ns
+        record_stage(f"{self.pipeline_name}_prefill", self.start_ns, first_token_ns)
+        record_stage(f"{self.pipeline_name}_decode", first_token_ns, end_ns)
+        LLM_TOKENS.labels(self.pipeline_name).inc(self.steps)
+        if self.cancelled_reason is not None:
+            self._record_cancellation(first_token_ns, end_ns)
+
+    def _record_cancellation(self, first_token_ns: int, end_ns: int) -> None:
+        # Upper bound: assumes the generation would otherwise have used its whole token budget.
+        reclaimed = 0.0
+        if self.max_new_tokens and self.steps > 1:
+            per_token_s = (end_ns - first_token_ns) / 1e9 / (self.steps - 1)
+            reclaimed = max(0, self.max_new_tokens - self.steps) * per_token_s
+        LLM_CANCELLATIONS.labels(self.pipeline_name, self.cancelled_reason).inc()
+        LLM_RECLAIMED_SECONDS.labels(self.pipeline_name, self.cancelled_reason).inc(reclaimed)
+        logger.info("Stopped %s generation after %d tokens (%s); ~%.2fs of decoding reclaimed.", self.pipeline_name, self.steps, self.cancelled_reason, reclaimed)
+
+
+_current_trace: contextvars.ContextVar[Optional[GenerationTrace]] = contextvars.ContextVar("vitafit_generation_trace", default=None)
+
+
+class GenerationProbe(StoppingCriteria):
+    """
+    Stopping criterion called once per generated token. It reports progress to the
+    active GenerationTrace and stops the generation loop once the request's
+    cancellation token is set (client disconnect or deadline).
+    """
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs: Any) -> torch.BoolTensor:
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.on_step()
+        token = current_cancellation()
+        stop = token is not None and token.cancelled
+        if stop and trace is not None:
+            trace.cancelled_reason = token.reason # type:ignore[union-attr]
+        return torch.full((input_ids.shape[0],), stop, dtype=torch.bool, device=input_ids.device) # type:ignore
+
+
+def generation_stopping_criteria() -> StoppingCriteriaList:
+    return StoppingCriteriaList([GenerationProbe()])
+
+
+class InstrumentedHuggingFacePipeline(HuggingFacePipeline):
+    """
+    HuggingFacePipeline that records prefill/decode latency and token counts per call,
+    and raises GenerationCancelled instead of returning text cut short by cancellation.
+    """
+    pipeline_name: str = "llm"
+    max_new_tokens: Optional[int] = None
+
+    def _generate(self, prompts: List[str], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any):
+        cancellation = current_cancellation()
+        if cancellation is not None:
+            cancellation.raise_if_cancelled()
+        tokenizer = getattr(self.pipeline, "tokenizer", None)
+        if tokenizer is not None:
+            for prompt in prompts:
+                LLM_PROMPT_TOKENS.labels(self.pipeline_name).observe(len(tokenizer.encode(prompt)))
+        trace = GenerationTrace(self.pipeline_name, self.max_new_tokens)
+        token = _current_trace.set(trace)
+        try:
+            with thread_budget("llm"), op_profile(self.pipeline_name):
+                result = super()._generate(prompts, stop=stop, run_manager=run_manager, **kwargs)
+        finally:
+            _current_trace.reset(token)
+            trace.finish()
+        if trace.cancelled_reason is not None:
+            raise GenerationCancelled(trace.cancelled_reason)
+        return result
@@ -0,0 +1,169 @@
+# backend/services/model_registry.py
+"""
+Versioned registry for the models that are served from files under models/.
+
+Each model is described by a ModelSpec: the files that make up one version, a loader
+that turns them into the objects the service needs, and a warm-up that runs one real
+inference. A loaded version is an immutable ModelBundle. Requests take the current
+bundle once and use it to the end, so a swap never changes models under an in-flight
+request.
+
+watch() polls the model files. When a file's size or mtime changes, and stays the
+same for one more poll (so a half-copied file is not picked up), the new version is
+loaded and warmed up in a worker thread. Only then does it replace the old bundle.
+If loading or warm-up fails, the old version keeps serving.
+"""
+import os
+import time
+import asyncio
+import hashlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from utils.observability import MODEL_RELOADS, logger
+
+FileSignature = Tuple[Tuple[str, int, int], ...]
+
+
+class ModelSpec:
+    def __init__(
+        self,
+        name: str,
+        directory: str,
+        files: List[str],
+        loader: Callable[[Dict[str, str]], Dict[str, Any]],
+        warm_up: Optional[Callable[[Dict[str, Any]], None]] = None,
+        on_swap: Optional[Callable[["ModelBundle"], None]] = None
+    ):
+        self.name = name
+        self.directory = directory
+        self.files = files
+        self.loader = loader
+        self.warm_up = warm_up
+        self.on_swap = on_swap
+
+    def paths(self) -> Dict[str, str]:
+        return {file_name: os.path.join(self.directory, file_name) for file_name in self.files}
+
+    def signature(self) -> FileSignature:
+        """(file, size, mtime) for every file; cheap enough to poll."""
+        signature = []
+        for file_name, path in self.paths().items():
+            stat = os.stat(path)
+            signature.append((file_name, stat.st_size, stat.st_mtime_ns))
+        return tuple(signature)
+
+    def content_version(self) -> str:
+        digest = hashlib.sha256()
+        for file_name, path in self.paths().items():
+            digest.update(file_name.encode("utf-8"))
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+        return digest.hexdigest()[:12]
+
+
+class ModelBundle:
+    """One loaded, warmed-up version of a model. Treated as immutable once published."""
+    def __init__(self, name: str, version: str, objects: Dict[str, Any], signature: FileSignature):
+        self.name = name
+        self.version = version
+        self.objects = objects
+        self.signature = signature
+        self.loaded_at = time.time()
+
+    def __getitem__(self, key: str) -> Any:
+        return self.objects[key]
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._specs: Dict[str, ModelSpec] = {}
+        self._bundles: Dict[str, ModelBundle] = {}
+        # Last file signature acted on per model, and a changed one waiting to settle.
+        self._seen: Dict[str, FileSignature] = {}
+        self._pending: Dict[str, FileSignature] = {}
+
+    def register(self, spec: ModelSpec) -> None:
+        self._specs[spec.name] = spec
+
+    def get(self, name: str) -> Optional[ModelBundle]:
+        return self._bundles.get(name)
+
+    def versions(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {"version": bundle.version, "loaded_at": bundle.loaded_at, "files": [entry[0] for entry in bundle.signature]}
+            for name, bundle in self._bundles.items()
+        }
+
+    def install(self, name: str, objects: Dict[str, Any], version: str) -> ModelBundle:
+        """Publishes objects that were built elsewhere (tests, benchmarks) as a version of `name`."""
+        bundle = ModelBundle(name, version, objects, signature=())
+        self._publish(bundle)
+        return bundle
+
+    def _publish(self, bundle: ModelBundle) -> None:
+        previous = self._bundles.get(bundle.name)
+        self._bundles[bundle.name] = bundle
+        self._seen[bundle.name] = bundle.signature
+        spec = self._specs.get(bundle.name)
+        if spec is not None and spec.on_swap is not None:
+            spec.on_swap(bundle)
+        if previous is not None:
+            logger.info("Model '%s' swapped: %s -> %s.", bundle.name, previous.version, bundle.version)
+
+    def _build(self, name: str) -> ModelBundle:
+        spec = self._specs[name]
+        signature = spec.signature()
+        version = spec.content_version()
+        objects = spec.loader(spec.paths())
+        if spec.warm_up is not None:
+            spec.warm_up(objects)
+        return ModelBundle(name, version, objects, signature)
+
+    async def load(self, name: str) -> ModelBundle:
+        """Loads, warms up and publishes the current files of `name`; raises if that fails."""
+        bundle = await run_in_threadpool(self._build, name)
+        self._publish(bundle)
+        return bundle
+
+    async def check_for_updates(self) -> None:
+        for name, spec in self._specs.items():
+            current = self._bundles.get(name)
+            if current is None or not self._seen.get(name):
+                continue  # never loaded from files here, or installed from elsewhere
+            try:
+                signature = spec.signature()
+            except OSError:
+                continue  # a file is being replaced right now
+            if signature == self._seen[name]:
+                self._pending.pop(name, None)
+                continue
+            if self._pending.get(name) != signature:
+                self._pending[name] = signature  # wait one poll for the files to settle
+                continue
+            self._pending.pop(name, None)
+            try:
+                if await run_in_threadpool(spec.content_version) == current.version:
+                    self._seen[name] = signature  # touched, not changed
+                    continue
+                bundle = await run_in_threadpool(self._build, name)
+            except Exception as e:
+                MODEL_RELOADS.labels(name, "failed").inc()
+                logger.error("Reloading model '%s' failed; keeping version %s: %s", name, current.version, e)
+                self._seen[name] = signature  # don't retry the same broken files on every poll
+                continue
+            self._publish(bundle)
+            MODEL_RELOADS.labels(name, "swapped").inc()
+
+    async def watch(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.check_for_updates()
+            except Exception as e:
+                logger.error("Model registry poll failed: %s", e)
+
+
+model_registry = ModelRegistry()
@@ -0,0 +1,169 @@
+# backend/services/numpy_vector_store.py
+import os
+import json
+import tempfile
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from services.ingestion import IngestionStats, index_documents
+from utils.file_lock import locked
+
+EMBEDDINGS_FILE = "embeddings.npy"
+CHUNKS_FILE = "chunks.jsonl"
+MANIFEST_FILE = "manifest.json"
+# Held exclusively while an index is built and published, shared while one is opened.
+LOCK_FILE = ".index.lock"
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _index_lock(index_dir: str, exclusive: bool):
+    return locked(os.path.join(index_dir, LOCK_FILE), exclusive)
+
+
+def _temp_path(index_dir: str, name: str) -> str:
+    fd, path = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=index_dir)
+    os.close(fd)
+    os.chmod(path, 0o644)  # mkstemp's 0600 would hide the index from workers of other users
+    return path
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Exact-search vector store for small knowledge bases.
+
+    Normalized float32 embeddings live in a memory-mapped .npy file, so every worker
+    process shares the same read-only pages from the OS page cache; chunk text and
+    metadata live in a JSON-lines sidecar. A query is a single matrix-vector product.
+    """
+
+    def __init__(self, embedding: Embeddings, index_dir: str):
+        self._embedding = embedding
+        self.index_dir = index_dir
+
+        # Shared lock: never read the three files halfway through another process publishing them.
+        with _index_lock(index_dir, exclusive=False):
+            with open(os.path.join(index_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+            self._matrix = np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode="r")
+            with open(os.path.join(index_dir, CHUNKS_FILE), "r", encoding="utf-8") as f:
+                self._documents = [Document(**json.loads(line)) for line in f]
+
+        if self._matrix.shape[0] != len(self._documents):
+            raise RuntimeError(f"Vector index at {index_dir} is inconsistent: {self._matrix.shape[0]} vectors for {len(self._documents)} chunks.")
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    @property
+    def version(self) -> str:
+        return self.manifest.get("version", "")
+
+    @staticmethod
+    def stored_version(index_dir: str) -> Optional[str]:
+        """Returns the knowledge base version an index was built from, or None if there is no index."""
+        try:
+            with open(os.path.join(index_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+                return json.load(f).get("version")
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    @classmethod
+    def build(cls, documents: List[Document], embedding: Embeddings, index_dir: str, version: str = "", batch_size: int = 256, stats: Optional[IngestionStats] = None) -> "NumpyVectorStore":
+        """
+        Embeds the documents batch by batch straight into the index files, replacing
+        any previous index atomically. Workers building at the same time take turns;
+        one that finds `version` already built by another just opens it.
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        with _index_lock(index_dir, exclusive=True):
+            if version and cls.stored_version(index_dir) == version:
+                print(f"Vector index {version} was built by another process; using it.")
+            else:
+                temp_paths = [_temp_path(index_dir, name) for name in (EMBEDDINGS_FILE, CHUNKS_FILE, MANIFEST_FILE)]
+                try:
+                    cls._build_files(documents, embedding, index_dir, version, batch_size, stats, *temp_paths)
+                finally:
+                    for path in temp_paths:
+                        if os.path.exists(path):
+                            os.remove(path)
+        return cls(embedding, index_dir)
+
+    @staticmethod
+    def _build_files(documents: List[Document], embedding: Embeddings, index_dir: str, version: str, batch_size: int,
+                     stats: Optional[IngestionStats], tmp_embeddings: str, tmp_chunks: str, tmp_manifest: str) -> None:
+        matrix: Optional[np.ndarray] = None
+        row = 0
+
+        with open(tmp_chunks, "w", encoding="utf-8") as chunks_file:
+            def write_batch(batch: List[Document], vectors: List[List[float]]) -> None:
+                nonlocal matrix, row
+                block = _normalize_rows(np.asarray(vectors, dtype=np.float32)).astype(np.float32)
+                if matrix is None:
+                    # Vectors go into a preallocated .npy on disk rather than a growing list.
+                    matrix = np.lib.format.open_memmap(tmp_embeddings, mode="w+", dtype=np.float32, shape=(len(documents), block.shape[1]))
+                matrix[row:row + len(batch)] = block
+                row += len(batch)
+                for doc in batch:
+                    chunks_file.write(json.dumps({"page_content": doc.page_content, "metadata": doc.metadata}) + "\n")
+
+            index_documents(documents, embedding, write_batch, batch_size, stats)
+
+        if matrix is None:
+            raise RuntimeError("Cannot build a vector index without documents.")
+        dim = int(matrix.shape[1])
+        matrix.flush()
+        del matrix
+
+        with open(tmp_manifest, "w", encoding="utf-8") as f:
+            json.dump({"version": version, "count": len(documents), "dim": dim}, f)
+
+        # The manifest goes last: readers only trust an index whose manifest matches.
+        os.replace(tmp_embeddings, os.path.join(index_dir, EMBEDDINGS_FILE))
+        os.replace(tmp_chunks, os.path.join(index_dir, CHUNKS_FILE))
+        os.replace(tmp_manifest, os.path.join(index_dir, MANIFEST_FILE))
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, **kwargs: Any) -> "NumpyVectorStore":
+        index_dir = kwargs.pop("index_dir")
+        metadatas = metadatas or [{} for _ in texts]
+        documents = [Document(page_content=text, metadata=metadata) for text, metadata in zip(texts, metadatas)]
+        return cls.build(documents, embedding, index_dir, version=kwargs.pop("version", ""))
+
+    def _top_k(self, query_vector: List[float], k: int) -> List[Tuple[int, float]]:
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+        scores = self._matrix @ query
+        k = min(k, scores.shape[0])
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return [(self._documents[i], score) for i, score in self._top_k(embedding, k)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k)
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities in [-1, 1]; map them to [0, 1].
+        return lambda score: (score + 1.0) / 2.0
@@ -0,0 +1,154 @@
+# backend/services/overview_contexts.py
+"""
+Retrieved context for /ai/overview, precomputed per exercise_type x intensity_level.
+
+Every overview prompt is the same instruction text around a user's record, so
+retrieving for it on every call returns nearly the same chunks each time. Instead,
+one focused query per combination the exercise model can predict is retrieved when
+the RAG components start. The results are persisted and keyed on the knowledge
+base version and the retrieval settings, so they are only recomputed after the
+knowledge base changes. An overview then goes straight to the LLM with its
+combination's chunks: no embedding call and no vector search.
+
+A combination that was not precomputed is retrieved on first use and kept in memory;
+the file is updated off the event loop, merged with what other workers have saved.
+"""
+import os
+import json
+import asyncio
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from config.settings import EXERCISE_MODELS_PATH, RETRIEVAL_MODE, RETRIEVAL_TOP_K
+from services.model_registry import model_registry
+from utils.file_lock import locked
+from utils.lru_cache import content_hash
+from utils.observability import OVERVIEW_CONTEXT_LOOKUPS
+
+OVERVIEW_QUERY = (
+    "Fitness and diet guidance for {exercise_type} training at {intensity_level} intensity: "
+    "workouts, progression, recovery, nutrition and healthy habits."
+)
+
+
+def overview_combinations() -> List[Tuple[str, str]]:
+    """The exercise_type x intensity_level pairs the current exercise model can predict."""
+    bundle = model_registry.get("exercise")
+    encoders = bundle["encoders"] if bundle is not None else None
+    if encoders is None:
+        # The inference server does not load the tabular models; read the encoders directly.
+        try:
+            import joblib
+            encoders = joblib.load(os.path.join(EXERCISE_MODELS_PATH, "label_encoders.pkl"))
+        except Exception as e:
+            print(f"Overview contexts: exercise label encoders unavailable ({e}); contexts will be computed on first use.")
+            return []
+    return [
+        (str(exercise_type), str(intensity_level))
+        for exercise_type in encoders["exercise_type"].classes_
+        for intensity_level in encoders["intensity_level"].classes_
+    ]
+
+
+class OverviewContexts:
+    def __init__(self, path: str, knowledge_base_version: str):
+        self.path = path
+        self.version = content_hash(knowledge_base_version, RETRIEVAL_MODE, RETRIEVAL_TOP_K, OVERVIEW_QUERY)
+        self._contexts: Dict[Tuple[str, str], List[Document]] = {}
+        self._unsaved = False
+        self._persist_lock = threading.Lock()
+        self._persist_future: Optional["asyncio.Future[None]"] = None
+
+    def _read(self) -> Optional[Dict[Tuple[str, str], List[Document]]]:
+        """The contexts stored for this version, or None."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if stored.get("version") != self.version:
+            return None
+        return {
+            (entry["exercise_type"], entry["intensity_level"]): [Document(**doc) for doc in entry["documents"]]
+            for entry in stored["contexts"]
+        }
+
+    def _load(self) -> bool:
+        stored = self._read()
+        if stored is None:
+            return False
+        self._contexts = stored
+        return True
+
+    def _save(self) -> None:
+        # Workers save under an exclusive lock, each adding its combinations to the stored ones.
+        with locked(self.path + ".lock"):
+            merged = {**(self._read() or {}), **self._contexts}
+            self._write(merged)
+
+    def _write(self, merged: Dict[Tuple[str, str], List[Document]]) -> None:
+        contexts = [
+            {
+                "exercise_type": exercise_type,
+                "intensity_level": intensity_level,
+                "documents": [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents]
+            }
+            for (exercise_type, intensity_level), documents in merged.items()
+        ]
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.path) + ".", suffix=".tmp", dir=os.path.dirname(self.path))
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": self.version, "contexts": contexts}, f)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def persist(self) -> None:
+        """Saves combinations retrieved since the last save; blocking, so run off the event loop."""
+        with self._persist_lock:
+            while self._unsaved:
+                self._unsaved = False
+                try:
+                    self._save()
+                except OSError as e:
+                    self._unsaved = True
+                    print(f"Overview contexts: could not persist to {self.path}: {e}")
+                    return
+
+    def _persist_in_background(self) -> None:
+        if self._persist_future is None or self._persist_future.done():
+            self._persist_future = asyncio.get_running_loop().run_in_executor(None, self.persist)
+
+    def prepare(self, retriever: Any, combinations: List[Tuple[str, str]]) -> None:
+        """Loads the persisted contexts if they match this knowledge base, else retrieves and persists them."""
+        if self._load() and all(combination in self._contexts for combination in combinations):
+            print(f"Loaded {len(self._contexts)} precomputed overview contexts from {self.path}.")
+            return
+        for exercise_type, intensity_level in combinations:
+            query = OVERVIEW_QUERY.format(exercise_type=exercise_type, intensity_level=intensity_level)
+            self._contexts[(exercise_type, intensity_level)] = retriever.invoke(query)
+        self._save()
+        self._unsaved = False
+        print(f"Precomputed {len(self._contexts)} overview contexts and saved them to {self.path}.")
+
+    async def documents_for(self, retriever: Any, exercise_type: str, intensity_level: str) -> List[Document]:
+        """The combination's context; one the model was not expected to predict is retrieved once and kept."""
+        key = (exercise_type, intensity_level)
+        documents = self._contexts.get(key)
+        if documents is not None:
+            OVERVIEW_CONTEXT_LOOKUPS.labels("precomputed").inc()
+            return documents
+        OVERVIEW_CONTEXT_LOOKUPS.labels("computed").inc()
+        documents = await retriever.ainvoke(OVERVIEW_QUERY.format(exercise_type=exercise_type, intensity_level=intensity_level))
+        self._contexts[key] = documents
+        self._unsaved = True
+        self._persist_in_background()
+        return documents
+
+    def __len__(self) -> int:
+        return len(self._contexts)
@@ -0,0 +1,127 @@
+# backend/services/overview_service.py
+"""
+/ai/overview responses, precomputed in the background once a plan is stored.
+
+An overview depends only on the session record's overview fields (OVERVIEW_PROJECTION)
+and the LLM, so it is stored on the record under "ai_overview" with a version hashed
+from exactly those inputs. A request whose record still hashes to the stored version
+gets the stored text without touching the LLM. Otherwise it generates, or joins a
+generation of the same version that is already running, including a background one.
+
+Background generations hold background scheduler slots: they run only while no
+interactive LLM request is queued, and are preempted (and retried later) when one
+arrives. One that a request has joined is promoted and runs to completion.
+"""
+import json
+import asyncio
+import datetime
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException
+
+from config.settings import LLM_MODEL_NAME, OVERVIEW_PRECOMPUTE_ENABLED, OVERVIEW_PRECOMPUTE_MAX_PENDING
+from database.mongodb_client import get_db_collection, OVERVIEW_PROJECTION
+from utils.cancellation import GenerationCancelled
+from utils.lru_cache import content_hash
+from utils.observability import AI_OVERVIEW_RESPONSES, OVERVIEW_PRECOMPUTES, logger, stage_timer
+from utils.scheduler import scheduler
+from utils.single_flight import SingleFlight
+
+# A background overview that keeps getting preempted is given up after this many tries.
+PRECOMPUTE_ATTEMPTS = 3
+
+overview_flights = SingleFlight("ai_overview")
+_precomputes: Dict[str, "asyncio.Task[None]"] = {}
+
+
+def overview_version(record: Dict[str, Any]) -> str:
+    """Hash of everything the overview is generated from (the record as projected for the prompt)."""
+    return content_hash(LLM_MODEL_NAME, json.dumps(record, sort_keys=True, default=str))
+
+
+async def _generate(rag: Any, session_id: str, record: Dict[str, Any], version: str, client_key: Optional[str]) -> Dict[str, Any]:
+    async with scheduler.slot("llm", client_key):
+        exercise_predictions = record.get("exercise_predictions") or {}
+        response = await rag.get_initial_overview(
+            json.dumps(record, indent=2),
+            exercise_predictions.get("exercise_type"),
+            exercise_predictions.get("intensity_level")
+        )
+    try:
+        with stage_timer("mongo_write"):
+            get_db_collection("predictions").update_one(
+                {"session_id": session_id},
+                {"$set": {"ai_overview": {"version": version, "response": response, "generated_at": datetime.datetime.utcnow()}}}
+            )
+    except Exception as e:
+        # The response is still good; the next request just generates it again.
+        logger.error("Could not store the AI overview for session %s: %s", session_id, e)
+    return {"response": response}
+
+
+async def get_overview(rag: Any, session_id: str, background: bool = False, client_key: Optional[str] = None) -> Dict[str, Any]:
+    """
+    The session's overview: stored if current, else generated (or joined) for the record as it is now.
+    A generation is rate limited on `client_key`, the requesting client's address.
+    """
+    with stage_timer("mongo_read"):
+        record = get_db_collection("predictions").find_one({"session_id": session_id}, OVERVIEW_PROJECTION)
+    if not record:
+        raise HTTPException(status_code=404, detail=f"No fitness data found for session ID: {session_id}. Please submit your personal details and generate a plan first.")
+
+    stored = record.pop("ai_overview", None)
+    version = overview_version(record)
+    if stored and stored.get("version") == version:
+        if not background:
+            AI_OVERVIEW_RESPONSES.labels("stored").inc()
+        return {"response": stored["response"]}
+    if not background:
+        AI_OVERVIEW_RESPONSES.labels("generated").inc()
+    return await overview_flights.do(f"{session_id}:{version}", lambda: _generate(rag, session_id, record, version, client_key), background=background)
+
+
+async def _precompute(rag: Any, session_id: str) -> None:
+    outcome = "preempted"
+    try:
+        for _ in range(PRECOMPUTE_ATTEMPTS):
+            try:
+                await get_overview(rag, session_id, background=True)
+                outcome = "stored"
+                break
+            except GenerationCancelled as e:
+                if e.reason != "preempted":
+                    outcome = "cancelled"
+                    break
+            except HTTPException as e:
+                outcome = "no_record" if e.status_code == 404 else "failed"
+                break
+            except Exception as e:
+                logger.warning("Background AI overview for session %s failed: %s", session_id, e)
+                outcome = "failed"
+                break
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    finally:
+        OVERVIEW_PRECOMPUTES.labels(outcome).inc()
+        if _precomputes.get(session_id) is asyncio.current_task():
+            del _precomputes[session_id]
+
+
+def schedule_overview_precompute(rag: Optional[Any], session_id: str) -> None:
+    """Starts generating the session's overview in the background; replaces one pending for an older plan."""
+    if not OVERVIEW_PRECOMPUTE_ENABLED or rag is None:
+        return
+    previous = _precomputes.pop(session_id, None)
+    if previous is not None:
+        previous.cancel()
+    if len(_precomputes) >= OVERVIEW_PRECOMPUTE_MAX_PENDING:
+        OVERVIEW_PRECOMPUTES.labels("skipped").inc()
+        return
+    _precomputes[session_id] = asyncio.create_task(_precompute(rag, session_id))
+
+
+def cancel_overview_precomputes() -> None:
+    for task in list(_precomputes.values()):
+        task.cancel()
+    _precomputes.clear()
@@ -0,0 +1,70 @@
+# backend/services/plan_service.py
+"""
+Exercise and diet plans in one step. /predict_exercise stores a record that
+/predict_diet then reads back; here the diet model runs in memory on the same
+processed features, and each session is written once.
+"""
+import datetime
+from typing import Any, Dict, List
+
+from fastapi import HTTPException
+from pymongo import UpdateOne
+
+from models.request_models import UserInput
+from services.exercise_service import get_exercise_bundle, predict_exercise_batch
+from services.diet_service import get_diet_bundle, predict_diet_batch
+from utils.helpers import convert_numpy_types
+from utils.observability import stage_timer
+
+
+def build_plan_records(user_inputs: List[UserInput]) -> List[Dict[str, Any]]:
+    """
+    Prediction records for `user_inputs`, shaped like the ones the two-step endpoints
+    store. Every model is called once for the whole list, with one model version each.
+    """
+    exercise_bundle = get_exercise_bundle()
+    if exercise_bundle is None:
+        raise HTTPException(status_code=500, detail="Exercise models or encoders are not loaded. Cannot perform prediction.")
+    diet_bundle = get_diet_bundle()
+
+    exercise_results = predict_exercise_batch(user_inputs, exercise_bundle)
+    raw_inputs = [convert_numpy_types(user_input.dict()) for user_input in user_inputs]
+    diet_results = predict_diet_batch(
+        [(processed, exercise, raw) for (exercise, processed), raw in zip(exercise_results, raw_inputs)],
+        diet_bundle
+    )
+
+    now = datetime.datetime.utcnow()
+    return [
+        {
+            "session_id": user_input.session_id,
+            "timestamp": now,
+            "last_updated": now,
+            "raw_user_input": raw,
+            "processed_features": convert_numpy_types(processed),
+            "exercise_predictions": convert_numpy_types(exercise),
+            "diet_predictions": convert_numpy_types(diet),
+            "model_versions": {"exercise": exercise_bundle.version, "diet": diet_bundle.version if diet_bundle else None}
+        }
+        for user_input, raw, (exercise, processed), diet in zip(user_inputs, raw_inputs, exercise_results, diet_results)
+    ]
+
+
+def store_plan_records(collection: Any, records: List[Dict[str, Any]]) -> None:
+    """Upserts each record by session_id: one update for a single plan, one bulk write otherwise."""
+    with stage_timer("mongo_write"):
+        if len(records) == 1:
+            collection.update_one({"session_id": records[0]["session_id"]}, {"$set": records[0]}, upsert=True)
+        else:
+            collection.bulk_write(
+                [UpdateOne({"session_id": record["session_id"]}, {"$set": record}, upsert=True) for record in records],
+                ordered=False
+            )
+
+
+def plan_response(record: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "session_id": record["session_id"],
+        "exercise_plan": record["exercise_predictions"],
+        "diet_plan": record["diet_predictions"]
+    }
@@ -1,13 +1,12 @@
 import os
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Tuple
 import re 
 
 from langchain_huggingface import HuggingFacePipeline, HuggingFaceEmbeddings
 from langchain_chroma import Chroma
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import TextLoader, PyPDFLoader
+from langchain_core.documents import Document
 
 
 from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline # type:ignore
@@ -18,10 +17,34 @@ import torch
 from config.settings import (
     KNOWLEDGE_BASE_DATA_DIR,
     VECTOR_DB_PERSIST_PATH,
+    NUMPY_VECTOR_INDEX_PATH,
+    OVERVIEW_CONTEXTS_PATH,
+    VECTOR_BACKEND,
     LLM_MODEL_NAME,
     EMBEDDING_MODEL_NAME,
+    EMBEDDING_ENCODE_BATCH_SIZE,
+    INGEST_WORKERS,
+    INGEST_BATCH_SIZE,
+    CONVERSATION_TOKEN_BUDGET,
+    CONVERSATION_SUMMARY_TOKENS,
+    CONVERSATION_MAX_SESSIONS,
+    CONVERSATION_IDLE_SECONDS,
     HF_TOKEN 
 )
+from services.retrieval_service import build_retriever, CachedEmbeddings
+from services.ingestion import CHROMA_COLLECTION, CHROMA_LOCK_FILE, IngestionStats, chroma_index_version, load_chunks, open_chroma_collection, rebuild_chroma_collection
+from services.llm_runtime import InstrumentedHuggingFacePipeline, generation_stopping_criteria
+from services.conversation_memory import ConversationStore
+from services.overview_contexts import OverviewContexts, overview_combinations
+from utils.cancellation import GenerationCancelled
+from utils.file_lock import locked
+from utils.lru_cache import content_hash
+from utils.observability import OVERVIEW_CONTEXT_LOOKUPS, logger, stage_timer
+
+# Chunks backing the vector store, kept for the in-process lexical index.
+knowledge_base_chunks: List[Document] = []
+# Content hash of the chunks and embedding model; cache entries are keyed on it.
+knowledge_base_version: str = ""
 
 class RAGAssistant:
     def _clean_response_text(self, text: str) -> str:
@@ -33,12 +56,20 @@ class RAGAssistant:
         # Optionally remove excess whitespace
         return cleaned.strip()
     
-    def __init__(self, llm_chain: RetrievalQA, off_topic_classifier_llm: Optional[HuggingFacePipeline] = None):
+    def __init__(
+        self,
+        llm_chain: RetrievalQA,
+        off_topic_classifier_llm: Optional[HuggingFacePipeline] = None,
+        memory: Optional[ConversationStore] = None,
+        overview_contexts: Optional[OverviewContexts] = None
+    ):
         self.llm_chain = llm_chain
         self.off_topic_classifier_llm = off_topic_classifier_llm
+        self.memory = memory
+        self.overview_contexts = overview_contexts
 
     # Renaming user_report_text to user_data_context to reflect its new purpose
-    async def get_initial_overview(self, user_data_context: str) -> str:
+    async def get_initial_overview(self, user_data_context: str, exercise_type: Optional[str] = None, intensity_level: Optional[str] = None) -> str:
         if not self.llm_chain:
             raise RuntimeError("RAG LLM chain is not initialized.")
 
@@ -52,8 +83,15 @@ class RAGAssistant:
 
         Health Overview:
         """
-        response = await self.llm_chain.ainvoke({"query": overview_prompt})
-        raw_answer = response['result']
+        # With a plan in the record, use its precomputed context instead of retrieving for the prompt
+        if self.overview_contexts is not None and exercise_type and intensity_level:
+            documents = await self.overview_contexts.documents_for(self.llm_chain.retriever, exercise_type, intensity_level)
+            response = await self.llm_chain.combine_documents_chain.ainvoke({"input_documents": documents, "question": overview_prompt})
+            raw_answer = response["output_text"]
+        else:
+            OVERVIEW_CONTEXT_LOOKUPS.labels("retrieved").inc()
+            response = await self.llm_chain.ainvoke({"query": overview_prompt})
+            raw_answer = response['result']
         final_answer = self._clean_response_text(raw_answer)
         return final_answer
 
@@ -64,17 +102,22 @@ class RAGAssistant:
 
         # Step 1: Off-topic detection
         if self.off_topic_classifier_llm:
-            is_on_topic = await self._check_if_on_topic(user_question)
+            with stage_timer("topic_check"):
+                is_on_topic = await self._check_if_on_topic(user_question)
             if not is_on_topic:
-                print(f"Question '{user_question}' classified as OFF-TOPIC.")
+                logger.debug("Question '%s' classified as OFF-TOPIC.", user_question)
                 return "I'm designed to help with health, fitness, nutrition, and wellness questions. Please ask something related to those topics!"
             else:
-                print(f"Question '{user_question}' classified as ON-TOPIC.")
-
-        # Step 2: Retrieve and generate the response for the on-topic question
-        response = await self.llm_chain.ainvoke({"query": user_question})
-        raw_answer = response['result']
-        final_answer = self._clean_response_text(raw_answer)
+                logger.debug("Question '%s' classified as ON-TOPIC.", user_question)
+
+        # Step 2: Retrieve for the question alone, then answer it with the conversation so far
+        history = self.memory.history(session_id) if self.memory is not None else ""
+        documents = await self.llm_chain.retriever.ainvoke(user_question)
+        question = f"Conversation so far:\n{history}\n\nCurrent question: {user_question}" if history else user_question
+        response = await self.llm_chain.combine_documents_chain.ainvoke({"input_documents": documents, "question": question})
+        final_answer = self._clean_response_text(response["output_text"])
+        if self.memory is not None:
+            self.memory.record(session_id, user_question, final_answer)
         return final_answer
 
 
@@ -84,7 +127,7 @@ class RAGAssistant:
         """
         # Removed all DEBUG prints
         if self.off_topic_classifier_llm is None or not callable(self.off_topic_classifier_llm):
-            print("Warning: Off-topic classifier LLM is None or not callable. Skipping off-topic check.")
+            logger.warning("Off-topic classifier LLM is None or not callable. Skipping off-topic check.")
             return True # If it's not ready, we should skip the check and proceed
 
         off_topic_prompt = (
@@ -135,67 +178,114 @@ class RAGAssistant:
                 if re.search(r"\bno\b", search_scope) or re.search(r"\bnot\b", search_scope):
                     is_on_topic = False 
             
-            print(f"Off-topic classifier raw response (after stripping prompt): '{response_text}'")
-            print(f"Off-topic classifier processed response (lower): '{response_lower}'")
-            print(f"Off-topic classifier result: {'ON-TOPIC' if is_on_topic else 'OFF-TOPIC'}")
+            logger.debug("Off-topic classifier raw response (after stripping prompt): '%s'", response_text)
+            logger.debug("Off-topic classifier result: %s", "ON-TOPIC" if is_on_topic else "OFF-TOPIC")
             
             return is_on_topic
 
+        except GenerationCancelled:
+            raise
         except Exception as e:
-            print(f"Error during off-topic check with HuggingFacePipeline: {type(e).__name__}: {e}")
+            logger.error("Error during off-topic check with HuggingFacePipeline: %s: %s", type(e).__name__, e)
             return True # Default to True if classifier fails, to avoid blocking main chat.
 
 
-async def load_rag_knowledge_base():
-    print(f"Loading documents from {KNOWLEDGE_BASE_DATA_DIR}...")
-    documents = []
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-
-    for root, _, files in os.walk(KNOWLEDGE_BASE_DATA_DIR):
-        for file in files:
-            file_path = os.path.join(root, file)
-            try:
-                if file.endswith(".txt"):
-                    loader = TextLoader(file_path, encoding='utf-8')
-                elif file.endswith(".pdf"):
-                    loader = PyPDFLoader(file_path)
-                else:
-                    print(f"Skipping unsupported file type: {file_path}")
-                    continue
+class VersionedChroma(Chroma):
+    """A Chroma store that knows the knowledge base version of its index, like NumpyVectorStore.version."""
+    def __init__(self, version: str, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.version = version
 
-                loaded_docs = loader.load()
-                documents.extend(text_splitter.split_documents(loaded_docs))
-                print(f"Loaded and chunked {len(loaded_docs)} pages from {file_path}")
-            except Exception as e:
-                print(f"Error loading {file_path}: {e}")
+
+def load_knowledge_base_chunks(stats: Optional[IngestionStats] = None) -> List[Document]:
+    """Loads and chunks every supported file under the knowledge base data directory, in INGEST_WORKERS processes."""
+    print(f"Loading documents from {KNOWLEDGE_BASE_DATA_DIR}...")
+    documents = load_chunks(KNOWLEDGE_BASE_DATA_DIR, INGEST_WORKERS, stats)
 
     if not documents:
         print("No documents loaded into knowledge base.")
         raise RuntimeError("No documents found in knowledge base directory to load. Please add content to your 'data' folder.")
 
     print(f"Total chunks created: {len(documents)}")
+    return documents
 
-    embeddings = HuggingFaceEmbeddings( 
-        model_name=EMBEDDING_MODEL_NAME,
-        model_kwargs={'device': 'cuda' if torch.cuda.is_available() else 'cpu'}
+
+async def load_rag_knowledge_base():
+    global knowledge_base_chunks, knowledge_base_version
+    stats = IngestionStats()
+    documents = load_knowledge_base_chunks(stats)
+    knowledge_base_chunks = documents
+    knowledge_base_version = content_hash(EMBEDDING_MODEL_NAME, *(doc.page_content for doc in documents))
+
+    embeddings = CachedEmbeddings(
+        HuggingFaceEmbeddings( 
+            model_name=EMBEDDING_MODEL_NAME,
+            model_kwargs={'device': 'cuda' if torch.cuda.is_available() else 'cpu'},
+            encode_kwargs={'batch_size': EMBEDDING_ENCODE_BATCH_SIZE}
+        ),
+        index_version=knowledge_base_version
     )
     print(f"Embedding model '{EMBEDDING_MODEL_NAME}' loaded using HuggingFaceEmbeddings.")
 
+    if VECTOR_BACKEND == "numpy":
+        from services.numpy_vector_store import NumpyVectorStore
+        if NumpyVectorStore.stored_version(NUMPY_VECTOR_INDEX_PATH) == knowledge_base_version:
+            print(f"Found up-to-date NumPy vector index at {NUMPY_VECTOR_INDEX_PATH}. Memory-mapping it.")
+            vectorstore = NumpyVectorStore(embeddings, NUMPY_VECTOR_INDEX_PATH)
+        else:
+            print(f"Building NumPy vector index at {NUMPY_VECTOR_INDEX_PATH}...")
+            vectorstore = NumpyVectorStore.build(documents, embeddings, NUMPY_VECTOR_INDEX_PATH, version=knowledge_base_version, batch_size=INGEST_BATCH_SIZE, stats=stats)
+            print(f"NumPy vector index built and persisted: {stats.summary()}")
+        print("Vector store initialized.")
+        return vectorstore
+    elif VECTOR_BACKEND != "chroma":
+        raise RuntimeError(f"Unknown VECTOR_BACKEND '{VECTOR_BACKEND}'. Expected 'chroma' or 'numpy'.")
+
     os.makedirs(VECTOR_DB_PERSIST_PATH, exist_ok=True)
 
-    if os.path.exists(VECTOR_DB_PERSIST_PATH) and os.listdir(VECTOR_DB_PERSIST_PATH):
-        print(f"Found existing vector store at {VECTOR_DB_PERSIST_PATH}. Loading it.")
-        vectorstore = Chroma(persist_directory=VECTOR_DB_PERSIST_PATH, embedding_function=embeddings)
-    else:
-        print(f"No existing vector store found. Creating new one at {VECTOR_DB_PERSIST_PATH}...")
-        vectorstore = Chroma.from_documents(documents, embeddings, persist_directory=VECTOR_DB_PERSIST_PATH)
-        print("New vector store created and persisted.")
+    # One worker checks and (re)builds the index at a time; the others then find it current.
+    with locked(os.path.join(VECTOR_DB_PERSIST_PATH, CHROMA_LOCK_FILE)):
+        client, collection = open_chroma_collection(VECTOR_DB_PERSIST_PATH)
+        stored_version = chroma_index_version(collection)
+        if stored_version == knowledge_base_version:
+            print(f"Found up-to-date vector store at {VECTOR_DB_PERSIST_PATH}. Loading it.")
+        else:
+            if collection.count():
+                print(f"Vector store at {VECTOR_DB_PERSIST_PATH} was built from knowledge base version {stored_version or 'unknown'}, "
+                      f"not {knowledge_base_version}. Rebuilding it...")
+            else:
+                print(f"No existing vector store found. Creating new one at {VECTOR_DB_PERSIST_PATH}...")
+            rebuild_chroma_collection(client, knowledge_base_version, documents, embeddings, INGEST_BATCH_SIZE, stats)
+            print(f"New vector store created and persisted: {stats.summary()}")
+    vectorstore = VersionedChroma(knowledge_base_version, client=client, collection_name=CHROMA_COLLECTION, embedding_function=embeddings)
 
     print("Vector store initialized.")
     return vectorstore
 
 
-async def initialize_rag_components(knowledge_base: Any) -> RAGAssistant:
+def load_pretrained_llm(device: str) -> Tuple[Any, Any]:
+    """Loads the configured Hugging Face causal LM and its tokenizer."""
+    tokenizer = AutoTokenizer.from_pretrained(LLM_MODEL_NAME, token=HF_TOKEN, trust_remote_code=True)
+    model = AutoModelForCausalLM.from_pretrained(
+        LLM_MODEL_NAME,
+        torch_dtype=torch.float32,
+        device_map="auto" if device == "cuda" else None,
+        token=HF_TOKEN,
+        trust_remote_code=True
+    )
+    model.eval()
+    return tokenizer, model
+
+
+async def initialize_rag_components(
+    knowledge_base: Any,
+    llm_loader: Callable[[str], Tuple[Any, Any]] = load_pretrained_llm,
+    overview_contexts_path: str = OVERVIEW_CONTEXTS_PATH
+) -> RAGAssistant:
+    """
+    Builds the RAG chain and the off-topic classifier. `llm_loader(device)` returns a
+    (tokenizer, model) pair; it defaults to the configured Hugging Face model.
+    """
     print(f"Loading Hugging Face LLM '{LLM_MODEL_NAME}'...")
 
     device = "cuda" if torch.cuda.is_available() else "cpu"
@@ -204,15 +294,7 @@ async def initialize_rag_components(knowledge_base: Any) -> RAGAssistant:
     set_seed(42) 
 
     # Load tokenizer and model directly for the pipeline
-    tokenizer_rag = AutoTokenizer.from_pretrained(LLM_MODEL_NAME, token=HF_TOKEN, trust_remote_code=True)
-    model_rag = AutoModelForCausalLM.from_pretrained(
-        LLM_MODEL_NAME,
-        torch_dtype=torch.float32,
-        device_map="auto" if device == "cuda" else None,
-        token=HF_TOKEN,
-        trust_remote_code=True
-    )
-    model_rag.eval()
+    tokenizer_rag, model_rag = llm_loader(device)
 
     rag_pipeline_kwargs = {
         "max_new_tokens": 256,
@@ -220,7 +302,8 @@ async def initialize_rag_components(knowledge_base: Any) -> RAGAssistant:
         "do_sample": True,
         "repetition_penalty": 1.05,
         "pad_token_id": tokenizer_rag.eos_token_id, 
-        "return_full_text": False 
+        "return_full_text": False,
+        "stopping_criteria": generation_stopping_criteria()
     }
 
     llm = None 
@@ -232,7 +315,7 @@ async def initialize_rag_components(knowledge_base: Any) -> RAGAssistant:
             device=0 if device == "cuda" else -1,
             **rag_pipeline_kwargs 
         )
-        llm = HuggingFacePipeline(pipeline=pipe_rag)
+        llm = InstrumentedHuggingFacePipeline(pipeline=pipe_rag, pipeline_name="llm", max_new_tokens=rag_pipeline_kwargs["max_new_tokens"])
 
         print(f"Main LLM '{LLM_MODEL_NAME}' loaded successfully using HuggingFacePipeline.")
     except Exception as e:
@@ -263,21 +346,16 @@ async def initialize_rag_components(knowledge_base: Any) -> RAGAssistant:
     llm_chain = RetrievalQA.from_chain_type(
         llm=llm, 
         chain_type="stuff",
-        retriever=knowledge_base.as_retriever(search_kwargs={"k": 3}),
+        retriever=build_retriever(knowledge_base, knowledge_base_chunks, index_version=knowledge_base_version),
         return_source_documents=False,
         chain_type_kwargs={"prompt": RAG_PROMPT} 
     )
 
+    overview_contexts = OverviewContexts(overview_contexts_path, knowledge_base_version)
+    overview_contexts.prepare(llm_chain.retriever, overview_combinations())
+
     # Load tokenizer and model directly for the classifier pipeline
-    tokenizer_classifier = AutoTokenizer.from_pretrained(LLM_MODEL_NAME, token=HF_TOKEN, trust_remote_code=True)
-    model_classifier = AutoModelForCausalLM.from_pretrained(
-        LLM_MODEL_NAME,
-        torch_dtype=torch.float32, 
-        device_map="auto" if device == "cuda" else None, 
-        token=HF_TOKEN,
-        trust_remote_code=True
-    )
-    model_classifier.eval()
+    tokenizer_classifier, model_classifier = llm_loader(device)
 
     classifier_pipeline_kwargs = {
         "max_new_tokens": 10, 
@@ -285,7 +363,8 @@ async def initialize_rag_components(knowledge_base: Any) -> RAGAssistant:
         "do_sample": False, 
         "repetition_penalty": 1.0, 
         "pad_token_id": tokenizer_classifier.eos_token_id, 
-        "return_full_text": False 
+        "return_full_text": False,
+        "stopping_criteria": generation_stopping_criteria()
     }
 
     off_topic_classifier_llm = None 
@@ -297,12 +376,22 @@ async def initialize_rag_components(knowledge_base: Any) -> RAGAssistant:
             device=0 if device == "cuda" else -1,
             **classifier_pipeline_kwargs 
         )
-        off_topic_classifier_llm = HuggingFacePipeline(pipeline=off_topic_classifier_pipe)
+        off_topic_classifier_llm = InstrumentedHuggingFacePipeline(pipeline=off_topic_classifier_pipe, pipeline_name="topic_classifier", max_new_tokens=classifier_pipeline_kwargs["max_new_tokens"])
 
         print(f"Off-topic classifier LLM '{LLM_MODEL_NAME}' loaded successfully.")
     except Exception as e:
         print(f"FATAL ERROR: Failed to load off-topic classifier LLM '{LLM_MODEL_NAME}'. Details: {e}")
         raise RuntimeError(f"Failed to initialize off-topic classifier LLM: {e}") 
 
+    memory = None
+    if CONVERSATION_TOKEN_BUDGET > 0:
+        memory = ConversationStore(
+            count_tokens=lambda text: len(tokenizer_rag.encode(text, add_special_tokens=False)),
+            token_budget=CONVERSATION_TOKEN_BUDGET,
+            summary_tokens=CONVERSATION_SUMMARY_TOKENS,
+            max_sessions=CONVERSATION_MAX_SESSIONS,
+            idle_seconds=CONVERSATION_IDLE_SECONDS
+        )
+
     print("RAG Assistant components loaded successfully!")
-    return RAGAssistant(llm_chain=llm_chain, off_topic_classifier_llm=off_topic_classifier_llm)
\ No newline at end of file
+    return RAGAssistant(llm_chain=llm_chain, off_topic_classifier_llm=off_topic_classifier_llm, memory=memory, overview_contexts=overview_contexts)
\ No newline at end of file
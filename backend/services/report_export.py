@@ -0,0 +1,200 @@
+# backend/services/report_export.py
+"""
+Bulk report export: many sessions' PDFs streamed as one ZIP.
+
+Records come from a single cursor, fetched REPORT_EXPORT_BATCH_SIZE at a time.
+PDFs not already in the report cache are rendered in a pool of worker processes,
+and each one is written to the archive and sent as soon as it is ready, so entries
+arrive in completion order. At most one cursor batch of records and a few PDFs per
+worker are held at once, whatever the size of the cohort.
+"""
+import io
+import re
+import asyncio
+import datetime
+import itertools
+import multiprocessing
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from config.settings import REPORT_EXPORT_BATCH_SIZE, REPORT_EXPORT_WORKERS
+from models.request_models import ReportExportRequest
+from services.report_service import get_report_cache, render_report_pdf, report_cache_key
+from utils.observability import REPORT_CACHE_LOOKUPS, logger
+from utils.thread_budget import init_worker_thread_budget
+
+# Renders queued per worker, so a worker never waits for the event loop to hand it the next record.
+IN_FLIGHT_PER_WORKER = 2
+_UNSAFE_NAME_CHARS = re.compile(r"[^A-Za-z0-9._-]")
+
+_render_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_render_pool() -> Optional[ProcessPoolExecutor]:
+    """The shared render processes, started on first use; None renders in the threadpool instead."""
+    global _render_pool
+    if REPORT_EXPORT_WORKERS <= 1:
+        return None
+    if _render_pool is None:
+        # "spawn", like knowledge base ingestion: forking a process with torch loaded is unsafe.
+        _render_pool = ProcessPoolExecutor(
+            max_workers=REPORT_EXPORT_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker_thread_budget, initargs=("render",)
+        )
+    return _render_pool
+
+
+def shutdown_render_pool() -> None:
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
+
+
+def _naive_utc(value: datetime.datetime) -> datetime.datetime:
+    # Records store naive UTC timestamps.
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def export_query(export_request: ReportExportRequest) -> Dict[str, Any]:
+    """The Mongo query for a request; uses only the session_id and last_updated indexes."""
+    if (export_request.session_ids is None) == (export_request.filter is None):
+        raise HTTPException(status_code=400, detail="Provide either session_ids or filter.")
+    if export_request.session_ids is not None:
+        return {"session_id": {"$in": list(dict.fromkeys(export_request.session_ids))}}
+
+    report_filter = export_request.filter
+    query: Dict[str, Any] = {}
+    if report_filter.session_id_prefix:
+        # A range rather than a regex, so the session_id index is used.
+        query["session_id"] = {"$gte": report_filter.session_id_prefix, "$lt": report_filter.session_id_prefix + "\uffff"}
+    updated: Dict[str, Any] = {}
+    if report_filter.updated_after is not None:
+        updated["$gte"] = _naive_utc(report_filter.updated_after)
+    if report_filter.updated_before is not None:
+        updated["$lt"] = _naive_utc(report_filter.updated_before)
+    if updated:
+        query["last_updated"] = updated
+    if not query:
+        raise HTTPException(status_code=400, detail="The filter needs at least one of session_id_prefix, updated_after or updated_before.")
+    return query
+
+
+class _ZipSink(io.RawIOBase):
+    """Write-only, unseekable target for ZipFile; the bytes written so far are taken with drain()."""
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _entry_name(session_id: str, used: Set[str]) -> str:
+    base = f"Fitness_Report_{_UNSAFE_NAME_CHARS.sub('_', session_id)}"
+    name = f"{base}.pdf"
+    for n in itertools.count(2):
+        if name not in used:
+            break
+        name = f"{base}_{n}.pdf"
+    used.add(name)
+    return name
+
+
+def _write_entry(archive: zipfile.ZipFile, name: str, data: bytes) -> None:
+    info = zipfile.ZipInfo(name, date_time=datetime.datetime.now().timetuple()[:6])
+    # PDFs are already compressed.
+    info.compress_type = zipfile.ZIP_STORED
+    archive.writestr(info, data)
+
+
+async def stream_report_zip(cursor: Iterator[Dict[str, Any]], requested_session_ids: Optional[List[str]] = None) -> AsyncIterator[bytes]:
+    """
+    Yields a ZIP of the reports for the records `cursor` returns (REPORT_PROJECTION
+    fields). Requested sessions without a record, and reports that failed to render,
+    are listed in export_errors.txt.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_render_pool()
+    cache = get_report_cache()
+    max_in_flight = max(REPORT_EXPORT_WORKERS, 1) * IN_FLIGHT_PER_WORKER
+
+    sink = _ZipSink()
+    archive = zipfile.ZipFile(sink, "w")
+    names: Set[str] = set()
+    found: Set[str] = set()
+    errors: List[str] = []
+    records: Deque[Dict[str, Any]] = deque()
+    in_flight: Dict["asyncio.Future[bytes]", Tuple[str, str]] = {}
+    cursor_done = False
+    remaining = iter(cursor)
+
+    try:
+        while True:
+            while not cursor_done and len(in_flight) < max_in_flight:
+                if not records:
+                    batch = await run_in_threadpool(lambda: list(itertools.islice(remaining, REPORT_EXPORT_BATCH_SIZE)))
+                    if not batch:
+                        cursor_done = True
+                        break
+                    records.extend(batch)
+                record = records.popleft()
+                session_id = record["session_id"]
+                found.add(session_id)
+                key = report_cache_key(record, None)
+                pdf, tier = cache.lookup(key)
+                if pdf is not None:
+                    REPORT_CACHE_LOOKUPS.labels(tier).inc()
+                    _write_entry(archive, _entry_name(session_id, names), pdf)
+                    yield sink.drain()
+                    continue
+                in_flight[loop.run_in_executor(pool, render_report_pdf, record, None)] = (session_id, key)
+
+            if not in_flight:
+                break
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                session_id, key = in_flight.pop(future)
+                try:
+                    pdf = future.result()
+                except BrokenProcessPool:
+                    shutdown_render_pool()  # the next export starts fresh processes
+                    raise
+                except Exception as e:
+                    logger.error("Report export: rendering %s failed: %s", session_id, e)
+                    errors.append(f"{session_id}: rendering failed ({e})")
+                    continue
+                REPORT_CACHE_LOOKUPS.labels("rendered").inc()
+                cache.put(key, pdf)
+                _write_entry(archive, _entry_name(session_id, names), pdf)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+
+        if requested_session_ids is not None:
+            errors.extend(f"{session_id}: no predictions found" for session_id in dict.fromkeys(requested_session_ids) if session_id not in found)
+        if errors:
+            archive.writestr("export_errors.txt", "\n".join(errors) + "\n")
+        archive.close()
+        yield sink.drain()
+    finally:
+        for future in in_flight:
+            future.cancel()
+        if hasattr(cursor, "close"):
+            cursor.close()
@@ -1,33 +1,69 @@
 # backend/services/report_service.py
 import io
+import json
 import datetime
 from typing import Any, Dict, Optional
-from fastapi import HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import HTTPException, Response
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib import colors
+from starlette.concurrency import run_in_threadpool
 
-from models.request_models import ReportRequest, UserPersonalDetails
-from database.mongodb_client import get_db_collection
-from utils.helpers import convert_numpy_types
+from config.settings import REPORT_CACHE_CONTROL, REPORT_CACHE_DIR, REPORT_CACHE_DISK_MB, REPORT_CACHE_MEMORY_MB, SESSION_TTL_DAYS
+from models.request_models import ReportRequest
+from database.mongodb_client import get_db_collection, REPORT_PROJECTION
+from utils.blob_cache import BlobCache
+from utils.lru_cache import content_hash
+from utils.observability import REPORT_CACHE_LOOKUPS, stage_timer
 
-async def generate_report(report_request: ReportRequest) -> StreamingResponse:
+# Part of every cache key and ETag; bump it whenever render_report_pdf's output changes.
+REPORT_TEMPLATE_VERSION = "1"
+# The record fields render_report_pdf reads.
+REPORT_FIELDS = ("raw_user_input", "exercise_predictions", "diet_predictions")
+
+_report_cache: Optional[BlobCache] = None
+
+
+def get_report_cache() -> BlobCache:
+    global _report_cache
+    if _report_cache is None:
+        _report_cache = BlobCache(
+            int(REPORT_CACHE_MEMORY_MB * 1024 * 1024),
+            REPORT_CACHE_DIR,
+            int(REPORT_CACHE_DISK_MB * 1024 * 1024),
+            suffix=".pdf",
+            # PDFs carry personal data: none outlives the session record it was rendered from.
+            max_age_seconds=SESSION_TTL_DAYS * 24 * 60 * 60 if SESSION_TTL_DAYS > 0 else None
+        )
+    return _report_cache
+
+
+def report_cache_key(prediction_record: Dict[str, Any], user_details: Optional[Dict[str, Any]]) -> str:
     """
-    Generates a PDF report based on stored session predictions and user details.
+    Hash of everything the rendered PDF depends on. Keys are sorted, so the same record
+    hashes the same however its fields came to be ordered (a buffered write-behind record
+    and the stored document differ).
     """
-    try:
-        predictions_collection = get_db_collection("predictions")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
+    return content_hash(
+        REPORT_TEMPLATE_VERSION,
+        json.dumps({field: prediction_record.get(field) for field in REPORT_FIELDS}, sort_keys=True, default=str),
+        json.dumps(user_details or {}, sort_keys=True, default=str)
+    )
 
-    prediction_record = predictions_collection.find_one({"session_id": report_request.session_id})
 
-    if not prediction_record:
-        raise HTTPException(status_code=404, detail=f"No predictions found for session ID: {report_request.session_id}")
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # Weak comparison, as RFC 9110 prescribes for If-None-Match; "*" matches any current
+    # representation, which a report whose record was found always has.
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
 
+def render_report_pdf(prediction_record: Dict[str, Any], user_details: Optional[Dict[str, Any]]) -> bytes:
+    """Renders the report for a record (REPORT_PROJECTION fields) and optional personal details."""
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=letter,
                             rightMargin=inch, leftMargin=inch,
@@ -75,13 +111,13 @@ async def generate_report(report_request: ReportRequest) -> StreamingResponse:
     elements.append(Spacer(1, 0.3 * inch))
 
     # User Details
-    if report_request.user_details and any(report_request.user_details.dict().values()):
+    if user_details and any(user_details.values()):
         elements.append(Paragraph("User Personal Details", styles['SectionHeader']))
         user_data = []
-        if report_request.user_details.first_name: user_data.append(["First Name:", report_request.user_details.first_name])
-        if report_request.user_details.last_name: user_data.append(["Last Name:", report_request.user_details.last_name])
-        if report_request.user_details.email: user_data.append(["Email:", report_request.user_details.email])
-        if report_request.user_details.phone: user_data.append(["Phone:", report_request.user_details.phone])
+        if user_details.get("first_name"): user_data.append(["First Name:", user_details["first_name"]])
+        if user_details.get("last_name"): user_data.append(["Last Name:", user_details["last_name"]])
+        if user_details.get("email"): user_data.append(["Email:", user_details["email"]])
+        if user_details.get("phone"): user_data.append(["Phone:", user_details["phone"]])
         
         if user_data:
             table_style = TableStyle([
@@ -176,9 +212,53 @@ async def generate_report(report_request: ReportRequest) -> StreamingResponse:
         elements.append(Spacer(1, 0.2 * inch))
 
     # Build PDF
-    doc.build(elements)
-    buffer.seek(0)
+    with stage_timer("pdf_build"):
+        doc.build(elements)
+    return buffer.getvalue()
+
+
+async def generate_report(report_request: ReportRequest) -> Response:
+    """
+    Generates a PDF report based on stored session predictions and user details
+    (POST /generate_report). Always answers with the PDF: conditional requests are
+    for GET /reports/{session_id}, since caches never revalidate a POST.
+    """
+    user_details = report_request.user_details.dict() if report_request.user_details else None
+    return await report_response(report_request.session_id, user_details)
+
+
+async def report_response(session_id: str, user_details: Optional[Dict[str, Any]], if_none_match: Optional[str] = None) -> Response:
+    """
+    The session's report. The PDF is cached under a hash of its inputs, which is also
+    its ETag, so a repeated download is served without rendering and a matching
+    If-None-Match (GET only) gets a 304.
+    """
+    try:
+        predictions_collection = get_db_collection("predictions")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {e}")
+
+    with stage_timer("mongo_read"):
+        prediction_record = predictions_collection.find_one({"session_id": session_id}, REPORT_PROJECTION)
+
+    if not prediction_record:
+        raise HTTPException(status_code=404, detail=f"No predictions found for session ID: {session_id}")
+
+    key = report_cache_key(prediction_record, user_details)
+    etag = f'"{key}"'
+    cache_headers = {"ETag": etag, "Cache-Control": REPORT_CACHE_CONTROL}
+    if _etag_matches(if_none_match, etag):
+        REPORT_CACHE_LOOKUPS.labels("not_modified").inc()
+        return Response(status_code=304, headers=cache_headers)
+
+    cache = get_report_cache()
+    pdf, tier = cache.lookup(key)
+    if pdf is None:
+        pdf = await run_in_threadpool(render_report_pdf, prediction_record, user_details)
+        cache.put(key, pdf)
+        tier = "rendered"
+    REPORT_CACHE_LOOKUPS.labels(tier).inc()
 
-    filename = f"Fitness_Report_{report_request.session_id}_{datetime.date.today()}.pdf"
-    return StreamingResponse(buffer, media_type="application/pdf",
-                             headers={"Content-Disposition": f"attachment; filename={filename}"})
\ No newline at end of file
+    filename = f"Fitness_Report_{session_id}_{datetime.date.today()}.pdf"
+    return Response(content=pdf, media_type="application/pdf",
+                    headers={"Content-Disposition": f"attachment; filename={filename}", **cache_headers})
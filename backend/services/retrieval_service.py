@@ -0,0 +1,258 @@
+# backend/services/retrieval_service.py
+import copy
+import math
+import re
+import heapq
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+
+from config.settings import (
+    RETRIEVAL_MODE,
+    RETRIEVAL_TOP_K,
+    BM25_K1,
+    BM25_B,
+    LEXICAL_MAX_QUERY_TERMS,
+    EMBEDDING_CACHE_SIZE,
+    RETRIEVAL_CACHE_SIZE
+)
+from utils.lru_cache import LRUCache, content_hash
+from utils.observability import stage_timer
+from utils.thread_budget import thread_budget
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[+'-][a-z0-9]+)*")
+
+_STOPWORDS = frozenset("""
+a about after all also am an and any are as at be because been before being both
+but by can could did do does doing for from had has have having how i if in into
+is it its just me more most my no not of on or our should so some such than that
+the their them then there these they this those to too up very was we were what
+when where which while who why will with would you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercases and splits text into index terms, dropping stopwords and folding
+    simple plurals so "squats" and "squat" match.
+    """
+    terms = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        terms.append(token)
+    return terms
+
+
+class BM25Index:
+    """
+    In-process inverted index with Okapi BM25 scoring over the knowledge base chunks.
+    """
+    def __init__(self, documents: List[Document], k1: float = BM25_K1, b: float = BM25_B):
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._doc_lengths: List[int] = []
+
+        for doc_id, doc in enumerate(documents):
+            term_counts = Counter(tokenize(doc.page_content))
+            self._doc_lengths.append(sum(term_counts.values()))
+            for term, tf in term_counts.items():
+                self._postings.setdefault(term, {})[doc_id] = tf
+
+        num_docs = len(documents)
+        self._avg_doc_length = (sum(self._doc_lengths) / num_docs) if num_docs else 0.0
+        self._idf = {
+            term: math.log(1 + (num_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def idf(self, term: str) -> float:
+        return self._idf.get(term, 0.0)
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Returns up to k (doc_id, score) pairs, best first."""
+        return self.search_terms(tokenize(query), k)
+
+    def search_terms(self, terms: List[str], k: int) -> List[Tuple[int, float]]:
+        scores: Dict[int, float] = {}
+        for term in set(terms):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf[term]
+            for doc_id, tf in postings.items():
+                length_norm = 1 - self.b + self.b * self._doc_lengths[doc_id] / self._avg_doc_length
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def contains_all(self, doc_id: int, terms: List[str]) -> bool:
+        return all(doc_id in self._postings.get(term, {}) for term in terms)
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int, rrf_k: int = 60) -> List[Document]:
+    """Fuses several ranked document lists, identifying documents by their content."""
+    fused_scores: Dict[str, float] = {}
+    by_content: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            fused_scores[doc.page_content] = fused_scores.get(doc.page_content, 0.0) + 1.0 / (rrf_k + rank + 1)
+            by_content.setdefault(doc.page_content, doc)
+    best = sorted(fused_scores.items(), key=lambda item: item[1], reverse=True)[:k]
+    return [by_content[content] for content, _ in best]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever combining the BM25 index with the dense vector store.
+
+    Short keyword queries (food and exercise names) whose terms all appear in the best
+    lexical hit skip the embedding model entirely; everything else is answered by
+    fusing the lexical and dense rankings.
+    """
+    vectorstore: Any
+    lexical_index: Any
+    k: int = RETRIEVAL_TOP_K
+    mode: str = RETRIEVAL_MODE
+    max_lexical_terms: int = LEXICAL_MAX_QUERY_TERMS
+
+    def _lexical_documents(self, terms: List[str], k: int) -> List[Document]:
+        return [self.lexical_index.documents[doc_id] for doc_id, _ in self.lexical_index.search_terms(terms, k)]
+
+    def _dense_documents(self, query: str, k: int) -> List[Document]:
+        return self.vectorstore.similarity_search(query, k=k)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        with stage_timer("retrieval"):
+            return self._search(query)
+
+    def _search(self, query: str) -> List[Document]:
+        if self.mode == "dense":
+            return self._dense_documents(query, self.k)
+
+        terms = tokenize(query)
+        if self.mode == "bm25":
+            return self._lexical_documents(terms, self.k)
+
+        unique_terms = list(dict.fromkeys(terms))
+        lexical_hits = self.lexical_index.search_terms(unique_terms, 2 * self.k)
+        if (
+            lexical_hits
+            and len(unique_terms) <= self.max_lexical_terms
+            and self.lexical_index.contains_all(lexical_hits[0][0], unique_terms)
+        ):
+            return [self.lexical_index.documents[doc_id] for doc_id, _ in lexical_hits[:self.k]]
+
+        lexical_docs = [self.lexical_index.documents[doc_id] for doc_id, _ in lexical_hits]
+        dense_docs = self._dense_documents(query, 2 * self.k)
+        return reciprocal_rank_fusion([dense_docs, lexical_docs], self.k)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Memoizes an embedding model by content hash so repeated texts (identical chat
+    questions, unchanged overview records) never reach the model twice. Keys include
+    the knowledge base version it was created for; a rebuilt knowledge base comes
+    with a new instance (see rag_service.load_rag_knowledge_base).
+    """
+    def __init__(self, inner: Embeddings, index_version: str = "", maxsize: int = EMBEDDING_CACHE_SIZE):
+        self.inner = inner
+        self.index_version = index_version
+        self.cache = LRUCache(maxsize)
+
+    def _key(self, kind: str, text: str) -> str:
+        return content_hash(self.index_version, kind, text)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key("query", text)
+        vector = self.cache.get(key)
+        if vector is None:
+            with thread_budget("embedding"):
+                vector = self.inner.embed_query(text)
+            self.cache.put(key, vector)
+        return list(vector)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key("document", text) for text in texts]
+        vectors = [self.cache.get(key) for key in keys]
+        missing = {keys[i]: texts[i] for i, vector in enumerate(vectors) if vector is None}
+        if missing:
+            with thread_budget("embedding"):
+                computed = dict(zip(missing, self.inner.embed_documents(list(missing.values()))))
+            for key, vector in computed.items():
+                self.cache.put(key, vector)
+            vectors = [vector if vector is not None else computed[key] for key, vector in zip(keys, vectors)]
+        return [list(vector) for vector in vectors]
+
+
+class CachingRetriever(BaseRetriever):
+    """
+    Memoizes another retriever's results by query hash. Entries are keyed on the
+    knowledge base version the retriever was built for (build_retriever is called
+    again, with the new version, whenever the knowledge base is reloaded). Cached
+    documents are copies, and each hit gets its own copies, so a caller editing the
+    documents it got cannot change what later queries receive.
+    """
+    inner: BaseRetriever
+    cache: Any
+    index_version: str = ""
+
+    @staticmethod
+    def _copies(docs: List[Document]) -> List[Document]:
+        return [Document(page_content=doc.page_content, metadata=copy.deepcopy(doc.metadata)) for doc in docs]
+
+    def _lookup(self, query: str) -> Tuple[str, Optional[List[Document]]]:
+        key = content_hash(self.index_version, query)
+        cached = self.cache.get(key)
+        if cached is None:
+            return key, None
+        return key, self._copies(cached)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        key, cached = self._lookup(query)
+        if cached is not None:
+            return cached
+        docs = self.inner.invoke(query, config={"callbacks": run_manager.get_child()})
+        self.cache.put(key, self._copies(docs))
+        return docs
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        key, cached = self._lookup(query)
+        if cached is not None:
+            return cached
+        docs = await self.inner.ainvoke(query, config={"callbacks": run_manager.get_child()})
+        self.cache.put(key, self._copies(docs))
+        return docs
+
+
+def build_retriever(vectorstore: Any, documents: List[Document], mode: Optional[str] = None, k: Optional[int] = None, index_version: str = "") -> BaseRetriever:
+    """Builds the configured retriever over the vector store and its source chunks."""
+    mode = mode or RETRIEVAL_MODE
+    k = k or RETRIEVAL_TOP_K
+    if mode not in ("dense", "bm25", "hybrid"):
+        raise ValueError(f"Unknown RETRIEVAL_MODE '{mode}'. Expected 'dense', 'bm25' or 'hybrid'.")
+    if mode != "dense" and not documents:
+        raise RuntimeError("Lexical retrieval requires the knowledge base chunks, but none were loaded.")
+    # The BM25 side is built from `documents`; the dense side must index the same corpus,
+    # or fusion ranks two different knowledge bases (and the caches key them as one).
+    vector_version = getattr(vectorstore, "version", None)
+    if index_version and vector_version is not None and vector_version != index_version:
+        raise RuntimeError(f"The vector index was built from knowledge base version {vector_version or 'unknown'}, "
+                           f"but the loaded chunks are version {index_version}. Rebuild the index.")
+
+    lexical_index = BM25Index(documents) if mode != "dense" else None
+    print(f"Retriever initialized in '{mode}' mode (k={k}).")
+    retriever: BaseRetriever = HybridRetriever(vectorstore=vectorstore, lexical_index=lexical_index, k=k, mode=mode)
+    if RETRIEVAL_CACHE_SIZE > 0:
+        retriever = CachingRetriever(inner=retriever, cache=LRUCache(RETRIEVAL_CACHE_SIZE), index_version=index_version)
+    return retriever
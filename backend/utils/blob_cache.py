@@ -0,0 +1,120 @@
+# backend/utils/blob_cache.py
+"""
+Byte blobs by content key, in two tiers: an LRU in memory bounded by total bytes,
+and a directory on disk bounded the same way. Every blob is written to disk when
+it is stored, so worker processes on one host share the disk tier. Disk hits are
+promoted into memory. The disk tier is pruned least recently used first once the
+bytes written since the last prune reach a tenth of its budget. With max_age_seconds,
+disk blobs older than that (since written, however often read) are misses and are
+removed: at startup, by every prune, and at least hourly while the cache is in use.
+"""
+import os
+import time
+import threading
+from typing import Optional, Tuple
+
+from utils.lru_cache import LRUCache
+
+_EXPIRE_INTERVAL_SECONDS = 3600
+
+
+class BlobCache:
+    def __init__(self, memory_bytes: int, directory: Optional[str], disk_bytes: int, suffix: str = "", max_age_seconds: Optional[float] = None):
+        self.memory = LRUCache(memory_bytes, sizeof=len)
+        self.directory = directory if directory and disk_bytes > 0 else None
+        self.disk_bytes = disk_bytes
+        self.suffix = suffix
+        self.max_age_seconds = max_age_seconds
+        self._written_since_prune = 0
+        self._next_expiry = 0.0
+        self._lock = threading.Lock()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._expire_if_due()
+
+    def _expired(self, written_at: float) -> bool:
+        return self.max_age_seconds is not None and time.time() - written_at > self.max_age_seconds
+
+    def _expire_if_due(self) -> None:
+        if self.max_age_seconds is None:
+            return
+        with self._lock:
+            if time.time() < self._next_expiry:
+                return
+            self._next_expiry = time.time() + _EXPIRE_INTERVAL_SECONDS
+        self._prune()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.suffix)
+
+    def lookup(self, key: str) -> Tuple[Optional[bytes], Optional[str]]:
+        """The blob and the tier it came from ("memory" or "disk"), or (None, None)."""
+        data = self.memory.get(key)
+        if data is not None:
+            return data, "memory"
+        if self.directory is None:
+            return None, None
+        self._expire_if_due()
+        path = self._path(key)
+        try:
+            written_at = os.stat(path).st_mtime
+            if self._expired(written_at):
+                os.remove(path)
+                return None, None
+            with open(path, "rb") as f:
+                data = f.read()
+            # Pruning goes by access time, so a read counts as a use; the mtime stays the write time.
+            os.utime(path, (time.time(), written_at))
+        except OSError:
+            return None, None
+        self.memory.put(key, data)
+        return data, "disk"
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.lookup(key)[0]
+
+    def put(self, key: str, data: bytes) -> None:
+        self.memory.put(key, data)
+        if self.directory is None or len(data) > self.disk_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Blob cache: could not write {path}: {e}")
+            return
+        with self._lock:
+            self._written_since_prune += len(data)
+            if self._written_since_prune < self.disk_bytes / 10:
+                return
+            self._written_since_prune = 0
+        self._prune()
+
+    def _prune(self) -> None:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(self.suffix) and not entry.name.endswith(".tmp"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # removed by another worker
+                if self._expired(stat.st_mtime):
+                    self._remove(entry.path)
+                    continue
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass  # removed by another worker
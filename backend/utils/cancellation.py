@@ -0,0 +1,91 @@
+# backend/utils/cancellation.py
+import time
+import asyncio
+import contextvars
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator, Optional
+
+from starlette.requests import Request
+
+from config.settings import LLM_REQUEST_DEADLINE_SECONDS
+
+# How often the disconnect watcher polls the ASGI receive channel.
+DISCONNECT_POLL_INTERVAL = 0.25
+
+
+class GenerationCancelled(Exception):
+    """Raised when work for a request is abandoned because of a disconnect or deadline."""
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CancellationToken:
+    """
+    Request-scoped cancellation flag. It is set from the event loop (disconnect) or
+    lazily once the deadline passes, and polled from generation threads.
+    """
+    def __init__(self, deadline: Optional[float] = None):
+        self.deadline = deadline  # time.monotonic() value, or None for no deadline
+        self.reason: Optional[str] = None
+
+    @classmethod
+    def with_timeout(cls, seconds: Optional[float]) -> "CancellationToken":
+        return cls(None if seconds is None else time.monotonic() + seconds)
+
+    def cancel(self, reason: str) -> None:
+        if self.reason is None:
+            self.reason = reason
+
+    @property
+    def cancelled(self) -> bool:
+        if self.reason is None and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.reason = "deadline"
+        return self.reason is not None
+
+    def remaining(self) -> Optional[float]:
+        return None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise GenerationCancelled(self.reason)  # type: ignore[arg-type]
+
+
+_current_cancellation: contextvars.ContextVar[Optional[CancellationToken]] = contextvars.ContextVar("vitafit_cancellation", default=None)
+
+
+def current_cancellation() -> Optional[CancellationToken]:
+    return _current_cancellation.get()
+
+
+@contextmanager
+def cancellation_scope(token: CancellationToken) -> Iterator[CancellationToken]:
+    """Makes `token` visible to code run from this context, including executor threads that copy it."""
+    ctx_token = _current_cancellation.set(token)
+    try:
+        yield token
+    finally:
+        _current_cancellation.reset(ctx_token)
+
+
+async def _watch_disconnect(request: Request, token: CancellationToken) -> None:
+    while not token.cancelled:
+        if await request.is_disconnected():
+            token.cancel("disconnect")
+            return
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+@asynccontextmanager
+async def request_cancellation(request: Request, deadline_seconds: float = LLM_REQUEST_DEADLINE_SECONDS) -> AsyncIterator[CancellationToken]:
+    """
+    Cancels the request's generation work when the client disconnects or
+    `deadline_seconds` (0 disables) elapse.
+    """
+    token = CancellationToken.with_timeout(deadline_seconds if deadline_seconds > 0 else None)
+    watcher = asyncio.create_task(_watch_disconnect(request, token))
+    try:
+        with cancellation_scope(token):
+            yield token
+    finally:
+        watcher.cancel()
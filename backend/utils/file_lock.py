@@ -0,0 +1,55 @@
+# backend/utils/file_lock.py
+"""
+Advisory locks between processes on a lock file, on POSIX and Windows.
+
+fcntl.flock is POSIX-only. On Windows the first byte of the file is locked with
+msvcrt.locking instead; Windows has no shared locks, so a shared lock is an
+exclusive one there.
+"""
+import time
+from contextlib import contextmanager
+from typing import IO, Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+_WINDOWS_RETRY_SECONDS = 0.05
+
+
+def lock_file(file: IO, exclusive: bool = True, blocking: bool = True) -> None:
+    """Locks the open `file`; without `blocking`, raises BlockingIOError if another process holds it."""
+    if fcntl is not None:
+        operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        fcntl.flock(file, operation if blocking else operation | fcntl.LOCK_NB)
+        return
+    while True:
+        file.seek(0)
+        try:
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+            return
+        except OSError:
+            if not blocking:
+                raise BlockingIOError(f"{file.name} is locked by another process")
+            time.sleep(_WINDOWS_RETRY_SECONDS)
+
+
+def unlock_file(file: IO) -> None:
+    if fcntl is not None:
+        fcntl.flock(file, fcntl.LOCK_UN)
+        return
+    file.seek(0)
+    msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def locked(path: str, exclusive: bool = True) -> Iterator[None]:
+    """Holds a lock on the file at `path`, created if missing, for the duration of the block."""
+    with open(path, "a") as file:
+        lock_file(file, exclusive)
+        try:
+            yield
+        finally:
+            unlock_file(file)
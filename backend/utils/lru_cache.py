@@ -0,0 +1,87 @@
+# backend/utils/lru_cache.py
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+def content_hash(*parts: Any) -> str:
+    """Stable SHA-256 key over the string form of the given parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded least-recently-used cache with hit/miss counters.
+    With `sizeof`, maxsize bounds the total of sizeof(value) rather than the entry count.
+    """
+
+    def __init__(self, maxsize: int, sizeof: Optional[Callable[[Any], int]] = None):
+        self.maxsize = maxsize
+        self.sizeof = sizeof
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def _weight(self, value: Any) -> int:
+        return self.sizeof(value) if self.sizeof is not None else 1
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0 or self._weight(value) > self.maxsize:
+            return
+        with self._lock:
+            if key in self._data:
+                self._size -= self._weight(self._data[key])
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._size += self._weight(value)
+            while self._size > self.maxsize:
+                _, evicted = self._data.popitem(last=False)
+                self._size -= self._weight(evicted)
+
+    def pop(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data.pop(key)
+            self._size -= self._weight(value)
+            return value
+
+    def evict_while(self, predicate: Callable[[Any], bool]) -> int:
+        """Drops least-recently-used entries for as long as `predicate(value)` holds; returns how many."""
+        evicted = 0
+        with self._lock:
+            while self._data and predicate(next(iter(self._data.values()))):
+                _, value = self._data.popitem(last=False)
+                self._size -= self._weight(value)
+                evicted += 1
+        return evicted
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,197 @@
+# backend/utils/observability.py
+import os
+import time
+import logging
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterator, Optional
+
+from fastapi import Response
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+from config.settings import LOG_LEVEL, OTEL_ENABLED, OTEL_SERVICE_NAME
+
+logger = logging.getLogger("vitafit")
+
+_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+STAGE_LATENCY = Histogram(
+    "vitafit_stage_latency_seconds",
+    "Latency of individual backend pipeline stages.",
+    ["stage"],
+    buckets=_LATENCY_BUCKETS
+)
+HTTP_REQUEST_LATENCY = Histogram(
+    "vitafit_http_request_duration_seconds",
+    "End-to-end HTTP request latency by route.",
+    ["method", "route", "status"],
+    buckets=_LATENCY_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "vitafit_llm_generated_tokens_total",
+    "Tokens generated by the LLM pipelines.",
+    ["pipeline"]
+)
+LLM_PROMPT_TOKENS = Histogram(
+    "vitafit_llm_prompt_tokens",
+    "Prompt length in tokens per LLM call.",
+    ["pipeline"],
+    buckets=(16, 32, 64, 128, 256, 384, 512, 768, 1024, 1536, 2048, 4096)
+)
+OVERVIEW_CONTEXT_LOOKUPS = Counter(
+    "vitafit_overview_context_lookups_total",
+    "Where /ai/overview got its retrieved context: precomputed, computed (new combination) or retrieved (no plan in the record).",
+    ["source"]
+)
+LLM_CANCELLATIONS = Counter(
+    "vitafit_llm_cancellations_total",
+    "Generations stopped early because the client disconnected or the deadline passed.",
+    ["pipeline", "reason"]
+)
+LLM_RECLAIMED_SECONDS = Counter(
+    "vitafit_llm_reclaimed_seconds_total",
+    "Estimated decode time avoided by stopping cancelled generations (remaining token budget x per-token time).",
+    ["pipeline", "reason"]
+)
+SCHEDULER_DECISIONS = Counter(
+    "vitafit_scheduler_decisions_total",
+    "Admission decisions by endpoint class: admitted, queued, rate_limited, shed_queue_full, shed_timeout.",
+    ["endpoint_class", "decision"]
+)
+SCHEDULER_QUEUE_WAIT = Histogram(
+    "vitafit_scheduler_queue_wait_seconds",
+    "Time requests spent queued before being admitted.",
+    ["endpoint_class"],
+    buckets=_LATENCY_BUCKETS
+)
+SCHEDULER_IN_FLIGHT = Gauge(
+    "vitafit_scheduler_in_flight",
+    "Admitted requests currently running, by endpoint class.",
+    ["endpoint_class"],
+    multiprocess_mode="livesum"
+)
+SCHEDULER_QUEUE_DEPTH = Gauge(
+    "vitafit_scheduler_queue_depth",
+    "Requests waiting for admission, by endpoint class.",
+    ["endpoint_class"],
+    multiprocess_mode="livesum"
+)
+MODEL_RELOADS = Counter(
+    "vitafit_model_reloads_total",
+    "Background model reloads by outcome (swapped or failed).",
+    ["model", "outcome"]
+)
+REPORT_CACHE_LOOKUPS = Counter(
+    "vitafit_report_cache_lookups_total",
+    "Report PDFs by source: not_modified (304), memory or disk (cached PDF), rendered. Exports count once per report.",
+    ["result"]
+)
+WRITE_BEHIND_PENDING = Gauge(
+    "vitafit_write_behind_pending_sessions",
+    "Sessions with prediction updates buffered and not yet written to MongoDB.",
+    multiprocess_mode="livesum"
+)
+WRITE_BEHIND_FLUSHES = Counter(
+    "vitafit_write_behind_flushes_total",
+    "Write-behind bulk writes by outcome (written or failed; failed ones are retried).",
+    ["outcome"]
+)
+SINGLE_FLIGHT_REQUESTS = Counter(
+    "vitafit_single_flight_requests_total",
+    "Coalesced endpoints' requests by outcome: computed (started the work) or coalesced (shared an identical request already in flight).",
+    ["endpoint", "outcome"]
+)
+AI_OVERVIEW_RESPONSES = Counter(
+    "vitafit_ai_overview_responses_total",
+    "/ai/overview responses by source: stored (precomputed for the current record) or generated (possibly joining a running generation).",
+    ["source"]
+)
+OVERVIEW_PRECOMPUTES = Counter(
+    "vitafit_overview_precomputes_total",
+    "Background overview generations by outcome: stored, preempted (gave up after retries), cancelled, skipped (too many pending), no_record or failed.",
+    ["outcome"]
+)
+
+_tracer: Optional[Any] = None
+
+
+def configure_logging() -> None:
+    logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s [%(name)s] %(message)s")
+    logger.setLevel(LOG_LEVEL)
+
+
+def init_tracing(app: Any) -> None:
+    """Exports request and stage spans over OTLP when OTEL_ENABLED is set."""
+    global _tracer
+    if not OTEL_ENABLED:
+        return
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+    from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+
+    provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    FastAPIInstrumentor.instrument_app(app, excluded_urls="/metrics")
+    _tracer = trace.get_tracer("vitafit")
+    logger.info("OpenTelemetry tracing enabled for service '%s'.", OTEL_SERVICE_NAME)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Times a pipeline stage into the stage histogram (and an OTel span when tracing)."""
+    span = _tracer.start_as_current_span(stage) if _tracer is not None else nullcontext()
+    start = time.perf_counter()
+    with span:
+        try:
+            yield
+        finally:
+            STAGE_LATENCY.labels(stage).observe(time.perf_counter() - start)
+
+
+def record_stage(stage: str, start_ns: int, end_ns: int) -> None:
+    """Records a stage measured elsewhere (e.g. LLM prefill/decode from generation callbacks)."""
+    STAGE_LATENCY.labels(stage).observe(max(0, end_ns - start_ns) / 1e9)
+    if _tracer is not None:
+        span = _tracer.start_span(stage, start_time=start_ns)
+        span.end(end_time=end_ns)
+
+
+class RequestLatencyMiddleware:
+    """
+    Records HTTP_REQUEST_LATENCY per route. Written as plain ASGI rather than with
+    @app.middleware("http"), which wraps the receive channel and hides client
+    disconnects from the endpoints.
+    """
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_LATENCY.labels(scope["method"], getattr(route, "path", "unmatched"), str(status)).observe(time.perf_counter() - start)
+
+
+def metrics_response() -> Response:
+    """Prometheus exposition; aggregates all uvicorn workers when PROMETHEUS_MULTIPROC_DIR is set."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,254 @@
+# backend/utils/profiler.py
+"""
+On-demand profiling of live requests, per worker process.
+
+An admin starts a profile for one endpoint path, covering its next N requests and/or
+a time box. While one of those requests is in flight, a sampler thread records the
+Python stack of every busy thread every PROFILE_SAMPLE_INTERVAL_MS. Threads blocked
+in an idle wait are left out. Torch work inside op_profile() scopes (LLM generation,
+YOLO inference) of a profiled request is also run under torch.profiler, and its
+per-operator self CPU time is recorded. Both are returned as folded stacks
+("frame;frame;frame value" lines), which flamegraph.pl, speedscope and inferno read
+directly.
+
+When no profile is active, the middleware and op_profile() cost one attribute check,
+and no sampler thread runs. Samples are of the whole process: concurrent requests to
+other endpoints show up in them as well.
+"""
+import os
+import sys
+import time
+import uuid
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from config.settings import PROFILE_MAX_SECONDS, PROFILE_SAMPLE_INTERVAL_MS
+
+# Innermost frames of threads that are waiting for work rather than doing any.
+IDLE_LEAVES = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"), ("queue.py", "get"),
+    ("selectors.py", "select"), ("thread.py", "_worker"), ("connection.py", "_recv"),
+}
+# Frames deeper than this are cut from the root side.
+MAX_STACK_DEPTH = 128
+_PATH_MARKERS = ("site-packages" + os.sep, "backend" + os.sep, "lib" + os.sep + "python")
+
+
+def _short_path(path: str) -> str:
+    for marker in _PATH_MARKERS:
+        index = path.rfind(marker)
+        if index != -1:
+            return path[index + len(marker):]
+    return os.path.basename(path)
+
+
+def _frame_label(code: Any) -> str:
+    # First line rather than current line, so one function is one flamegraph frame.
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+class ProfileSession:
+    def __init__(self, endpoint: str, max_requests: Optional[int], seconds: float, sample_interval_ms: float, torch_ops: bool):
+        self.id = uuid.uuid4().hex[:12]
+        self.endpoint = endpoint
+        self.max_requests = max_requests
+        self.seconds = seconds
+        self.sample_interval = sample_interval_ms / 1000
+        self.torch_ops = torch_ops
+        self.started_at = time.time()
+        self.deadline = time.monotonic() + seconds
+        self.requests_started = 0
+        self.requests_completed = 0
+        self.in_flight = 0
+        self.latencies_ms: List[float] = []
+        self.samples = 0
+        self.python_stacks: Counter = Counter()
+        self.torch_ops_us: Counter = Counter()
+        self.torch_op_calls: Counter = Counter()
+        self.torch_skipped = 0
+        self.finished_reason: Optional[str] = None
+        self.lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_reason is not None
+
+    def add_sample(self, stacks: List[str]) -> None:
+        with self.lock:
+            self.samples += 1
+            self.python_stacks.update(stacks)
+
+    def add_torch_ops(self, scope: str, key_averages: Any) -> None:
+        with self.lock:
+            for event in key_averages:
+                self.torch_ops_us[f"{scope};{event.key}"] += int(event.self_cpu_time_total)
+                self.torch_op_calls[f"{scope};{event.key}"] += event.count
+
+    def folded(self, kind: str) -> str:
+        """Folded stacks: python in samples, torch in microseconds of self CPU time."""
+        with self.lock:
+            counts = self.python_stacks if kind == "python" else self.torch_ops_us
+            return "".join(f"{stack} {value}\n" for stack, value in counts.most_common() if value > 0)
+
+    def summary(self, top: int = 20) -> Dict[str, Any]:
+        with self.lock:
+            latencies = sorted(self.latencies_ms)
+            self_frames: Counter = Counter()
+            for stack, count in self.python_stacks.items():
+                self_frames[stack.rsplit(";", 1)[-1]] += count
+            return {
+                "id": self.id,
+                "endpoint": self.endpoint,
+                "status": "finished" if self.finished else "running",
+                "finished_reason": self.finished_reason,
+                "max_requests": self.max_requests,
+                "seconds": self.seconds,
+                "started_at": self.started_at,
+                "requests_profiled": self.requests_started,
+                "requests_completed": self.requests_completed,
+                "latency_ms": {
+                    "p50": round(latencies[len(latencies) // 2], 2) if latencies else None,
+                    "p99": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 2) if latencies else None,
+                    "max": round(latencies[-1], 2) if latencies else None,
+                },
+                "sample_interval_ms": self.sample_interval * 1000,
+                "samples": self.samples,
+                "top_python_frames": [{"frame": frame, "samples": count} for frame, count in self_frames.most_common(top)],
+                "torch_ops": [
+                    {"op": op, "self_cpu_ms": round(us / 1000, 3), "calls": self.torch_op_calls[op]}
+                    for op, us in self.torch_ops_us.most_common(top)
+                ],
+                "torch_scopes_skipped": self.torch_skipped,
+            }
+
+
+_current_session: contextvars.ContextVar[Optional[ProfileSession]] = contextvars.ContextVar("vitafit_profile_session", default=None)
+
+
+class RequestProfiler:
+    def __init__(self):
+        self.active: Optional[ProfileSession] = None
+        self.last: Optional[ProfileSession] = None
+        self._sampler: Optional[threading.Thread] = None
+        # torch.profiler supports one profile per process at a time.
+        self._torch_lock = threading.Lock()
+
+    def start(self, endpoint: str, max_requests: Optional[int], seconds: float, sample_interval_ms: Optional[float] = None, torch_ops: bool = True) -> ProfileSession:
+        if self.active is not None and not self.active.finished:
+            raise RuntimeError(f"Profile {self.active.id} is still running.")
+        session = ProfileSession(endpoint, max_requests, min(seconds, PROFILE_MAX_SECONDS), sample_interval_ms or PROFILE_SAMPLE_INTERVAL_MS, torch_ops)
+        self.active = self.last = session
+        self._sampler = threading.Thread(target=self._sample_loop, args=(session,), name="vitafit-profiler", daemon=True)
+        self._sampler.start()
+        return session
+
+    def stop(self, reason: str = "stopped") -> Optional[ProfileSession]:
+        session = self.active
+        if session is not None:
+            self._finish(session, reason)
+        return self.last
+
+    def _finish(self, session: ProfileSession, reason: str) -> None:
+        if session.finished_reason is None:
+            session.finished_reason = reason
+        if self.active is session:
+            self.active = None
+
+    def claim(self, path: str) -> Optional[ProfileSession]:
+        """The active session if this request is one it should profile."""
+        session = self.active
+        if session is None or path != session.endpoint:
+            return None
+        if time.monotonic() >= session.deadline:
+            self._finish(session, "time_limit")
+            return None
+        if session.max_requests is not None and session.requests_started >= session.max_requests:
+            return None
+        with session.lock:
+            session.requests_started += 1
+            session.in_flight += 1
+        return session
+
+    def release(self, session: ProfileSession, elapsed_ms: float) -> None:
+        with session.lock:
+            session.in_flight -= 1
+            session.requests_completed += 1
+            session.latencies_ms.append(elapsed_ms)
+        if session.max_requests is not None and session.requests_completed >= session.max_requests:
+            self._finish(session, "request_limit")
+
+    def _sample_loop(self, session: ProfileSession) -> None:
+        own_id = threading.get_ident()
+        names = {}
+        while not session.finished:
+            if time.monotonic() >= session.deadline:
+                self._finish(session, "time_limit")
+                break
+            if session.in_flight > 0:
+                if len(names) != threading.active_count():
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stacks = []
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    code = frame.f_code
+                    if (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+                        continue
+                    labels = []
+                    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+                        labels.append(_frame_label(frame.f_code))
+                        frame = frame.f_back
+                    labels.append(names.get(thread_id, f"thread-{thread_id}"))
+                    stacks.append(";".join(reversed(labels)))
+                session.add_sample(stacks)
+            time.sleep(session.sample_interval)
+
+
+profiler = RequestProfiler()
+
+
+@contextmanager
+def op_profile(scope: str) -> Iterator[None]:
+    """Records torch operator timings of the block when it runs for a profiled request."""
+    session = _current_session.get()
+    if session is None or not session.torch_ops or session.finished:
+        yield
+        return
+    if not profiler._torch_lock.acquire(blocking=False):
+        # Another profiled request is inside a torch scope right now.
+        with session.lock:
+            session.torch_skipped += 1
+        yield
+        return
+    try:
+        from torch.profiler import ProfilerActivity, profile
+        with profile(activities=[ProfilerActivity.CPU]) as torch_profile:
+            yield
+        session.add_torch_ops(scope, torch_profile.key_averages())
+    finally:
+        profiler._torch_lock.release()
+
+
+class ProfilingMiddleware:
+    """Marks requests the active profile covers; plain ASGI like RequestLatencyMiddleware."""
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if profiler.active is None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        session = profiler.claim(scope["path"])
+        if session is None:
+            await self.app(scope, receive, send)
+            return
+        token = _current_session.set(session)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_session.reset(token)
+            profiler.release(session, (time.perf_counter() - start) * 1000)
@@ -0,0 +1,304 @@
+# backend/utils/scheduler.py
+"""
+Admission control between cheap and expensive endpoints, per worker process.
+
+Every request of an endpoint class ("tabular", "vision", "llm", "reports") has to
+hold a slot while it works. A class may not exceed its own concurrency limit, and all
+classes together may not exceed SCHEDULER_MAX_CONCURRENCY. When slots run out, requests queue
+per class. Freed slots go to the queued request with the smallest weighted-fair-queuing
+finish tag, so a burst of chat traffic cannot starve the tabular endpoints.
+Requests that would overflow a queue, or wait longer than the class timeout, are shed
+with 503. Client addresses that exceed their token-bucket rate get 429. Both are off
+unless configured (see config/settings.py).
+
+Work started inside background_scope() is speculative. It is only admitted while its
+class has nothing queued, and it is preempted through its cancellation token as soon
+as an interactive request has to queue behind it, unless it has been promoted
+because a user is now waiting for it.
+"""
+import time
+import math
+import asyncio
+import contextvars
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, Iterator, Optional, Tuple, Union
+
+from fastapi import HTTPException
+
+from config.settings import (
+    SCHEDULER_ENABLED,
+    SCHEDULER_MAX_CONCURRENCY,
+    SCHEDULER_CLASS_LIMITS,
+    SCHEDULER_CLASS_WEIGHTS,
+    SCHEDULER_MAX_QUEUE,
+    SCHEDULER_QUEUE_TIMEOUT_SECONDS,
+    SCHEDULER_CLIENT_RATE,
+    SCHEDULER_CLIENT_BURST
+)
+from utils.cancellation import CancellationToken
+from utils.lru_cache import LRUCache
+from utils.observability import SCHEDULER_DECISIONS, SCHEDULER_IN_FLIGHT, SCHEDULER_QUEUE_DEPTH, SCHEDULER_QUEUE_WAIT
+
+ENDPOINT_CLASSES = ("tabular", "vision", "llm", "reports")
+# Token buckets are kept for this many (class, client) pairs; idle ones are evicted first.
+MAX_TRACKED_CLIENTS = 10000
+
+
+class ClassPolicy:
+    def __init__(self, limit: int, weight: float, max_queue: int, queue_timeout: float, rate: float, burst: float):
+        self.limit = limit
+        self.weight = weight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rate = rate
+        self.burst = burst
+
+    @classmethod
+    def from_settings(cls, endpoint_class: str) -> "ClassPolicy":
+        return cls(
+            limit=int(SCHEDULER_CLASS_LIMITS.get(endpoint_class, 1)),
+            weight=SCHEDULER_CLASS_WEIGHTS.get(endpoint_class, 1.0),
+            max_queue=int(SCHEDULER_MAX_QUEUE.get(endpoint_class, 0)),
+            queue_timeout=SCHEDULER_QUEUE_TIMEOUT_SECONDS.get(endpoint_class, 0.0),
+            rate=SCHEDULER_CLIENT_RATE.get(endpoint_class, 0.0),
+            burst=SCHEDULER_CLIENT_BURST.get(endpoint_class, 1.0),
+        )
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Takes one token; returns 0 on success, otherwise seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class _Waiter:
+    def __init__(self, finish_tag: float, future: "asyncio.Future[None]"):
+        self.finish_tag = finish_tag
+        self.future = future
+
+
+class BackgroundTicket:
+    """Marks work as background; promote() gives it normal priority from then on."""
+    def __init__(self, token: CancellationToken):
+        self.token = token  # cancelled with reason "preempted" to make the work yield
+        self.promoted = False
+        self._on_promote: Optional[Callable[[], None]] = None
+
+    def promote(self) -> None:
+        if self.promoted:
+            return
+        self.promoted = True
+        if self._on_promote is not None:
+            self._on_promote()
+
+
+_current_ticket: contextvars.ContextVar[Optional[BackgroundTicket]] = contextvars.ContextVar("vitafit_background_ticket", default=None)
+
+
+@contextmanager
+def background_scope(ticket: BackgroundTicket) -> Iterator[BackgroundTicket]:
+    """Slots taken from this context are background slots while `ticket` is not promoted."""
+    ctx_token = _current_ticket.set(ticket)
+    try:
+        yield ticket
+    finally:
+        _current_ticket.reset(ctx_token)
+
+
+class FairScheduler:
+    """Per-class concurrency limits, weighted fair queuing and per-client rate limits."""
+    def __init__(self, policies: Dict[str, ClassPolicy], max_concurrency: int):
+        self.policies = policies
+        self.max_concurrency = max_concurrency
+        self.in_flight: Dict[str, int] = {name: 0 for name in policies}
+        self.total_in_flight = 0
+        self._queues: Dict[str, Deque[_Waiter]] = {name: deque() for name in policies}
+        self._last_finish: Dict[str, float] = {name: 0.0 for name in policies}
+        self._virtual_time = 0.0
+        self._buckets = LRUCache(MAX_TRACKED_CLIENTS)
+        self._background_queue: Deque[Tuple[str, BackgroundTicket, "asyncio.Future[bool]"]] = deque()
+        self._background_running: Dict[BackgroundTicket, str] = {}
+
+    def _has_capacity(self, endpoint_class: str) -> bool:
+        return self.total_in_flight < self.max_concurrency and self.in_flight[endpoint_class] < self.policies[endpoint_class].limit
+
+    def _start(self, endpoint_class: str) -> None:
+        self.in_flight[endpoint_class] += 1
+        self.total_in_flight += 1
+        SCHEDULER_IN_FLIGHT.labels(endpoint_class).inc()
+
+    def _release(self, endpoint_class: str) -> None:
+        self.in_flight[endpoint_class] -= 1
+        self.total_in_flight -= 1
+        SCHEDULER_IN_FLIGHT.labels(endpoint_class).dec()
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hands freed slots to queued requests, smallest finish tag first among classes under their limit."""
+        while self.total_in_flight < self.max_concurrency:
+            candidates = [name for name, queue in self._queues.items() if queue and self._has_capacity(name)]
+            if not candidates:
+                break
+            endpoint_class = min(candidates, key=lambda name: self._queues[name][0].finish_tag)
+            waiter = self._queues[endpoint_class].popleft()
+            SCHEDULER_QUEUE_DEPTH.labels(endpoint_class).dec()
+            self._virtual_time = max(self._virtual_time, waiter.finish_tag)
+            self._start(endpoint_class)
+            waiter.future.set_result(None)
+
+        # Background work gets what interactive requests leave over, in arrival order.
+        while self._background_queue:
+            endpoint_class, ticket, future = self._background_queue[0]
+            if self._queues[endpoint_class] or not self._has_capacity(endpoint_class):
+                return
+            self._background_queue.popleft()
+            self._start(endpoint_class)
+            self._background_running[ticket] = endpoint_class
+            future.set_result(True)
+
+    def _preempt(self, endpoint_class: str) -> None:
+        """Asks running background work that holds the slots `endpoint_class` needs to stop."""
+        total_full = self.total_in_flight >= self.max_concurrency
+        for ticket, running_class in self._background_running.items():
+            if (running_class == endpoint_class or total_full) and not ticket.promoted and not ticket.token.cancelled:
+                ticket.token.cancel("preempted")
+                SCHEDULER_DECISIONS.labels(running_class, "preempted").inc()
+
+    def _check_rate(self, endpoint_class: str, client_key: Optional[str]) -> None:
+        policy = self.policies[endpoint_class]
+        if policy.rate <= 0 or not client_key:
+            return
+        key = (endpoint_class, client_key)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(policy.rate, policy.burst)
+        self._buckets.put(key, bucket)
+        retry_after = bucket.take()
+        if retry_after > 0:
+            SCHEDULER_DECISIONS.labels(endpoint_class, "rate_limited").inc()
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests from this client. Please slow down.",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+
+    async def _acquire(self, endpoint_class: str) -> None:
+        policy = self.policies[endpoint_class]
+        queue = self._queues[endpoint_class]
+        if not queue and self._has_capacity(endpoint_class):
+            self._start(endpoint_class)
+            SCHEDULER_DECISIONS.labels(endpoint_class, "admitted").inc()
+            return
+
+        self._preempt(endpoint_class)
+        if policy.max_queue and len(queue) >= policy.max_queue:
+            SCHEDULER_DECISIONS.labels(endpoint_class, "shed_queue_full").inc()
+            raise HTTPException(status_code=503, detail="Server is busy. Please try again shortly.", headers={"Retry-After": "1"})
+
+        finish_tag = max(self._virtual_time, self._last_finish[endpoint_class]) + 1.0 / policy.weight
+        self._last_finish[endpoint_class] = finish_tag
+        waiter = _Waiter(finish_tag, asyncio.get_running_loop().create_future())
+        queue.append(waiter)
+        SCHEDULER_QUEUE_DEPTH.labels(endpoint_class).inc()
+        SCHEDULER_DECISIONS.labels(endpoint_class, "queued").inc()
+
+        queued_at = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=policy.queue_timeout or None)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done():
+                # The slot was handed over just as the wait ended; give it back.
+                self._release(endpoint_class)
+            else:
+                waiter.future.cancel()
+                queue.remove(waiter)
+                SCHEDULER_QUEUE_DEPTH.labels(endpoint_class).dec()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            SCHEDULER_DECISIONS.labels(endpoint_class, "shed_timeout").inc()
+            raise HTTPException(status_code=503, detail="Server is busy. Please try again shortly.", headers={"Retry-After": "1"})
+        SCHEDULER_QUEUE_WAIT.labels(endpoint_class).observe(time.perf_counter() - queued_at)
+        SCHEDULER_DECISIONS.labels(endpoint_class, "admitted").inc()
+
+    async def _acquire_background(self, endpoint_class: str, ticket: BackgroundTicket) -> bool:
+        """Waits for a background slot: True once held, False if the ticket was promoted first."""
+        if not self._background_queue and not self._queues[endpoint_class] and self._has_capacity(endpoint_class):
+            self._start(endpoint_class)
+            self._background_running[ticket] = endpoint_class
+            SCHEDULER_DECISIONS.labels(endpoint_class, "background_admitted").inc()
+            return True
+
+        future: "asyncio.Future[bool]" = asyncio.get_running_loop().create_future()
+        entry = (endpoint_class, ticket, future)
+        self._background_queue.append(entry)
+
+        def promoted() -> None:
+            if not future.done():
+                self._background_queue.remove(entry)
+                future.set_result(False)
+        ticket._on_promote = promoted
+        try:
+            admitted = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if future.done():
+                if future.result():
+                    del self._background_running[ticket]
+                    self._release(endpoint_class)
+            else:
+                future.cancel()
+                self._background_queue.remove(entry)
+            raise
+        finally:
+            ticket._on_promote = None
+        if admitted:
+            SCHEDULER_DECISIONS.labels(endpoint_class, "background_admitted").inc()
+        return admitted
+
+    @asynccontextmanager
+    async def slot(self, endpoint_class: str, client_key: Optional[str] = None) -> AsyncIterator[None]:
+        """Holds an admission slot of `endpoint_class` for the duration of the block; `client_key` (the client address) is rate limited."""
+        ticket = _current_ticket.get()
+        if ticket is not None and not ticket.promoted and await self._acquire_background(endpoint_class, ticket):
+            try:
+                yield
+            finally:
+                del self._background_running[ticket]
+                self._release(endpoint_class)
+            return
+
+        if ticket is None:
+            self._check_rate(endpoint_class, client_key)
+        await self._acquire(endpoint_class)
+        try:
+            yield
+        finally:
+            self._release(endpoint_class)
+
+
+class _Unscheduled:
+    """Stand-in used when SCHEDULER_ENABLED is false."""
+    @asynccontextmanager
+    async def slot(self, endpoint_class: str, client_key: Optional[str] = None) -> AsyncIterator[None]:
+        yield
+
+
+def build_scheduler() -> Union[FairScheduler, _Unscheduled]:
+    if not SCHEDULER_ENABLED:
+        return _Unscheduled()
+    return FairScheduler({name: ClassPolicy.from_settings(name) for name in ENDPOINT_CLASSES}, SCHEDULER_MAX_CONCURRENCY)
+
+
+scheduler = build_scheduler()
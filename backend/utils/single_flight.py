@@ -0,0 +1,94 @@
+# backend/utils/single_flight.py
+"""
+Request coalescing, per worker process: identical requests that arrive while one
+is already being computed wait for that computation and get its result (or its
+exception) instead of starting their own.
+
+The shared computation runs in its own task under its own cancellation token, so
+one waiter disconnecting or hitting its deadline does not stop it for the others.
+That waiter alone gets GenerationCancelled; the computation is cancelled when the
+last waiter is gone. Nothing is cached: a request arriving after the computation
+finished starts a new one.
+
+A computation started with background=True takes background scheduler slots (see
+utils/scheduler.py) until an interactive call joins it, which promotes it to normal
+priority. One that has been preempted is not joined; a fresh computation is started.
+"""
+import asyncio
+from contextlib import ExitStack
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from config.settings import SINGLE_FLIGHT_ENABLED
+from utils.cancellation import DISCONNECT_POLL_INTERVAL, CancellationToken, GenerationCancelled, cancellation_scope, current_cancellation
+from utils.observability import SINGLE_FLIGHT_REQUESTS
+from utils.scheduler import BackgroundTicket, background_scope
+
+T = TypeVar("T")
+
+
+class _Flight:
+    def __init__(self):
+        self.token = CancellationToken()
+        self.waiters = 0
+        self.task: Optional["asyncio.Task[Any]"] = None
+        self.ticket: Optional[BackgroundTicket] = None
+
+
+class SingleFlight:
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self._flights: Dict[str, _Flight] = {}
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def _run(self, key: str, flight: _Flight, compute: Callable[[], Awaitable[T]]) -> T:
+        try:
+            with ExitStack() as scopes:
+                scopes.enter_context(cancellation_scope(flight.token))
+                if flight.ticket is not None:
+                    scopes.enter_context(background_scope(flight.ticket))
+                return await compute()
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    async def do(self, key: str, compute: Callable[[], Awaitable[T]], background: bool = False) -> T:
+        """compute()'s result, shared with every concurrent call for the same key."""
+        if not SINGLE_FLIGHT_ENABLED and not background:
+            return await compute()
+
+        flight = self._flights.get(key)
+        if flight is None or flight.token.cancelled:
+            flight = _Flight()
+            if background:
+                flight.ticket = BackgroundTicket(flight.token)
+            flight.task = asyncio.create_task(self._run(key, flight, compute))
+            # Abandoned flights finish unobserved; retrieve their exception so it is not logged as lost.
+            flight.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+            self._flights[key] = flight
+            SINGLE_FLIGHT_REQUESTS.labels(self.endpoint, "computed").inc()
+        else:
+            SINGLE_FLIGHT_REQUESTS.labels(self.endpoint, "coalesced").inc()
+            if not background and flight.ticket is not None:
+                flight.ticket.promote()
+
+        waiter_token = current_cancellation()
+        flight.waiters += 1
+        try:
+            while not flight.task.done():
+                if waiter_token is None:
+                    await asyncio.shield(flight.task)
+                    break
+                if waiter_token.cancelled:
+                    raise GenerationCancelled(waiter_token.reason)  # type: ignore[arg-type]
+                await asyncio.wait({flight.task}, timeout=DISCONNECT_POLL_INTERVAL)
+            return flight.task.result()
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Nobody is left to answer: stop generation threads and let new requests start afresh.
+                flight.token.cancel("disconnect")
+                flight.task.cancel()
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
@@ -0,0 +1,141 @@
+# backend/utils/thread_budget.py
+"""
+Per-workload native thread budgets, per worker process.
+
+Torch, the BLAS/OpenMP pools behind numpy and scikit-learn, and joblib each size
+their thread pools to every core by default. An LLM generation, a YOLO inference and
+a forest prediction running at once then run several times more busy threads than
+there are cores, and all of them slow down. Budgets come from THREAD_BUDGETS and
+THREAD_AFFINITY in config/settings.py:
+
+  - thread_budget(workload) wraps the place each workload runs. Torch intra-op
+    threads are a per-thread setting, so it sets them (and the optional core
+    affinity) on the calling thread for the duration of the block.
+  - apply_process_thread_budgets() sets what is process-wide: torch inter-op
+    threads, the default intra-op threads for threads that start later, and the
+    BLAS/OpenMP pools. startup_all and the inference server call it first thing.
+  - init_worker_thread_budget(workload) is the initializer of worker process pools.
+
+Torch is never imported here for a process that has not imported it already.
+"""
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional, Set
+
+from config.settings import BLAS_THREADS, THREAD_AFFINITY, THREAD_BUDGETS, THREAD_BUDGETS_ENABLED, TORCH_INTEROP_THREADS
+
+_ENV_THREAD_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+# Cores the process started with; workloads without an affinity of their own run on these.
+_PROCESS_CPUS: Optional[Set[int]] = set(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else None
+
+_torch_configured = False
+_torch_lock = threading.Lock()
+_blas_limits: Any = None
+
+
+def budget_for(workload: str) -> int:
+    return THREAD_BUDGETS.get(workload, 1)
+
+
+def _configure_torch(torch: Any) -> None:
+    """Inter-op threads and the default intra-op threads, once per process."""
+    global _torch_configured
+    with _torch_lock:
+        if _torch_configured:
+            return
+        _torch_configured = True
+        try:
+            torch.set_num_interop_threads(TORCH_INTEROP_THREADS)
+        except RuntimeError as e:
+            # Only possible before torch has run any inter-op work.
+            print(f"Torch inter-op threads left at {torch.get_num_interop_threads()}: {e}")
+        # Threads started from now on inherit this; unbudgeted work (loading, warm-up)
+        # gets as many threads as the largest workload.
+        torch.set_num_threads(max(THREAD_BUDGETS.values(), default=1))
+
+
+def _set_affinity(cpus: Optional[Set[int]]) -> None:
+    if cpus and hasattr(os, "sched_setaffinity"):
+        # pid 0 is the calling thread on Linux, not the whole process.
+        os.sched_setaffinity(0, cpus)
+
+
+@contextmanager
+def thread_budget(workload: str) -> Iterator[None]:
+    """Runs the block on the calling thread with the workload's intra-op threads and cores."""
+    if not THREAD_BUDGETS_ENABLED:
+        yield
+        return
+    torch = sys.modules.get("torch")
+    previous_threads = None
+    if torch is not None:
+        if not _torch_configured:
+            _configure_torch(torch)
+        threads = budget_for(workload)
+        previous_threads = torch.get_num_threads()
+        if previous_threads != threads:
+            torch.set_num_threads(threads)
+        else:
+            previous_threads = None
+    pinned = bool(THREAD_AFFINITY)
+    if pinned:
+        _set_affinity(THREAD_AFFINITY.get(workload) or _PROCESS_CPUS)
+    try:
+        yield
+    finally:
+        if previous_threads is not None:
+            torch.set_num_threads(previous_threads)
+        if pinned:
+            _set_affinity(_PROCESS_CPUS)
+
+
+def limit_estimator_jobs(model: Any) -> Any:
+    """Caps the joblib workers of a scikit-learn model (and its sub-estimators) at the tabular budget."""
+    if THREAD_BUDGETS_ENABLED:
+        jobs = budget_for("tabular")
+        for estimator in [model, getattr(model, "estimator", None)] + list(getattr(model, "estimators_", [])):
+            n_jobs = getattr(estimator, "n_jobs", None)
+            if n_jobs is not None and (n_jobs < 0 or n_jobs > jobs):
+                estimator.n_jobs = jobs
+    return model
+
+
+def apply_process_thread_budgets() -> None:
+    """Sets the process-wide limits; call before any model runs."""
+    global _blas_limits
+    if not THREAD_BUDGETS_ENABLED:
+        return
+    for name in _ENV_THREAD_VARS:
+        # For libraries that have not started their pools yet, and for child processes.
+        os.environ.setdefault(name, str(BLAS_THREADS))
+    try:
+        from threadpoolctl import threadpool_limits
+        # Kept referenced: the limits hold until the object is garbage collected or restored.
+        # OpenMP is left to torch, whose intra-op threads are set per workload.
+        _blas_limits = threadpool_limits(limits=BLAS_THREADS, user_api="blas")
+    except ImportError:
+        pass
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        _configure_torch(torch)
+    budgets = ", ".join(f"{name}={threads}" for name, threads in sorted(THREAD_BUDGETS.items()))
+    print(f"Thread budgets: {budgets}; BLAS threads={BLAS_THREADS}, torch inter-op threads={TORCH_INTEROP_THREADS}"
+          + (f"; affinity {', '.join(sorted(THREAD_AFFINITY))}" if THREAD_AFFINITY else ""))
+
+
+def init_worker_thread_budget(workload: str) -> None:
+    """ProcessPoolExecutor initializer: the whole worker process gets the workload's budget."""
+    global _blas_limits
+    if not THREAD_BUDGETS_ENABLED:
+        return
+    threads = str(budget_for(workload))
+    for name in _ENV_THREAD_VARS:
+        os.environ[name] = threads
+    _set_affinity(THREAD_AFFINITY.get(workload))
+    try:
+        from threadpoolctl import threadpool_limits
+        _blas_limits = threadpool_limits(limits=budget_for(workload))
+    except ImportError:
+        pass